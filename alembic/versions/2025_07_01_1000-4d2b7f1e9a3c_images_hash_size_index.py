@@ -0,0 +1,42 @@
+"""images hash size index.
+
+Revision ID: 4d2b7f1e9a3c
+Revises: b650b4f82958
+Create Date: 2025-07-01 10:00:12.381204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "4d2b7f1e9a3c"
+down_revision: Union[str, None] = "b650b4f82958"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Concurrent uploads could have stored the same content twice, keep the oldest row
+    op.execute(
+        sa.text(
+            """
+            DELETE FROM images a
+            USING images b
+            WHERE a.hash IS NOT NULL
+              AND a.hash = b.hash
+              AND a.size = b.size
+              AND (a.created_at, a.id) > (b.created_at, b.id)
+            """
+        )
+    )
+    op.create_index("ix_images_hash_size", "images", ["hash", "size"], unique=True)
+    op.create_index(op.f("ix_images_original_url"), "images", ["original_url"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_images_original_url"), table_name="images")
+    op.drop_index("ix_images_hash_size", table_name="images")
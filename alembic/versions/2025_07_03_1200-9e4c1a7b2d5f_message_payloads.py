@@ -0,0 +1,40 @@
+"""message payloads.
+
+Revision ID: 9e4c1a7b2d5f
+Revises: 4d2b7f1e9a3c
+Create Date: 2025-07-03 12:00:41.902113
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9e4c1a7b2d5f"
+down_revision: Union[str, None] = "4d2b7f1e9a3c"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "message_payloads",
+        sa.Column("message_id", sa.String(), nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.Column("size", sa.Integer(), nullable=False),
+        sa.Column("id", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["message_id"], ["messages.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_message_payloads_id"), "message_payloads", ["id"], unique=True)
+    op.create_index(op.f("ix_message_payloads_message_id"), "message_payloads", ["message_id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_message_payloads_message_id"), table_name="message_payloads")
+    op.drop_index(op.f("ix_message_payloads_id"), table_name="message_payloads")
+    op.drop_table("message_payloads")
@@ -0,0 +1,42 @@
+"""chat summaries.
+
+Revision ID: 2b8f3c6d1e0a
+Revises: 9e4c1a7b2d5f
+Create Date: 2025-07-07 09:00:27.511840
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "2b8f3c6d1e0a"
+down_revision: Union[str, None] = "9e4c1a7b2d5f"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "chat_summaries",
+        sa.Column("chat_id", sa.String(), nullable=False),
+        sa.Column("text", sa.Text(), nullable=False),
+        sa.Column("model", sa.String(), nullable=False),
+        sa.Column("covered_until", sa.DateTime(), nullable=False),
+        sa.Column("id", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["chat_id"], ["chats.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_chat_summaries_id"), "chat_summaries", ["id"], unique=True)
+    op.create_index(op.f("ix_chat_summaries_chat_id"), "chat_summaries", ["chat_id"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_chat_summaries_chat_id"), table_name="chat_summaries")
+    op.drop_index(op.f("ix_chat_summaries_id"), table_name="chat_summaries")
+    op.drop_table("chat_summaries")
@@ -0,0 +1,46 @@
+"""turn jobs.
+
+Revision ID: 6a1d9f3e4b7c
+Revises: 2b8f3c6d1e0a
+Create Date: 2025-07-10 10:00:12.402913
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "6a1d9f3e4b7c"
+down_revision: Union[str, None] = "2b8f3c6d1e0a"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "turn_jobs",
+        sa.Column("chat_id", sa.String(), nullable=False),
+        sa.Column("user_id", sa.String(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("worker_id", sa.String(), nullable=False),
+        sa.Column("id", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["chat_id"], ["chats.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_turn_jobs_id"), "turn_jobs", ["id"], unique=True)
+    op.create_index(op.f("ix_turn_jobs_chat_id"), "turn_jobs", ["chat_id"], unique=False)
+    op.create_index(op.f("ix_turn_jobs_status"), "turn_jobs", ["status"], unique=False)
+    op.create_index(op.f("ix_turn_jobs_user_id"), "turn_jobs", ["user_id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_turn_jobs_user_id"), table_name="turn_jobs")
+    op.drop_index(op.f("ix_turn_jobs_status"), table_name="turn_jobs")
+    op.drop_index(op.f("ix_turn_jobs_chat_id"), table_name="turn_jobs")
+    op.drop_index(op.f("ix_turn_jobs_id"), table_name="turn_jobs")
+    op.drop_table("turn_jobs")
@@ -0,0 +1,39 @@
+"""message usage.
+
+Revision ID: 8c3e5a2f7d91
+Revises: 6a1d9f3e4b7c
+Create Date: 2025-07-14 10:00:41.918204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8c3e5a2f7d91"
+down_revision: Union[str, None] = "6a1d9f3e4b7c"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("messages", sa.Column("prompt_tokens", sa.Integer(), nullable=True))
+    op.add_column("messages", sa.Column("completion_tokens", sa.Integer(), nullable=True))
+    op.add_column("messages", sa.Column("cache_read_tokens", sa.Integer(), nullable=True))
+    op.add_column("messages", sa.Column("cache_write_tokens", sa.Integer(), nullable=True))
+    op.add_column("messages", sa.Column("ttft_ms", sa.Integer(), nullable=True))
+    op.add_column("messages", sa.Column("latency_ms", sa.Integer(), nullable=True))
+    op.create_index(op.f("ix_messages_agent_id"), "messages", ["agent_id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_messages_agent_id"), table_name="messages")
+    op.drop_column("messages", "latency_ms")
+    op.drop_column("messages", "ttft_ms")
+    op.drop_column("messages", "cache_write_tokens")
+    op.drop_column("messages", "cache_read_tokens")
+    op.drop_column("messages", "completion_tokens")
+    op.drop_column("messages", "prompt_tokens")
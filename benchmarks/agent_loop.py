@@ -0,0 +1,139 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from openai.types.chat import ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+
+import src.messages.service as message_service
+from src.database import Message
+from src.database.id import generate_shortid
+from src.llm_clients import TextChunkData
+from src.messages.repository import MessageRepository
+from src.messages.schemas import MessageCreate
+from src.messages.schemas import ToolCallData
+from src.messages.schemas import ToolCallResult
+from src.messages.service import MessageService
+from src.messages.types import MessageSource
+from src.settings import settings
+
+
+class FakeSession:
+    async def commit(self) -> None:
+        pass
+
+
+class FakeRepository:
+    def __init__(self) -> None:
+        self.session = FakeSession()
+
+    @staticmethod
+    def create_message(source: MessageSource, content: list[dict]) -> Message:
+        return Message(
+            id=generate_shortid(),
+            chat_id="chat",
+            agent_id="agent",
+            model="model",
+            source=source,
+            content=content,
+            user_id="user",
+            created_at=datetime.now(),
+        )
+
+    async def create_llm_message(self, creation_data: MessageCreate, tool_calls: list[ToolCallData], **_) -> Message:
+        content = MessageRepository.format_llm_message(text=creation_data.data.text, tool_calls=tool_calls)
+        return self.create_message(MessageSource.llm, [content])
+
+    async def create_tool_message(self, tool_call_id: str, tool_call_result: str, tool_call_logs: list, **_) -> Message:
+        content = MessageRepository.format_tool_message(
+            tool_call_id=tool_call_id, tool_call_result=tool_call_result, tool_call_logs=tool_call_logs
+        )
+        return self.create_message(MessageSource.tool, [content])
+
+
+class FakeToolManager:
+    tools = [dict(type="function", function=dict(name="lookup", description="Lookup", parameters={}))]
+    tools_json = json.dumps(tools)
+
+    @staticmethod
+    def format_tool_call(tool_call: ChatCompletionMessageToolCall) -> ToolCallData:
+        return ToolCallData(
+            tool_call_id=tool_call.id, server_id=1, server_logo=None, tool_name="lookup", arguments=None
+        )
+
+    @staticmethod
+    def rename_tool_calls(tool_calls: list[ToolCallData]) -> list[ToolCallData]:
+        return tool_calls
+
+    @staticmethod
+    async def handle_tool_call(tool_call: ChatCompletionMessageToolCall, channel) -> None:
+        result = ToolCallResult(tool_call_id=tool_call.id, server_id=1, tool_name="lookup", result="ok", success=True)
+        await channel.put(result)
+
+
+class FakeDispatcher:
+    def __init__(self, rounds: int, chunks: int) -> None:
+        self.rounds = rounds
+        self.chunks = chunks
+        self.calls = 0
+
+    async def stream(self, **_):
+        self.calls += 1
+        return self.generate(self.calls)
+
+    async def generate(self, call: int):
+        for _ in range(self.chunks):
+            yield TextChunkData(content="token ")
+        if call <= self.rounds:
+            function = Function(name="lookup", arguments="{}")
+            yield [ChatCompletionMessageToolCall(id=f"call_{call}", type="function", function=function)]
+
+
+async def run(rounds: int, chunks: int) -> dict:
+    message_service.llm_dispatcher = FakeDispatcher(rounds, chunks)
+    settings.AGENT_MAX_ITERATIONS = rounds + 1
+    service = MessageService(
+        repo=FakeRepository(), chat_repo=None, agent_repo=None, server_repo=None, registry_client=None
+    )
+    agent = SimpleNamespace(id="agent", provider="OpenRouter", model="model", system_prompt="You are a benchmark")
+    user_message = FakeRepository.create_message(MessageSource.user, [dict(role="user", content="Hi")])
+    round_timings: list[list[float]] = [[]]
+    last_event_at = time.perf_counter()
+    async for event in service.run_turn(
+        agent=agent,
+        chat_id="chat",
+        current_user_id="user",
+        previous_messages=[user_message],
+        tool_manager=FakeToolManager(),
+    ):
+        now = time.perf_counter()
+        if '"event_type":"text_chunk"' in event:
+            round_timings[-1].append(now - last_event_at)
+        elif '"event_type":"tool_call_result"' in event:
+            round_timings.append([])
+        last_event_at = now
+    per_chunk = [statistics.mean(timings) * 1e6 for timings in round_timings if timings]
+    return dict(
+        tool_rounds=rounds,
+        chunks_per_round=chunks,
+        first_round_us_per_chunk=per_chunk[0],
+        last_round_us_per_chunk=per_chunk[-1],
+        mean_us_per_chunk=statistics.mean(per_chunk),
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure per chunk overhead of the agent loop over many tool rounds")
+    parser.add_argument("--rounds", type=int, nargs="+", default=[1, 10, 25])
+    parser.add_argument("--chunks", type=int, default=500)
+    args = parser.parse_args()
+    results = [await run(rounds, args.chunks) for rounds in args.rounds]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
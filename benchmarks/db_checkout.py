@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.database.session import database_url_async
+from src.database.session import get_database_url_async
+from src.database.session import get_engine_options
+from src.types import DBPoolMode
+
+CONNECTION_COUNT_QUERY = text("SELECT count(*) FROM pg_stat_activity WHERE datname = current_database()")
+
+
+async def sample_connections(monitor: AsyncEngine, samples: list[int], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        async with monitor.connect() as connection:
+            samples.append(await connection.scalar(CONNECTION_COUNT_QUERY))
+        await asyncio.sleep(0.05)
+
+
+async def run_mode(
+    pool_mode: DBPoolMode, pool_size: int, max_overflow: int, concurrency: int, iterations: int, hold: float
+) -> dict:
+    engine = create_async_engine(
+        get_database_url_async(pool_mode), **get_engine_options(pool_mode, pool_size, max_overflow)
+    )
+    monitor = create_async_engine(database_url_async, poolclass=NullPool)
+    checkout_latencies: list[float] = []
+    connection_samples: list[int] = []
+    stop = asyncio.Event()
+
+    async def worker() -> None:
+        for _ in range(iterations):
+            started_at = time.perf_counter()
+            async with engine.connect() as connection:
+                checkout_latencies.append(time.perf_counter() - started_at)
+                await connection.execute(text("SELECT 1"))
+                await asyncio.sleep(hold)
+
+    sampler = asyncio.create_task(sample_connections(monitor, connection_samples, stop))
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started_at
+    stop.set()
+    await sampler
+    await engine.dispose()
+    await monitor.dispose()
+
+    quantiles = statistics.quantiles(checkout_latencies, n=100)
+    return dict(
+        pool_mode=pool_mode.value,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        checkouts=len(checkout_latencies),
+        checkout_p50_ms=quantiles[49] * 1000,
+        checkout_p99_ms=quantiles[98] * 1000,
+        checkouts_per_second=len(checkout_latencies) / elapsed,
+        max_server_connections=max(connection_samples, default=0),
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare DB connection checkout latency between pool modes")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--hold", type=float, default=0.005, help="Seconds each checkout is held")
+    parser.add_argument("--pgbouncer-pool-size", type=int, default=0, help="0 means NullPool")
+    args = parser.parse_args()
+
+    results = [
+        await run_mode(DBPoolMode.app, 50, 25, args.concurrency, args.iterations, args.hold),
+        await run_mode(DBPoolMode.pgbouncer, args.pgbouncer_pool_size, 5, args.concurrency, args.iterations, args.hold),
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
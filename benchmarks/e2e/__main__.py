@@ -0,0 +1,204 @@
+import argparse
+import asyncio
+import json
+import resource
+import statistics
+import time
+from datetime import datetime
+from pathlib import Path
+
+import uvicorn
+from httpx import AsyncClient
+from httpx import Timeout
+from sqlalchemy import event
+
+from .fake_llm import create_fake_llm
+from .fake_llm import load_recorded_streams
+from .stub_mcp import create_stub_mcp
+from .stub_mcp import STUB_TOOLS
+from src.agents.repository import AgentRepository
+from src.darp_servers.enums import DARPServerTransportProtocol
+from src.database import DARPServer
+from src.database.id import generate_shortid
+from src.database.session import async_engine
+from src.database.session import session_maker
+from src.main import app
+from src.messages.constants import provider_to_client
+from src.types import LLMProvider
+
+STUB_SERVER_IDS = {
+    DARPServerTransportProtocol.SSE: "990001",
+    DARPServerTransportProtocol.STREAMABLE_HTTP: "990002",
+}
+
+
+class QueryCounter:
+    def __init__(self) -> None:
+        self.queries = 0
+
+    def __call__(self, *_) -> None:
+        self.queries += 1
+
+
+def get_percentile(values: list[float], percentile: int) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[percentile - 1]
+
+
+async def start_server(server_app, port: int) -> tuple[uvicorn.Server, asyncio.Task]:
+    server = uvicorn.Server(uvicorn.Config(server_app, port=port, log_level="warning"))
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server, serve_task
+
+
+async def register_stub_servers(mcp_port: int, http_mcp_port: int) -> None:
+    urls = {
+        DARPServerTransportProtocol.SSE: f"http://127.0.0.1:{mcp_port}/sse",
+        DARPServerTransportProtocol.STREAMABLE_HTTP: f"http://127.0.0.1:{http_mcp_port}/mcp",
+    }
+    async with session_maker() as session:
+        for transport_protocol, server_id in STUB_SERVER_IDS.items():
+            server = DARPServer(
+                id=server_id,
+                name=f"stub_{transport_protocol.name.lower()}",
+                description="Benchmark stub server",
+                url=urls[transport_protocol],
+                tools=STUB_TOOLS,
+                transport_protocol=transport_protocol,
+                updated_at=datetime.now(),
+            )
+            await session.merge(server)
+        await session.commit()
+
+
+async def create_chat(client: AsyncClient, user_id: str, transport_protocol: DARPServerTransportProtocol) -> str:
+    response = await client.post(
+        "/agents/", json=dict(agent_data=dict(name="Benchmark agent"), current_user_id=user_id, server_ids=[])
+    )
+    response.raise_for_status()
+    agent_id = response.json()["id"]
+    async with session_maker() as session:
+        await AgentRepository(session).add_servers_to_agent(agent_id, [STUB_SERVER_IDS[transport_protocol]])
+        await session.commit()
+    response = await client.post("/chats/", json=dict(chat_data=dict(agent_id=agent_id), current_user_id=user_id))
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+async def run_turn(client: AsyncClient, chat_id: str, user_id: str) -> dict:
+    data = dict(current_user_id=user_id, data=dict(text="Run the benchmark tool"), routing_mode="off")
+    started_at = time.perf_counter()
+    first_token_at = None
+    tokens = 0
+    failed = False
+    async with client.stream("POST", f"/chats/{chat_id}/messages", json=data) as response:
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            event_type = json.loads(line.removeprefix("data:"))["event_type"]
+            if event_type == "text_chunk":
+                tokens += 1
+                first_token_at = first_token_at or time.perf_counter()
+            failed = failed or event_type == "error"
+    finished_at = time.perf_counter()
+    return dict(
+        latency=finished_at - started_at,
+        ttft=(first_token_at or finished_at) - started_at,
+        tokens=tokens,
+        streaming=finished_at - (first_token_at or finished_at),
+        failed=failed or response.status_code != 200,
+    )
+
+
+async def run_scenario(
+    app_url: str, transport_protocol: DARPServerTransportProtocol, concurrency: int, turns: int
+) -> dict:
+    query_counter = QueryCounter()
+    event.listen(async_engine.sync_engine, "before_cursor_execute", query_counter)
+
+    async def worker() -> list[dict]:
+        # Every worker is its own user, per user admission limits would serialize them otherwise
+        user_id = f"benchmark-{generate_shortid()}"
+        chat_id = await create_chat(client, user_id, transport_protocol)
+        return [await run_turn(client, chat_id, user_id) for _ in range(turns)]
+
+    async with AsyncClient(base_url=app_url, timeout=Timeout(300)) as client:
+        started_at = time.perf_counter()
+        worker_results = await asyncio.gather(*(worker() for _ in range(concurrency)))
+        results = [result for turn_results in worker_results for result in turn_results]
+        elapsed = time.perf_counter() - started_at
+    event.remove(async_engine.sync_engine, "before_cursor_execute", query_counter)
+
+    latencies = [result["latency"] for result in results]
+    ttfts = [result["ttft"] for result in results]
+    streaming = sum(result["streaming"] for result in results)
+    return dict(
+        transport_protocol=transport_protocol.value,
+        concurrency=concurrency,
+        turns=len(results),
+        failed_turns=sum(result["failed"] for result in results),
+        turns_per_second=len(results) / elapsed,
+        ttft_p50_ms=get_percentile(ttfts, 50) * 1000,
+        ttft_p99_ms=get_percentile(ttfts, 99) * 1000,
+        tokens_per_second=sum(result["tokens"] for result in results) / streaming if streaming else 0,
+        turn_latency_p50_ms=get_percentile(latencies, 50) * 1000,
+        turn_latency_p99_ms=get_percentile(latencies, 99) * 1000,
+        # Includes the agent and chat creation of every worker
+        db_queries_per_turn=query_counter.queries / len(results),
+        max_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Drive the message endpoint end to end against a fake LLM and stub MCP servers, all served "
+        "from this process. Creates benchmark agents, chats and messages in the configured database."
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--turns", type=int, default=5, help="Turns per concurrent user")
+    parser.add_argument("--tokens-per-second", type=float, default=100, help="Chunk rate of the fake LLM per stream")
+    parser.add_argument("--text-tokens", type=int, default=100, help="Chunks in the final answer of a turn")
+    parser.add_argument("--recorded", type=Path, help="Directory of streams recorded by the disk LLM cache")
+    parser.add_argument("--stall", type=float, default=0, help="Seconds every fake LLM stream stalls for")
+    parser.add_argument("--stall-at", type=int, default=0, help="Chunk the stall happens before, 0 is the first byte")
+    parser.add_argument("--tool-log-lines", type=int, default=10)
+    parser.add_argument("--tool-delay", type=float, default=0.05)
+    parser.add_argument("--transport", choices=[protocol.name for protocol in STUB_SERVER_IDS], nargs="+")
+    parser.add_argument("--port", type=int, default=8770, help="First of the four ports used by the benchmark")
+    args = parser.parse_args()
+
+    recorded_streams = load_recorded_streams(args.recorded) if args.recorded else []
+    llm_port, mcp_port, http_mcp_port, app_port = range(args.port, args.port + 4)
+    stub_mcp = create_stub_mcp(args.tool_log_lines, args.tool_delay)
+    servers = [
+        await start_server(
+            create_fake_llm(recorded_streams, args.tokens_per_second, args.text_tokens, args.stall, args.stall_at),
+            llm_port,
+        ),
+        await start_server(stub_mcp.sse_app(), mcp_port),
+        await start_server(stub_mcp.streamable_http_app(), http_mcp_port),
+    ]
+    # The app talks to the fake LLM instead of OpenRouter, it is started after this so the client opens with it
+    provider_to_client[LLMProvider.openrouter].base_url = f"http://127.0.0.1:{llm_port}"
+    servers.append(await start_server(app, app_port))
+    await register_stub_servers(mcp_port, http_mcp_port)
+
+    transports = [
+        DARPServerTransportProtocol[name] for name in args.transport or [protocol.name for protocol in STUB_SERVER_IDS]
+    ]
+    results = [
+        await run_scenario(f"http://127.0.0.1:{app_port}", transport_protocol, concurrency, args.turns)
+        for transport_protocol in transports
+        for concurrency in args.concurrency
+    ]
+    for server, serve_task in reversed(servers):
+        server.should_exit = True
+        await serve_task
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
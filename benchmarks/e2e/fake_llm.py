@@ -0,0 +1,98 @@
+import asyncio
+import itertools
+import json
+import time
+from collections.abc import AsyncGenerator
+from pathlib import Path
+from typing import Any
+
+from fastapi import FastAPI
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+
+def load_recorded_streams(directory: Path) -> list[list[dict]]:
+    # Streams recorded by the disk LLM response cache, see LLM_CACHE_DIR
+    return [json.loads(path.read_text())["chunks"] for path in sorted(directory.glob("*.json"))]
+
+
+def create_chunk(delta: dict | None, finish_reason: str | None = None, usage: dict | None = None) -> dict:
+    choices = [dict(index=0, delta=delta, finish_reason=finish_reason)] if delta is not None else []
+    return dict(
+        id="fake", object="chat.completion.chunk", created=int(time.time()), model="fake", choices=choices, usage=usage
+    )
+
+
+def create_usage(completion_tokens: int) -> dict:
+    return dict(prompt_tokens=1000, completion_tokens=completion_tokens, total_tokens=1000 + completion_tokens)
+
+
+def create_text_stream(tokens: int) -> list[dict]:
+    chunks = [create_chunk(dict(role="assistant", content=""))]
+    chunks += [create_chunk(dict(content=f"token{index} ")) for index in range(tokens)]
+    chunks.append(create_chunk(dict(), finish_reason="stop"))
+    chunks.append(create_chunk(None, usage=create_usage(tokens)))
+    return chunks
+
+
+def create_tool_call_stream(tool_name: str) -> list[dict]:
+    arguments = json.dumps(dict(text="benchmark"))
+    tool_call = dict(index=0, id="call_fake", type="function", function=dict(name=tool_name, arguments=""))
+    chunks = [create_chunk(dict(role="assistant", content="Let me check. "))]
+    chunks.append(create_chunk(dict(tool_calls=[tool_call])))
+    chunks += [
+        create_chunk(dict(tool_calls=[dict(index=0, function=dict(arguments=arguments[start : start + 8]))]))
+        for start in range(0, len(arguments), 8)
+    ]
+    chunks.append(create_chunk(dict(), finish_reason="tool_calls"))
+    chunks.append(create_chunk(None, usage=create_usage(len(chunks))))
+    return chunks
+
+
+def retarget_tool_calls(chunks: list[dict], tool_name: str) -> list[dict]:
+    # Recorded calls point at real servers, the benchmark only has the stub ones
+    for chunk in chunks:
+        for choice in chunk.get("choices", []):
+            for tool_call in (choice.get("delta") or {}).get("tool_calls") or []:
+                if (tool_call.get("function") or {}).get("name"):
+                    tool_call["function"]["name"] = tool_name
+    return chunks
+
+
+async def replay(
+    chunks: list[dict], tokens_per_second: float, stall: float = 0, stall_at: int = 0
+) -> AsyncGenerator[str, Any]:
+    for index, chunk in enumerate(chunks):
+        await asyncio.sleep(1 / tokens_per_second)
+        if index == stall_at:
+            # Headers are already sent, so at 0 this is a stall before the first byte of the body
+            await asyncio.sleep(stall)
+        yield f"data: {json.dumps(chunk)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+def create_fake_llm(
+    recorded_streams: list[list[dict]],
+    tokens_per_second: float,
+    text_tokens: int,
+    stall: float = 0,
+    stall_at: int = 0,
+) -> FastAPI:
+    app = FastAPI()
+    stream_numbers = itertools.count()
+
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request) -> StreamingResponse:
+        body = await request.json()
+        tools = body.get("tools")
+        # A turn calls a tool once and then answers with text
+        if not tools or body["messages"][-1]["role"] == "tool":
+            chunks = create_text_stream(text_tokens)
+        elif recorded_streams:
+            recorded = recorded_streams[next(stream_numbers) % len(recorded_streams)]
+            chunks = retarget_tool_calls(json.loads(json.dumps(recorded)), tools[0]["function"]["name"])
+        else:
+            chunks = create_tool_call_stream(tools[0]["function"]["name"])
+        return StreamingResponse(replay(chunks, tokens_per_second, stall, stall_at), media_type="text/event-stream")
+
+    return app
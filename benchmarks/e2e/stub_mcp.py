@@ -0,0 +1,25 @@
+import asyncio
+
+from mcp.server.fastmcp import Context
+from mcp.server.fastmcp import FastMCP
+
+STUB_TOOLS = [
+    dict(
+        name="echo",
+        description="Echo the text back",
+        input_schema={"type": "object", "properties": {"text": {"type": "string"}}},
+    )
+]
+
+
+def create_stub_mcp(log_lines: int, delay: float) -> FastMCP:
+    server = FastMCP("stub")
+
+    @server.tool()
+    async def echo(ctx: Context, text: str = "") -> str:
+        for index in range(log_lines):
+            await ctx.info(f"Log line {index}")
+        await asyncio.sleep(delay)
+        return text
+
+    return server
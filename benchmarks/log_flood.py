@@ -0,0 +1,105 @@
+import argparse
+import asyncio
+import json
+import resource
+import time
+from datetime import datetime
+
+import uvicorn
+from mcp.server.fastmcp import Context
+from mcp.server.fastmcp import FastMCP
+from openai.types.chat import ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+
+from src.darp_servers.catalog import ToolCatalog
+from src.darp_servers.channel import ToolCallChannel
+from src.darp_servers.enums import DARPServerTransportProtocol
+from src.darp_servers.manager import ToolManager
+from src.database import DARPServer
+from src.messages.schemas import ToolCallResult
+from src.types import ChannelOverflowPolicy
+
+
+def create_flooding_server(log_count: int) -> FastMCP:
+    server = FastMCP("log-flood")
+
+    @server.tool()
+    async def flood(ctx: Context) -> str:
+        for index in range(log_count):
+            await ctx.info(f"Log line {index} " + "x" * 200)
+        return "done"
+
+    return server
+
+
+def create_tool_manager(url: str) -> ToolManager:
+    server = DARPServer(
+        id="1",
+        name="flood",
+        description="Synthetic log flooding server",
+        url=url,
+        tools=[dict(name="flood", description="Flood logs", input_schema={"type": "object", "properties": {}})],
+        transport_protocol=DARPServerTransportProtocol.SSE,
+        updated_at=datetime.min,
+    )
+    return ToolManager(catalog=ToolCatalog.build([server]))
+
+
+async def run_policy(
+    tool_manager: ToolManager, policy: ChannelOverflowPolicy, channel_size: int, consumer_delay: float
+) -> dict:
+    channel = ToolCallChannel(max_size=channel_size, overflow_policy=policy)
+    tool_call = ChatCompletionMessageToolCall(
+        id="call_1", type="function", function=Function(name="flood__flood", arguments="{}")
+    )
+    task = asyncio.create_task(tool_manager.handle_tool_call(tool_call, channel))
+    received = 0
+    max_depth = 0
+    started_at = time.perf_counter()
+    while True:
+        max_depth = max(max_depth, len(channel.items))
+        event = await channel.get()
+        received += 1
+        if isinstance(event, ToolCallResult):
+            break
+        await asyncio.sleep(consumer_delay)
+    elapsed = time.perf_counter() - started_at
+    await channel.close()
+    await task
+    return dict(
+        policy=policy.value,
+        received_events=received,
+        dropped_events=channel.dropped,
+        max_channel_depth=max_depth,
+        seconds=elapsed,
+        max_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Stress tool call channels with a log flooding MCP server")
+    parser.add_argument("--logs", type=int, default=20000)
+    parser.add_argument("--channel-size", type=int, default=256)
+    parser.add_argument("--consumer-delay", type=float, default=0.001, help="Seconds the SSE consumer spends per event")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    mcp_server = create_flooding_server(args.logs)
+    config = uvicorn.Config(mcp_server.sse_app(), port=args.port, log_level="warning")
+    server = uvicorn.Server(config)
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    tool_manager = create_tool_manager(f"http://127.0.0.1:{args.port}/sse")
+    results = [
+        await run_policy(tool_manager, policy, args.channel_size, args.consumer_delay)
+        for policy in ChannelOverflowPolicy
+    ]
+    server.should_exit = True
+    await serve_task
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+
+from src.chats.types import RoutingMode
+from src.darp_servers.local_router import LocalRouter
+from src.darp_servers.registry_client import RegistryClient
+
+
+async def compare_query(
+    query: str, routing_mode: RoutingMode, registry_client: RegistryClient, local: LocalRouter
+) -> dict:
+    started_at = time.perf_counter()
+    registry_servers = await registry_client.get_fitting_servers(query=query, routing_mode=routing_mode)
+    registry_latency = time.perf_counter() - started_at
+    started_at = time.perf_counter()
+    local_servers = await local.get_fitting_servers(query=query)
+    local_latency = time.perf_counter() - started_at
+    registry_ids = {str(server.id) for server in registry_servers}
+    local_ids = {str(server.id) for server in local_servers}
+    return dict(
+        query=query,
+        registry=sorted(registry_ids),
+        local=sorted(local_ids),
+        recall=len(registry_ids & local_ids) / len(registry_ids) if registry_ids else 1.0,
+        registry_latency_ms=registry_latency * 1000,
+        local_latency_ms=local_latency * 1000,
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare local routing index results with the registry")
+    parser.add_argument("queries", type=Path, help="Text file with one query per line")
+    parser.add_argument("--routing-mode", type=RoutingMode, default=RoutingMode.auto)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--verbose", action="store_true", help="Print per query results")
+    args = parser.parse_args()
+
+    queries = [line.strip() for line in args.queries.read_text().splitlines() if line.strip()]
+    registry_client = RegistryClient.get_new_instance()
+    local = LocalRouter(top_k=args.top_k)
+    results = [await compare_query(query, args.routing_mode, registry_client, local) for query in queries]
+    await registry_client.client.aclose()
+
+    summary = dict(
+        queries=len(results),
+        recall_mean=statistics.mean(result["recall"] for result in results),
+        registry_latency_p50_ms=statistics.median(result["registry_latency_ms"] for result in results),
+        local_latency_p50_ms=statistics.median(result["local_latency_ms"] for result in results),
+    )
+    if args.verbose:
+        summary["results"] = results
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
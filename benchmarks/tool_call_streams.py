@@ -0,0 +1,140 @@
+import argparse
+import asyncio
+import json
+import random
+import string
+import time
+from pathlib import Path
+
+from openai.types.chat import ChatCompletionChunk
+from openai.types.chat import ChatCompletionMessageToolCall
+
+from src.llm_clients import OpenAIClient
+from src.llm_clients import TextChunkData
+from src.llm_clients import ToolCallChunkData
+from src.llm_clients.cache import ResponseCache
+
+
+def load_recorded_streams(directory: Path) -> list[list[ChatCompletionChunk]]:
+    # Streams recorded by the disk LLM response cache, see LLM_CACHE_DIR
+    streams = []
+    for path in sorted(directory.glob("*.json")):
+        chunks = json.loads(path.read_text())["chunks"]
+        streams.append([ChatCompletionChunk.model_validate(chunk) for chunk in chunks])
+    return streams
+
+
+def create_chunk(delta: dict, finish_reason: str | None = None, usage: dict | None = None) -> ChatCompletionChunk:
+    choices = [dict(index=0, delta=delta, finish_reason=finish_reason)] if delta is not None else []
+    return ChatCompletionChunk.model_validate(
+        dict(id="fuzz", object="chat.completion.chunk", created=0, model="fuzz", choices=choices, usage=usage)
+    )
+
+
+def split_text(rng: random.Random, text: str) -> list[str]:
+    cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, rng.randint(0, 6)))) if len(text) > 1 else []
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+def create_fuzzed_stream(rng: random.Random) -> list[ChatCompletionChunk]:
+    fragments = []
+    for index in range(rng.randint(1, 4)):
+        arguments = json.dumps({rng.choice(string.ascii_lowercase): rng.random() for _ in range(rng.randint(0, 4))})
+        pieces = split_text(rng, arguments)
+        call_fragments = [
+            dict(index=index, id=f"call_{index}", type="function", function=dict(name=f"tool_{index}", arguments=""))
+        ] + [dict(index=index, function=dict(arguments=piece)) for piece in pieces]
+        fragments.append(call_fragments)
+    if rng.random() < 0.3:
+        # Interleave fragments of different calls, keeping each call's own order
+        ordered = []
+        while any(fragments):
+            ordered.append(rng.choice([call for call in fragments if call]).pop(0))
+    else:
+        ordered = [fragment for call in fragments for fragment in call]
+
+    chunks = [create_chunk(dict(role="assistant", content=rng.choice([None, "Let me check."])))]
+    while ordered:
+        size = rng.randint(1, 3)
+        chunks.append(create_chunk(dict(tool_calls=ordered[:size])))
+        ordered = ordered[size:]
+    finish_reason = rng.choice(["tool_calls", "stop"])
+    if rng.random() < 0.5:
+        chunks.append(create_chunk(dict(), finish_reason=finish_reason))
+    else:
+        chunks[-1].choices[0].finish_reason = finish_reason
+    if rng.random() < 0.5:
+        chunks.append(create_chunk(None, usage=dict(prompt_tokens=10, completion_tokens=5, total_tokens=15)))
+    return chunks
+
+
+def assemble_reference(chunks: list[ChatCompletionChunk]) -> tuple[str, list[tuple[str | None, str, str]]]:
+    text = ""
+    tool_calls: dict[int, list] = {}
+    for chunk in chunks:
+        for choice in chunk.choices:
+            text += choice.delta.content or ""
+            for piece in choice.delta.tool_calls or []:
+                tool_call = tool_calls.setdefault(piece.index, [None, "", ""])
+                tool_call[0] = piece.id or tool_call[0]
+                if piece.function:
+                    tool_call[1] = piece.function.name or tool_call[1]
+                    tool_call[2] += piece.function.arguments or ""
+    return text, [tuple(tool_calls[index]) for index in sorted(tool_calls)]
+
+
+async def parse(client: OpenAIClient, chunks: list[ChatCompletionChunk]) -> tuple[str, list, int]:
+    text = ""
+    tool_calls: list[ChatCompletionMessageToolCall] = []
+    early_tool_calls = 0
+    async for item in client.formatted_stream_generator(ResponseCache.replay(chunks)):
+        if isinstance(item, TextChunkData):
+            text += item.content
+        elif isinstance(item, list):
+            tool_calls += item
+        elif isinstance(item, ToolCallChunkData) and tool_calls:
+            # A fragment arrived after some calls were already handed out to be executed
+            early_tool_calls += 1
+    return text, tool_calls, early_tool_calls
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay recorded and fuzzed LLM streams through the tool call parser")
+    parser.add_argument("--recorded", type=Path, help="Directory of streams recorded by the disk LLM cache")
+    parser.add_argument("--fuzz", type=int, default=1000, help="Number of fuzzed streams")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    streams = load_recorded_streams(args.recorded) if args.recorded else []
+    streams += [create_fuzzed_stream(rng) for _ in range(args.fuzz)]
+    client = OpenAIClient(api_key="replay", response_cache=None)
+    mismatches = 0
+    streams_with_early_calls = 0
+    started_at = time.perf_counter()
+    for chunks in streams:
+        text, tool_calls, early_tool_calls = await parse(client, chunks)
+        expected_text, expected_tool_calls = assemble_reference(chunks)
+        parsed_tool_calls = [
+            (tool_call.id if expected[0] else None, tool_call.function.name, tool_call.function.arguments)
+            for tool_call, expected in zip(tool_calls, expected_tool_calls)
+        ]
+        mismatches += text != expected_text or sorted(parsed_tool_calls) != sorted(expected_tool_calls)
+        streams_with_early_calls += bool(early_tool_calls)
+    elapsed = time.perf_counter() - started_at
+    print(
+        json.dumps(
+            dict(
+                streams=len(streams),
+                chunks=sum(len(chunks) for chunks in streams),
+                mismatches=mismatches,
+                streams_with_early_tool_calls=streams_with_early_calls,
+                chunks_per_second=sum(len(chunks) for chunks in streams) / elapsed,
+            ),
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
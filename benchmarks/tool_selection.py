@@ -0,0 +1,71 @@
+import argparse
+import json
+import statistics
+from datetime import datetime
+from pathlib import Path
+
+from src.darp_servers.catalog import ToolCatalog
+from src.darp_servers.tool_selection import ToolSelector
+from src.database import DARPServer
+
+DATASET_HELP = """JSON file with
+"servers": [{"name", "description", "tools": [{"name", "description", "input_schema"}]}] and
+"cases": [{"query", "history": [str], "expected_tools": [tool names]}]"""
+
+
+def load_catalog(servers: list[dict]) -> ToolCatalog:
+    return ToolCatalog.build(
+        [
+            DARPServer(
+                id=str(index),
+                name=server["name"],
+                description=server.get("description", ""),
+                url="",
+                tools=server["tools"],
+                transport_protocol="sse",
+                updated_at=datetime.min,
+            )
+            for index, server in enumerate(servers)
+        ]
+    )
+
+
+def run_top_k(catalog: ToolCatalog, cases: list[dict], top_k: int) -> dict:
+    selector = ToolSelector(top_k=top_k, min_tools=0)
+    full_size = len(catalog.tools_json)
+    sizes = []
+    recalls = []
+    for case in cases:
+        tools = selector.select(catalog=catalog, query=case["query"], history=case.get("history", []))
+        names = {catalog.renamed_tools[tool["function"]["name"]].tool_name for tool in tools}
+        expected = set(case["expected_tools"])
+        sizes.append(len(json.dumps(tools, ensure_ascii=False)))
+        recalls.append(len(expected & names) / len(expected) if expected else 1.0)
+    return dict(
+        top_k=top_k,
+        tools_json_chars_mean=statistics.mean(sizes),
+        prompt_size_reduction=1 - statistics.mean(sizes) / full_size,
+        recall_mean=statistics.mean(recalls),
+        full_recall_rate=sum(recall == 1.0 for recall in recalls) / len(recalls),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure tool pruning prompt size reduction and tool-call recall")
+    parser.add_argument("dataset", type=Path, help=DATASET_HELP)
+    parser.add_argument("--top-k", type=int, nargs="+", default=[5, 10, 15, 25])
+    args = parser.parse_args()
+
+    dataset = json.loads(args.dataset.read_text())
+    catalog = load_catalog(dataset["servers"])
+    results = dict(
+        tools=len(catalog.tools),
+        tools_json_chars=len(catalog.tools_json),
+        cases=len(dataset["cases"]),
+        runs=[run_top_k(catalog, dataset["cases"], top_k) for top_k in args.top_k],
+    )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import uvicorn
+from fastapi import FastAPI
+from httpx import AsyncClient
+
+from src.agents.repository import AgentRepository
+from src.chats.repository import ChatRepository
+from src.chats.types import RoutingMode
+from src.darp_servers.registry_client import RegistryClient
+from src.darp_servers.repository import DARPServerRepository
+from src.database.session import session_maker
+from src.messages.repository import MessageRepository
+from src.messages.schemas import MessageCreate
+from src.messages.schemas import MessageCreateData
+from src.messages.service import MessageService
+
+
+def create_stub_registry(delay: float) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/servers/search")
+    async def search_servers() -> list:
+        await asyncio.sleep(delay)
+        return []
+
+    return app
+
+
+async def start_sequential(service: MessageService, chat_id: str, creation_data: MessageCreate) -> None:
+    agent = await service.new_message_agent(chat_id=chat_id, current_user_id=creation_data.current_user_id)
+    summary = await service.get_chat_summary(chat_id=chat_id)
+    await service.get_previous_messages(chat_id=chat_id, summary=summary)
+    await service.create_user_message(chat_id=chat_id, creation_data=creation_data, agent=agent)
+    fitting_servers = await service.get_fitting_servers(
+        query=creation_data.data.text, routing_mode=creation_data.routing_mode
+    )
+    await service.get_routed_tool_manager(fitting_servers=fitting_servers)
+
+
+async def start_pipelined(service: MessageService, chat_id: str, creation_data: MessageCreate) -> None:
+    agent = await service.new_message_agent(chat_id=chat_id, current_user_id=creation_data.current_user_id)
+    await service.start_turn(chat_id=chat_id, creation_data=creation_data, agent=agent)
+
+
+async def measure(start, registry_url: str, chat_id: str, user_id: str, iterations: int) -> dict:
+    latencies = []
+    async with AsyncClient(base_url=registry_url) as client:
+        for _ in range(iterations):
+            async with session_maker() as session:
+                service = MessageService(
+                    repo=MessageRepository(session),
+                    chat_repo=ChatRepository(session),
+                    agent_repo=AgentRepository(session),
+                    server_repo=DARPServerRepository(session),
+                    registry_client=RegistryClient(client=client),
+                )
+                creation_data = MessageCreate(
+                    current_user_id=user_id,
+                    data=MessageCreateData(text="Benchmark message"),
+                    routing_mode=RoutingMode.auto,
+                )
+                started_at = time.perf_counter()
+                await start(service, chat_id, creation_data)
+                latencies.append(time.perf_counter() - started_at)
+                await session.commit()
+    return dict(
+        mode=start.__name__.removeprefix("start_"),
+        turn_start_p50_ms=statistics.median(latencies) * 1000,
+        turn_start_max_ms=max(latencies) * 1000,
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Measure the time before the LLM request is sent, with a slow stub registry. "
+        "Inserts user messages into the given chat."
+    )
+    parser.add_argument("--chat-id", required=True)
+    parser.add_argument("--user-id", required=True)
+    parser.add_argument("--registry-delay", type=float, default=0.3)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    config = uvicorn.Config(create_stub_registry(args.registry_delay), port=args.port, log_level="warning")
+    server = uvicorn.Server(config)
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    registry_url = f"http://127.0.0.1:{args.port}"
+    results = [
+        await measure(start, registry_url, args.chat_id, args.user_id, args.iterations)
+        for start in (start_sequential, start_pipelined)
+    ]
+    server.should_exit = True
+    await serve_task
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
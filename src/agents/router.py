@@ -14,7 +14,9 @@ from .schemas import AgentUpdate
 from .schemas import AgentWithServers
 from .service import AgentService
 from src.database import Agent
-from src.database import get_session
+from src.database import get_read_session
+from src.messages.schemas import UsageRollup
+from src.messages.service import MessageService
 
 router = APIRouter(prefix="/agents")
 
@@ -30,6 +32,13 @@ async def get_single_agent(
     return await service.get_single_agent(agent_id=agent_id, current_user_id=current_user_id)
 
 
+@router.get("/{agent_id}/usage", response_model=UsageRollup)
+async def get_agent_usage(
+    agent_id: str, current_user_id: str, service: MessageService = Depends(MessageService.get_new_instance)
+) -> UsageRollup:
+    return await service.get_usage(user_id=current_user_id, agent_id=agent_id)
+
+
 @router.put("/{agent_id}", response_model=AgentWithServers)
 async def update_agent(
     agent_id: str, data: AgentUpdate, service: AgentService = Depends(AgentService.get_new_instance)
@@ -41,7 +50,7 @@ async def update_agent(
 async def list_agents(
     current_user_id: str,
     params: Params = Depends(),
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
     service: AgentService = Depends(AgentService.get_new_instance),
 ) -> Page[Agent]:
     query: Select = await service.get_agents(user_id=current_user_id)
@@ -1,5 +1,9 @@
+from collections.abc import AsyncGenerator
+from typing import Any
+
 from fastapi import APIRouter
 from fastapi import Depends
+from fastapi import Header
 from fastapi import status
 from fastapi_pagination import add_pagination
 from fastapi_pagination import Page
@@ -9,25 +13,34 @@ from sqlalchemy import Select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sse_starlette import EventSourceResponse
 
-from ..messages.helpers import convert_stream_errors
 from .schemas import ChatCreate
 from .schemas import ChatRead
 from .schemas import ChatUpdate
 from .service import ChatService
 from src.database import Chat
-from src.database import get_session
-from src.database import manage_stream_session
+from src.database import get_read_session
 from src.database import Message
 from src.errors import InvalidData
+from src.messages.constants import admission_controller
 from src.messages.schemas import MessageCreate
 from src.messages.schemas import MessageRead
+from src.messages.schemas import UsageRollup
 from src.messages.service import MessageService
+from src.messages.turns import turn_registry
+from src.messages.turns import turn_runner
 
 router = APIRouter(prefix="/chats")
 
 add_pagination(router)
 
 
+@router.get("/usage", response_model=UsageRollup)
+async def get_user_usage(
+    current_user_id: str, service: MessageService = Depends(MessageService.get_new_instance)
+) -> UsageRollup:
+    return await service.get_usage(user_id=current_user_id)
+
+
 @router.get("/{chat_id}", response_model=ChatRead)
 async def get_single_chat(
     chat_id: str,
@@ -48,7 +61,7 @@ async def update_chat(
 async def list_chats(
     current_user_id: str,
     params: Params = Depends(),
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
     service: ChatService = Depends(ChatService.get_new_instance),
 ) -> Page[Chat]:
     chats: Select = await service.get_chats(user_id=current_user_id)
@@ -74,11 +87,20 @@ async def get_chat_messages(
     chat_id: str,
     current_user_id: str,
     params: Params = Depends(),
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
     service: MessageService = Depends(MessageService.get_new_instance),
 ) -> Page[Message]:
-    agents: Select = await service.get_messages(chat_id=chat_id, user_id=current_user_id)
-    return await paginate(session, agents, params)
+    messages: Select = await service.get_messages(chat_id=chat_id, user_id=current_user_id)
+    page = await paginate(session, messages, params)
+    page.items = await service.expand_messages(list(page.items))
+    return page
+
+
+@router.get("/{chat_id}/usage", response_model=UsageRollup)
+async def get_chat_usage(
+    chat_id: str, current_user_id: str, service: MessageService = Depends(MessageService.get_new_instance)
+) -> UsageRollup:
+    return await service.get_usage(user_id=current_user_id, chat_id=chat_id)
 
 
 @router.post("/{chat_id}/messages")
@@ -87,16 +109,42 @@ async def create_message(
 ) -> EventSourceResponse:
     if not data.data.text:
         raise InvalidData("Text must be present")
-    agent = await service.new_message_agent(chat_id=chat_id, current_user_id=data.current_user_id)
-    previous_messages = await service.get_previous_messages(chat_id=chat_id)
-    message = await service.create_user_message(chat_id=chat_id, creation_data=data, agent=agent)
-    tool_manager = await service.get_tool_manager(query=data.data.text, routing_mode=data.routing_mode, agent=agent)
-    stream_generator = service.create_llm_message(
-        agent=agent,
-        tool_manager=tool_manager,
-        previous_messages=previous_messages + [message],
-        chat_id=chat_id,
-        current_user_id=data.current_user_id,
-    )
-    wrapped_stream = convert_stream_errors(stream_generator)
-    return EventSourceResponse(manage_stream_session(wrapped_stream, service.repo.session))
+    turn_runner.reserve()
+    try:
+        await admission_controller.acquire(user_id=data.current_user_id)
+    except BaseException:
+        turn_runner.release_reservation()
+        raise
+    try:
+        agent = await service.new_message_agent(chat_id=chat_id, current_user_id=data.current_user_id)
+        summary, previous_messages, message, tool_manager = await service.start_turn(
+            chat_id=chat_id, creation_data=data, agent=agent
+        )
+    except BaseException:
+        admission_controller.release(user_id=data.current_user_id)
+        turn_runner.release_reservation()
+        raise
+
+    # The admission permit is released by the turn runner once the turn is over
+    def create_stream(turn_service: MessageService) -> AsyncGenerator[str, Any]:
+        return turn_service.run_turn(
+            agent=agent,
+            tool_manager=tool_manager,
+            previous_messages=previous_messages + [message],
+            chat_id=chat_id,
+            current_user_id=data.current_user_id,
+            summary=summary,
+        )
+
+    turn = turn_registry.start(chat_id=chat_id, user_id=data.current_user_id, create_stream=create_stream)
+    return EventSourceResponse(turn.subscribe())
+
+
+@router.get("/{chat_id}/turns/{turn_id}/events")
+async def get_turn_events(
+    chat_id: str, turn_id: str, current_user_id: str, last_event_id: str | None = Header(default=None)
+) -> EventSourceResponse:
+    if last_event_id is not None and not last_event_id.isdigit():
+        raise InvalidData("Last-Event-ID must be an event sequence number")
+    turn = turn_registry.get_turn(turn_id=turn_id, chat_id=chat_id, user_id=current_user_id)
+    return EventSourceResponse(turn.subscribe(last_event_id=int(last_event_id) if last_event_id else None))
@@ -0,0 +1,38 @@
+import math
+import re
+from collections import Counter
+from collections.abc import Mapping
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+CAMEL_CASE_PATTERN = re.compile(r"([a-z0-9])([A-Z])")
+
+
+def tokenize(text: str) -> list[str]:
+    # Tool names are usually snake_case or camelCase, split them into words as well
+    return WORD_PATTERN.findall(CAMEL_CASE_PATTERN.sub(r"\1 \2", text).lower())
+
+
+class BM25Index:
+    def __init__(self, documents: list[list[str]], k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.term_counts = [Counter(document) for document in documents]
+        self.lengths = [len(document) for document in documents]
+        self.average_length = sum(self.lengths) / len(self.lengths) if documents else 0.0
+        document_frequency = Counter(term for counts in self.term_counts for term in counts)
+        self.idf = {
+            term: math.log(1 + (len(documents) - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def score(self, query_weights: Mapping[str, float]) -> list[float]:
+        scores = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / (self.average_length or 1))
+            score = 0.0
+            for term, weight in query_weights.items():
+                frequency = counts.get(term)
+                if frequency:
+                    score += weight * self.idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+            scores.append(score)
+        return scores
@@ -0,0 +1,101 @@
+import json
+from collections import OrderedDict
+from collections.abc import Awaitable
+from collections.abc import Callable
+from collections.abc import Mapping
+from dataclasses import dataclass
+from datetime import datetime
+from functools import cached_property
+from types import MappingProxyType
+from typing import Any
+from typing import Self
+
+from openai.types.chat import ChatCompletionToolParam
+
+from .bm25 import BM25Index
+from .bm25 import tokenize
+from src.agents.types import ToolInfo
+from src.database import DARPServer
+
+CatalogVersion = tuple[tuple[str, datetime], ...]
+
+
+@dataclass(frozen=True)
+class ToolCatalog:
+    version: CatalogVersion
+    servers: tuple[DARPServer, ...]
+    tools: tuple[ChatCompletionToolParam, ...]
+    tools_json: str
+    renamed_tools: Mapping[str, ToolInfo]
+    original_to_renamed: Mapping[str, str]
+
+    @classmethod
+    def build(cls, servers: list[DARPServer]) -> Self:
+        renamed_tools: dict[str, ToolInfo] = {}
+        original_to_renamed: dict[str, str] = {}
+        tools = []
+        for server in servers:
+            for tool in server.tools:
+                alias = tool.get("alias", None) or f"{tool['name']}__{server.name}"
+                renamed_tools[alias] = ToolInfo(tool_name=tool["name"], server=server)
+                original_to_renamed[tool["name"]] = alias
+                tools.append(
+                    ChatCompletionToolParam(
+                        type="function",
+                        function={
+                            "name": alias,
+                            "description": tool["description"],
+                            "parameters": tool["input_schema"],
+                        },
+                    )
+                )
+        return cls(
+            version=get_version(servers),
+            servers=tuple(servers),
+            tools=tuple(tools),
+            tools_json=json.dumps(tools, ensure_ascii=False),
+            renamed_tools=MappingProxyType(renamed_tools),
+            original_to_renamed=MappingProxyType(original_to_renamed),
+        )
+
+    @cached_property
+    def index(self) -> BM25Index:
+        documents = []
+        for tool in self.tools:
+            function = tool["function"]
+            tool_info = self.renamed_tools[function["name"]]
+            parameters_schema: dict[str, Any] = dict(function.get("parameters") or {})
+            properties: dict[str, Any] = parameters_schema.get("properties") or {}
+            parameters = " ".join(f"{name} {schema.get('description', '')}" for name, schema in properties.items())
+            text = " ".join(
+                [tool_info.tool_name, function.get("description") or "", parameters, tool_info.server.description]
+            )
+            documents.append(tokenize(text))
+        return BM25Index(documents)
+
+
+def get_version(servers: list[DARPServer]) -> CatalogVersion:
+    return tuple(sorted((server.id, server.updated_at) for server in servers))
+
+
+class ToolCatalogCache:
+    def __init__(self, max_entries: int = 1024) -> None:
+        self.max_entries = max_entries
+        self.catalogs: OrderedDict[str, ToolCatalog] = OrderedDict()
+
+    async def get(
+        self, key: str, version: CatalogVersion, load_servers: Callable[[], Awaitable[list[DARPServer]]]
+    ) -> ToolCatalog:
+        catalog = self.catalogs.get(key)
+        if catalog is not None and catalog.version == version:
+            self.catalogs.move_to_end(key)
+            return catalog
+        catalog = ToolCatalog.build(await load_servers())
+        self.catalogs[key] = catalog
+        self.catalogs.move_to_end(key)
+        while len(self.catalogs) > self.max_entries:
+            self.catalogs.popitem(last=False)
+        return catalog
+
+
+tool_catalog_cache = ToolCatalogCache()
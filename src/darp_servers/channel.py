@@ -0,0 +1,79 @@
+import asyncio
+from collections import deque
+
+from src.errors import InternalError
+from src.logger import logger
+from src.messages.schemas import DeepResearchLogData
+from src.messages.schemas import GenericLogData
+from src.messages.schemas import ToolCallResult
+from src.settings import settings
+from src.types import ChannelOverflowPolicy
+
+ToolCallEvent = ToolCallResult | DeepResearchLogData | GenericLogData
+
+
+class ToolCallChannelClosedError(InternalError):
+    message = "Tool call was stopped before it returned a result"
+
+
+class ToolCallChannel:
+    def __init__(
+        self,
+        max_size: int = settings.TOOL_CALL_CHANNEL_SIZE,
+        overflow_policy: ChannelOverflowPolicy = settings.TOOL_CALL_CHANNEL_OVERFLOW,
+    ) -> None:
+        self.max_size = max_size
+        self.overflow_policy = overflow_policy
+        self.items: deque[ToolCallEvent] = deque()
+        self.changed = asyncio.Condition()
+        self.closed = False
+        self.dropped = 0
+
+    async def put(self, item: ToolCallEvent) -> None:
+        async with self.changed:
+            if self.closed:
+                return
+            # Results and deep research stages are never dropped, only generic logs are lossy
+            if len(self.items) >= self.max_size and isinstance(item, GenericLogData) and self._replace_log(item):
+                self.dropped += 1
+                self.changed.notify_all()
+                return
+            await self.changed.wait_for(lambda: self.closed or len(self.items) < self.max_size)
+            if self.closed:
+                return
+            self.items.append(item)
+            self.changed.notify_all()
+
+    async def get(self) -> ToolCallEvent:
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.closed or bool(self.items))
+            # Closing drops the queued events, nothing will arrive anymore
+            if self.closed:
+                raise ToolCallChannelClosedError()
+            item = self.items.popleft()
+            self.changed.notify_all()
+            return item
+
+    async def close(self) -> None:
+        async with self.changed:
+            self.closed = True
+            self.items.clear()
+            self.changed.notify_all()
+        if self.dropped:
+            logger.info(f"Tool call channel dropped {self.dropped} log events")
+
+    def _replace_log(self, item: GenericLogData) -> bool:
+        if self.overflow_policy == ChannelOverflowPolicy.coalesce:
+            # Consecutive generic logs collapse into the latest one
+            if self.items and isinstance(self.items[-1], GenericLogData):
+                self.items[-1] = item
+                return True
+        elif self.overflow_policy == ChannelOverflowPolicy.drop_oldest:
+            oldest = next(
+                (index for index, queued in enumerate(self.items) if isinstance(queued, GenericLogData)), None
+            )
+            if oldest is not None:
+                del self.items[oldest]
+                self.items.append(item)
+                return True
+        return False
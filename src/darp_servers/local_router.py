@@ -0,0 +1,44 @@
+from datetime import datetime
+
+from .bm25 import BM25Index
+from .bm25 import tokenize
+from .repository import DARPServerRepository
+from src.database import DARPServer
+from src.database.session import session_maker
+from src.logger import logger
+from src.settings import settings
+
+
+class LocalRouter:
+    def __init__(self, top_k: int = settings.LOCAL_ROUTING_TOP_K) -> None:
+        self.top_k = top_k
+        self.version: tuple[int, datetime | None] | None = None
+        self.servers: list[DARPServer] = []
+        self.index = BM25Index([])
+
+    @staticmethod
+    def get_server_terms(server: DARPServer) -> list[str]:
+        tool_texts = [f"{tool['name']} {tool.get('description') or ''}" for tool in server.tools]
+        return tokenize(" ".join([server.name, server.description, *tool_texts]))
+
+    async def refresh(self) -> None:
+        # Uses its own session so routing can run alongside other work on the request session
+        async with session_maker() as session:
+            server_repo = DARPServerRepository(session)
+            # Servers only reach the table through upsert_servers or server creation, both of which move the version
+            version = await server_repo.get_all_servers_version()
+            if version == self.version:
+                return
+            self.servers = await server_repo.get_all_servers()
+        self.index = BM25Index([self.get_server_terms(server) for server in self.servers])
+        self.version = version
+        logger.info(f"Rebuilt local routing index with {len(self.servers)} servers")
+
+    async def get_fitting_servers(self, query: str) -> list[DARPServer]:
+        await self.refresh()
+        scores = self.index.score({term: 1.0 for term in tokenize(query)})
+        ranked = sorted((index for index, score in enumerate(scores) if score > 0), key=lambda index: -scores[index])
+        return [self.servers[index] for index in ranked[: self.top_k]]
+
+
+local_router = LocalRouter()
@@ -1,17 +1,15 @@
-from asyncio import Queue
-
 from mcp.types import LoggingMessageNotificationParams
 from pydantic import ValidationError
 
+from .channel import ToolCallChannel
 from src.logger import logger
 from src.messages.schemas import DeepResearchLogData
 from src.messages.schemas import GenericLogData
-from src.messages.schemas import ToolCallResult
 
 
 class LogCollector:
-    def __init__(self, queue: Queue[ToolCallResult | DeepResearchLogData | GenericLogData]) -> None:
-        self.queue = queue
+    def __init__(self, channel: ToolCallChannel) -> None:
+        self.channel = channel
 
     async def __call__(self, params: LoggingMessageNotificationParams) -> None:
         data = params.data
@@ -19,8 +17,8 @@ class LogCollector:
         if isinstance(data, dict):
             try:
                 log_data = DeepResearchLogData.model_validate(data)
-                await self.queue.put(log_data)
+                await self.channel.put(log_data)
                 return
             except ValidationError:
                 pass
-        await self.queue.put(GenericLogData(data=data))
+        await self.channel.put(GenericLogData(data=data))
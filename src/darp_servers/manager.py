@@ -1,5 +1,5 @@
 import json
-from asyncio import Queue
+from collections.abc import Sequence
 from contextlib import _AsyncGeneratorContextManager
 from json import JSONDecodeError
 
@@ -9,88 +9,85 @@ from mcp.client.streamable_http import streamablehttp_client
 from openai.types.chat import ChatCompletionMessageToolCall
 from openai.types.chat import ChatCompletionToolParam
 
-from src.agents.types import ToolInfo
+from src.darp_servers.catalog import ToolCatalog
+from src.darp_servers.channel import ToolCallChannel
 from src.darp_servers.enums import DARPServerTransportProtocol
 from src.darp_servers.log_collector import LogCollector
-from src.database import DARPServer
 from src.errors import RemoteServerError
-from src.messages.schemas import DeepResearchLogData
-from src.messages.schemas import GenericLogData
+from src.logger import logger
 from src.messages.schemas import ToolCallData
+from src.messages.schemas import ToolCallDeltaData
 from src.messages.schemas import ToolCallResult
 
 
 class ToolManager:
     def __init__(
-        self, darp_servers: list[DARPServer], queue: Queue[ToolCallResult | DeepResearchLogData | GenericLogData]
+        self,
+        catalog: ToolCatalog,
+        tools: Sequence[ChatCompletionToolParam] | None = None,
     ) -> None:
-        self.renamed_tools: dict[str, ToolInfo] = {}
-        self.original_to_renamed: dict[str, str] = {}
-        self.tools: list[ChatCompletionToolParam] = []
-        self.darp_servers = darp_servers
-        self.set_tools()
-        self.queue = queue
+        self.catalog = catalog
+        self.renamed_tools = catalog.renamed_tools
+        self.original_to_renamed = catalog.original_to_renamed
+        self.tools = catalog.tools if tools is None else tools
+        self.tools_json = catalog.tools_json if tools is None else json.dumps(list(tools), ensure_ascii=False)
+        self.darp_servers = catalog.servers
 
-    def rename_and_save(self, tool_name: str, server: DARPServer, alias: str | None) -> str:
-        alias = alias or f"{tool_name}__{server.name}"
-        self.renamed_tools[alias] = ToolInfo(tool_name=tool_name, server=server)
-        self.original_to_renamed[tool_name] = alias
-        return alias
-
-    def set_tools(self) -> None:
-        tools = []
-        for server in self.darp_servers:
-            for tool in server.tools:
-                tool_name = self.rename_and_save(tool_name=tool["name"], server=server, alias=tool.get("alias", None))
-                tools.append(
-                    ChatCompletionToolParam(
-                        type="function",
-                        function={
-                            "name": tool_name,
-                            "description": tool["description"],
-                            "parameters": tool["input_schema"],
-                        },
-                    )
-                )
-        self.tools = tools
-
-    async def handle_tool_call(self, tool_call: ChatCompletionMessageToolCall) -> None:
+    async def handle_tool_call(self, tool_call: ChatCompletionMessageToolCall, channel: ToolCallChannel) -> None:
         tool_info = self.renamed_tools.get(tool_call.function.name)
         if not tool_info:
-            await self.queue.put(
+            await self.reject_tool_call(tool_call, channel, "Error: Incorrect tool name")
+            return
+        server = tool_info.server
+        try:
+            client_ctx = self._get_client_context(server.url, server.transport_protocol)
+            async with client_ctx as (read, write, *_):
+                async with ClientSession(read, write, logging_callback=LogCollector(channel=channel)) as session:
+                    await session.initialize()
+
+                    result = await session.call_tool(
+                        tool_info.tool_name,
+                        arguments=json.loads(tool_call.function.arguments) if tool_call.function.arguments else None,
+                    )
+                    try:
+                        tool_result = json.loads(result.content[0].text)
+                    except JSONDecodeError:
+                        tool_result = result.content[0].text
+                    await channel.put(
+                        ToolCallResult(
+                            tool_call_id=tool_call.id,
+                            server_id=int(server.id),
+                            tool_name=tool_info.tool_name,
+                            result=tool_result or "Error",
+                            success=not result.isError,
+                        )
+                    )
+        except Exception as e:
+            # A failed call still has to produce a result, the turn waits for one per tool call
+            logger.error(f"Tool call {tool_info.tool_name} to {server.url} failed: {e!r}")
+            await channel.put(
                 ToolCallResult(
                     tool_call_id=tool_call.id,
-                    server_id=None,
-                    tool_name=tool_call.function.name,
-                    result="Error: Incorrect tool name",
+                    server_id=int(server.id),
+                    tool_name=tool_info.tool_name,
+                    result="Error: Tool call failed",
                     success=False,
                 )
             )
-            return
-        server = tool_info.server
-        client_ctx = self._get_client_context(server.url, server.transport_protocol)
 
-        async with client_ctx as (read, write, *_):
-            async with ClientSession(read, write, logging_callback=LogCollector(queue=self.queue)) as session:
-                await session.initialize()
-
-                result = await session.call_tool(
-                    tool_info.tool_name,
-                    arguments=json.loads(tool_call.function.arguments) if tool_call.function.arguments else None,
-                )
-                try:
-                    tool_result = json.loads(result.content[0].text)
-                except JSONDecodeError:
-                    tool_result = result.content[0].text
-                await self.queue.put(
-                    ToolCallResult(
-                        tool_call_id=tool_call.id,
-                        server_id=int(server.id),
-                        tool_name=tool_info.tool_name,
-                        result=tool_result or "Error",
-                        success=not result.isError,
-                    )
-                )
+    async def reject_tool_call(
+        self, tool_call: ChatCompletionMessageToolCall, channel: ToolCallChannel, error: str
+    ) -> None:
+        tool_info = self.renamed_tools.get(tool_call.function.name)
+        await channel.put(
+            ToolCallResult(
+                tool_call_id=tool_call.id,
+                server_id=int(tool_info.server.id) if tool_info else None,
+                tool_name=tool_info.tool_name if tool_info else tool_call.function.name,
+                result=error,
+                success=False,
+            )
+        )
 
     def format_tool_call(self, tool_call: ChatCompletionMessageToolCall) -> ToolCallData:
         tool_info = self.renamed_tools.get(tool_call.function.name)
@@ -107,6 +104,19 @@ class ToolManager:
             arguments=json.loads(arguments) if arguments else None,
         )
 
+    def format_tool_call_delta(
+        self, index: int, tool_call_id: str, name: str, arguments_delta: str
+    ) -> ToolCallDeltaData:
+        tool_info = self.renamed_tools.get(name)
+        return ToolCallDeltaData(
+            tool_call_id=tool_call_id,
+            index=index,
+            server_id=int(tool_info.server.id) if tool_info else None,
+            server_logo=tool_info.server.logo if tool_info else None,
+            tool_name=tool_info.tool_name if tool_info else name,
+            arguments_delta=arguments_delta,
+        )
+
     def rename_tool_calls(self, tool_calls: list[ToolCallData]) -> list[ToolCallData]:
         for tool_call in tool_calls:
             tool_call.tool_name = self.original_to_renamed[tool_call.tool_name]
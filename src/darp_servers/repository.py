@@ -1,13 +1,18 @@
+from datetime import datetime
 from typing import Self
 
 from fastapi import Depends
+from sqlalchemy import case
 from sqlalchemy import delete
 from sqlalchemy import exists
+from sqlalchemy import func
 from sqlalchemy import Select
 from sqlalchemy import select
+from sqlalchemy import tuple_
 from sqlalchemy.dialects.postgresql import insert as postgresql_upsert
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from .catalog import CatalogVersion
 from .schemas import DARPServerCreate
 from .schemas import RegistryServerSchema
 from src.database import agents_darp_servers
@@ -41,10 +46,35 @@ class DARPServerRepository:
         servers = await self.session.execute(query)
         return list(servers.scalars().all())
 
+    async def get_agent_server_versions(self, agent_id: str) -> CatalogVersion:
+        query = (
+            select(DARPServer.id, DARPServer.updated_at)
+            .join(agents_darp_servers)
+            .where(agents_darp_servers.c.agent_id == agent_id)  # type: ignore
+        )
+        rows = (await self.session.execute(query)).all()
+        return tuple(sorted((row.id, row.updated_at) for row in rows))
+
+    async def get_server_versions(self, server_ids: list[str]) -> CatalogVersion:
+        query = select(DARPServer.id, DARPServer.updated_at).where(DARPServer.id.in_(server_ids))
+        rows = (await self.session.execute(query)).all()
+        return tuple(sorted((row.id, row.updated_at) for row in rows))
+
     async def upsert_servers(self, servers: list[RegistryServerSchema]) -> None:
         if not servers:
             return
         query = postgresql_upsert(DARPServer).values([server.model_dump() for server in servers])
+        changed = tuple_(
+            DARPServer.name, DARPServer.description, DARPServer.url, DARPServer.logo, DARPServer.tools
+        ).is_distinct_from(
+            tuple_(
+                query.excluded.name,
+                query.excluded.description,
+                query.excluded.url,
+                query.excluded.logo,
+                query.excluded.tools,
+            )
+        )
         query = query.on_conflict_do_update(
             index_elements=[DARPServer.id],
             set_=dict(
@@ -53,10 +83,21 @@ class DARPServerRepository:
                 url=query.excluded.url,
                 logo=query.excluded.logo,
                 tools=query.excluded.tools,
+                # Bumped only on real changes, tool catalogs are versioned by it
+                updated_at=case((changed, query.excluded.updated_at), else_=DARPServer.updated_at),
             ),
         )
         await self.session.execute(query)
 
+    async def get_all_servers(self) -> list[DARPServer]:
+        servers = await self.session.execute(select(DARPServer))
+        return list(servers.scalars().all())
+
+    async def get_all_servers_version(self) -> tuple[int, datetime | None]:
+        query = select(func.count(DARPServer.id), func.max(DARPServer.updated_at))
+        count, last_updated_at = (await self.session.execute(query)).one()
+        return count, last_updated_at
+
     async def get_servers_by_ids(self, server_ids: list[str]) -> list[DARPServer]:
         query = select(DARPServer).where(DARPServer.id.in_(server_ids))
         servers = await self.session.execute(query)
@@ -0,0 +1,51 @@
+from collections import defaultdict
+from collections.abc import Collection
+from collections.abc import Sequence
+
+from openai.types.chat import ChatCompletionToolParam
+
+from .bm25 import tokenize
+from .catalog import ToolCatalog
+from src.settings import settings
+
+
+class ToolSelector:
+    def __init__(
+        self,
+        top_k: int = settings.TOOL_SELECTION_TOP_K,
+        min_tools: int = settings.TOOL_SELECTION_MIN_TOOLS,
+        history_weight: float = settings.TOOL_SELECTION_HISTORY_WEIGHT,
+    ) -> None:
+        self.top_k = top_k
+        self.min_tools = min_tools
+        self.history_weight = history_weight
+
+    def get_query_weights(self, query: str, history: Sequence[str]) -> dict[str, float]:
+        weights: defaultdict[str, float] = defaultdict(float)
+        for text in history:
+            for term in set(tokenize(text)):
+                weights[term] = max(weights[term], self.history_weight)
+        for term in tokenize(query):
+            weights[term] = 1.0
+        return weights
+
+    def select(
+        self,
+        catalog: ToolCatalog,
+        query: str,
+        history: Sequence[str] = (),
+        used_tools: Collection[str] = (),
+    ) -> tuple[ChatCompletionToolParam, ...]:
+        if len(catalog.tools) <= self.min_tools:
+            return catalog.tools
+        scores = catalog.index.score(self.get_query_weights(query, history))
+        ranked = sorted((index for index, score in enumerate(scores) if score > 0), key=lambda index: -scores[index])
+        if not ranked:
+            # Nothing matched lexically, pruning blindly would only hurt recall
+            return catalog.tools
+        selected = set(ranked[: self.top_k])
+        selected.update(index for index, tool in enumerate(catalog.tools) if tool["function"]["name"] in used_tools)
+        return tuple(tool for index, tool in enumerate(catalog.tools) if index in selected)
+
+
+tool_selector = ToolSelector()
@@ -2,26 +2,36 @@ from .models.agent import Agent
 from .models.agent import agents_darp_servers
 from .models.base import Base
 from .models.chat import Chat
+from .models.chat_summary import ChatSummary
 from .models.darp_server import DARPServer
 from .models.image import Image
 from .models.message import Message
+from .models.message_payload import MessagePayload
 from .models.report import Report
+from .models.turn_job import TurnJob
 from .session import database_url_async
 from .session import database_url_sync
+from .session import get_read_session
 from .session import get_session
 from .session import manage_stream_session
+from .session import release_connection
 
 __all__ = [
     "Base",
     "get_session",
+    "get_read_session",
     "Agent",
     "Chat",
+    "ChatSummary",
     "Image",
     "database_url_sync",
     "database_url_async",
     "DARPServer",
     "Message",
+    "MessagePayload",
     "Report",
+    "TurnJob",
     "agents_darp_servers",
     "manage_stream_session",
+    "release_connection",
 ]
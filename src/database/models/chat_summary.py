@@ -0,0 +1,25 @@
+from datetime import datetime
+
+from sqlalchemy import DateTime
+from sqlalchemy import ForeignKey
+from sqlalchemy import String
+from sqlalchemy import Text
+from sqlalchemy.orm import Mapped
+from sqlalchemy.orm import mapped_column
+
+from .base import Base
+from .mixins import HasCreatedAt
+from .mixins import HasId
+from .mixins import HasUpdatedAt
+
+
+class ChatSummary(HasId, HasCreatedAt, HasUpdatedAt, Base):
+    __tablename__ = "chat_summaries"
+
+    chat_id: Mapped[str] = mapped_column(
+        String, ForeignKey("chats.id", ondelete="CASCADE"), nullable=False, unique=True, index=True
+    )
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    model: Mapped[str] = mapped_column(String, nullable=False)
+    # created_at of the last message folded into the summary
+    covered_until: Mapped[datetime] = mapped_column(DateTime, nullable=False)
@@ -1,3 +1,4 @@
+from sqlalchemy import Index
 from sqlalchemy import String
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
@@ -9,9 +10,10 @@ from .mixins import HasId
 
 class Image(HasId, HasCreatedAt, Base):
     __tablename__ = "images"
+    __table_args__ = (Index("ix_images_hash_size", "hash", "size", unique=True),)
 
     url: Mapped[str] = mapped_column(String, nullable=False, unique=True)
-    original_url: Mapped[str] = mapped_column(String, nullable=False)
+    original_url: Mapped[str] = mapped_column(String, nullable=False, index=True)
     hash: Mapped[str | None] = mapped_column(String, nullable=True)
     width: Mapped[int] = mapped_column("w", nullable=False)
     height: Mapped[int] = mapped_column("h", nullable=False)
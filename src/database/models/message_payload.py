@@ -0,0 +1,19 @@
+from sqlalchemy import ForeignKey
+from sqlalchemy import LargeBinary
+from sqlalchemy import String
+from sqlalchemy.orm import Mapped
+from sqlalchemy.orm import mapped_column
+
+from .base import Base
+from .mixins import HasCreatedAt
+from .mixins import HasId
+
+
+class MessagePayload(HasId, HasCreatedAt, Base):
+    __tablename__ = "message_payloads"
+
+    message_id: Mapped[str] = mapped_column(
+        String, ForeignKey("messages.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    data: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    size: Mapped[int] = mapped_column(nullable=False)
@@ -0,0 +1,18 @@
+from sqlalchemy import ForeignKey
+from sqlalchemy import String
+from sqlalchemy.orm import Mapped
+from sqlalchemy.orm import mapped_column
+
+from .base import Base
+from .mixins import HasCreatedAt
+from .mixins import HasId
+from .mixins import HasUpdatedAt
+from .mixins import HasUserId
+
+
+class TurnJob(HasId, HasUserId, HasCreatedAt, HasUpdatedAt, Base):
+    __tablename__ = "turn_jobs"
+
+    chat_id: Mapped[str] = mapped_column(String, ForeignKey("chats.id", ondelete="CASCADE"), nullable=False, index=True)
+    status: Mapped[str] = mapped_column(String, nullable=False, index=True)
+    worker_id: Mapped[str] = mapped_column(String, nullable=False)
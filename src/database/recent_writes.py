@@ -0,0 +1,34 @@
+import time
+from itertools import chain
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from src.settings import settings
+
+
+class RecentWriteTracker:
+    def __init__(self, window: float) -> None:
+        self.window = window
+        self.last_writes: dict[str, float] = {}
+
+    def mark(self, user_id: str) -> None:
+        now = time.monotonic()
+        self.last_writes[user_id] = now
+        if len(self.last_writes) > 10_000:
+            self.last_writes = {key: value for key, value in self.last_writes.items() if now - value < self.window}
+
+    def wrote_recently(self, user_id: str) -> bool:
+        last_write = self.last_writes.get(user_id)
+        return last_write is not None and time.monotonic() - last_write < self.window
+
+
+recent_writes = RecentWriteTracker(window=settings.DB_REPLICA_READ_YOUR_WRITES_WINDOW)
+
+
+@event.listens_for(Session, "after_flush")
+def mark_recent_writes(session: Session, flush_context) -> None:
+    for instance in chain(session.new, session.dirty, session.deleted):
+        user_id = getattr(instance, "user_id", None) or getattr(instance, "creator_id", None)
+        if user_id:
+            recent_writes.mark(user_id)
@@ -1,30 +1,73 @@
 from collections.abc import AsyncGenerator
+from contextlib import aclosing
 from typing import Any
+from uuid import uuid4
 
+import anyio
+from fastapi import Request
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
 
+from .recent_writes import recent_writes
 from src.errors import FastApiError
 from src.errors import InternalError
 from src.logger import logger
 from src.settings import settings
+from src.types import DBPoolMode
 
 
-database_url = f"{settings.PG_USER}:{settings.PG_PASSWORD}@{settings.PG_HOST}/{settings.PG_DB}"
+database_url = f"{settings.PG_USER}:{settings.PG_PASSWORD}@{settings.PG_HOST}:{settings.PG_PORT}/{settings.PG_DB}"
 database_url_sync = f"postgresql+psycopg2://{database_url}"
 database_url_async = f"postgresql+asyncpg://{database_url}"
 
 
+def get_database_url_async(pool_mode: DBPoolMode) -> str:
+    if pool_mode == DBPoolMode.pgbouncer:
+        # Transaction pooling hands every transaction a different server connection, so no prepared statement reuse
+        return f"{database_url_async}?prepared_statement_cache_size=0"
+    return database_url_async
+
+
+def get_engine_options(
+    pool_mode: DBPoolMode, pool_size: int = settings.DB_POOL_SIZE, max_overflow: int = settings.DB_MAX_OVERFLOW
+) -> dict[str, Any]:
+    if pool_mode == DBPoolMode.app:
+        return dict(pool_size=pool_size, max_overflow=max_overflow, pool_pre_ping=True)
+    # No pre-ping: broken connections are invalidated by SQLAlchemy when a query fails on them
+    options: dict[str, Any] = dict(
+        pool_pre_ping=False,
+        connect_args=dict(
+            statement_cache_size=0,
+            prepared_statement_name_func=lambda: f"__asyncpg_{uuid4()}__",
+        ),
+    )
+    if pool_size == 0:
+        options["poolclass"] = NullPool
+    else:
+        options.update(pool_size=pool_size, max_overflow=max_overflow)
+    return options
+
+
 async_engine = create_async_engine(
-    database_url_async,
-    pool_size=settings.DB_POOL_SIZE,
-    max_overflow=settings.DB_MAX_OVERFLOW,
-    pool_pre_ping=True,
+    get_database_url_async(settings.DB_POOL_MODE),
+    **get_engine_options(settings.DB_POOL_MODE),
 )
 
 session_maker = async_sessionmaker(bind=async_engine, expire_on_commit=False)
 
+replica_session_maker: async_sessionmaker | None = None
+if settings.PG_REPLICA_HOST:
+    replica_url = get_database_url_async(settings.DB_POOL_MODE).replace(
+        f"@{settings.PG_HOST}:{settings.PG_PORT}/", f"@{settings.PG_REPLICA_HOST}:{settings.PG_REPLICA_PORT}/"
+    )
+    replica_options = get_engine_options(settings.DB_POOL_MODE)
+    replica_options.setdefault("connect_args", {})["timeout"] = settings.DB_REPLICA_CONNECT_TIMEOUT
+    replica_engine = create_async_engine(replica_url, **replica_options)
+    replica_session_maker = async_sessionmaker(bind=replica_engine, expire_on_commit=False)
+
 
 async def get_session() -> AsyncGenerator[AsyncSession, Any]:
     session = session_maker()
@@ -42,11 +85,41 @@ async def get_session() -> AsyncGenerator[AsyncSession, Any]:
         await session.close()
 
 
+async def release_connection(session: AsyncSession) -> None:
+    # Ends the transaction so the pooled connection is returned while a stream awaits the network
+    if settings.DB_STREAM_SHORT_TRANSACTIONS:
+        await session.commit()
+
+
+async def get_read_session(request: Request) -> AsyncGenerator[AsyncSession, Any]:
+    user_id = request.query_params.get("current_user_id") or request.query_params.get("creator_id")
+    session = await open_read_session(user_id=user_id)
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+async def open_read_session(user_id: str | None = None) -> AsyncSession:
+    if replica_session_maker is None or (user_id and recent_writes.wrote_recently(user_id)):
+        return session_maker()
+    session = replica_session_maker()
+    try:
+        await session.connection()
+    except (DBAPIError, OSError, TimeoutError) as e:
+        logger.warning(f"Read replica is unavailable, falling back to primary: {e}")
+        await session.close()
+        return session_maker()
+    return session
+
+
 # Needed because get_session commits at generator creation
 async def manage_stream_session(stream: AsyncGenerator, session: AsyncSession) -> AsyncGenerator:
     try:
-        async for chunk in stream:
-            yield chunk
+        await release_connection(session)
+        async with aclosing(stream):
+            async for chunk in stream:
+                yield chunk
         await session.commit()
     except FastApiError as e:
         await session.rollback()
@@ -56,4 +129,6 @@ async def manage_stream_session(stream: AsyncGenerator, session: AsyncSession) -
         await session.rollback()
         raise InternalError("Something went wrong")
     finally:
-        await session.close()
+        # Closing must finish even when the client disconnected, or the connection never returns to the pool
+        with anyio.CancelScope(shield=True):
+            await session.close()
@@ -1,6 +1,8 @@
 from fastapi import HTTPException
 from fastapi import status
 
+from src.settings import settings
+
 
 class FastApiError(HTTPException):
     status_code: int = status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -43,3 +45,12 @@ class RemoteServerError(FastApiError):
 
 class FormatError(FastApiError):
     pass
+
+
+class OverloadedError(FastApiError):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    message = "Server is overloaded, try again later"
+
+    def __init__(self, message: str | None = None, retry_after: int = settings.RETRY_AFTER, **kwargs) -> None:
+        super().__init__(message, **kwargs)
+        self.headers = {"Retry-After": str(retry_after)}
@@ -2,15 +2,19 @@ from typing import Self
 
 from fastapi import Depends
 from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.database import get_read_session
 from src.database import get_session
 from src.database import Image
 
 
 class ImageRepository:
-    def __init__(self, session: AsyncSession) -> None:
+    def __init__(self, session: AsyncSession, read_session: AsyncSession | None = None) -> None:
         self.session = session
+        # Lookups that tolerate replication lag go to the read replica
+        self.read_session = read_session or session
 
     async def get_image(self, image_hash: str, size: int) -> Image | None:
         result = await self.session.execute(
@@ -23,8 +27,8 @@ class ImageRepository:
 
         return image
 
-    async def get_image_by_url(self, url: str) -> Image | None:
-        result = await self.session.execute(
+    async def get_image_by_url(self, url: str, session: AsyncSession | None = None) -> Image | None:
+        result = await (session or self.read_session).execute(
             select(
                 Image,
             ).where(Image.url == url)
@@ -36,21 +40,33 @@ class ImageRepository:
     async def insert_image(
         self, url: str, original_url: str, image_hash: str | None, width: int, height: int, size: int
     ) -> Image:
-        image = Image(
-            url=url,
-            original_url=original_url,
-            hash=image_hash,
-            size=size,
-            width=width,
-            height=height,
+        query = (
+            postgresql_insert(Image)
+            .values(
+                url=url,
+                original_url=original_url,
+                hash=image_hash,
+                size=size,
+                width=width,
+                height=height,
+            )
+            .on_conflict_do_nothing()
+            .returning(Image)
         )
-        self.session.add(image)
-        await self.session.flush()
-        await self.session.refresh(image)
-        await self.session.commit()
+        image = (await self.session.execute(query)).scalar_one_or_none()
+        if image:
+            return image
 
-        return image
+        # Either the same content or the same resized variant was stored concurrently
+        existing_image = await self.get_image(image_hash, size) if image_hash else None
+        existing_image = existing_image or await self.get_image_by_url(url, session=self.session)
+        assert existing_image, "Invalid db state"
+        return existing_image
 
     @classmethod
-    def get_new_instance(cls, session: AsyncSession = Depends(get_session)) -> Self:
-        return cls(session)
+    def get_new_instance(
+        cls,
+        session: AsyncSession = Depends(get_session),
+        read_session: AsyncSession = Depends(get_read_session),
+    ) -> Self:
+        return cls(session, read_session=read_session)
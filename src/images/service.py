@@ -137,11 +137,11 @@ class ImageService:
 
         url = self._build_image_url(filename)
 
-        await self.image_repository.insert_image(
+        inserted_image = await self.image_repository.insert_image(
             url=url, original_url=url, image_hash=image_hash, width=width, height=height, size=size
         )
 
-        return UploadResponseSchema(src=url, width=width, height=height)
+        return UploadResponseSchema(src=inserted_image.url, width=inserted_image.width, height=inserted_image.height)
 
     def get_names(self, filename: str, width: int, height: int) -> Names:
         resized_image_name = self.get_resized_image_name(filename, width, height)
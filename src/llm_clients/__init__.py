@@ -1,5 +1,20 @@
+from .admission import AdmissionController
+from .dispatcher import LLMDispatcher
+from .exceptions import LLMUnavailableError
 from .openai_client import OpenAIClient
 from .types import TextChunkData
+from .types import ToolCallChunkData
+from .types import TruncatedToolCallData
+from .types import UsageData
 
 
-__all__ = ["OpenAIClient", "TextChunkData"]
+__all__ = [
+    "AdmissionController",
+    "LLMDispatcher",
+    "LLMUnavailableError",
+    "OpenAIClient",
+    "TextChunkData",
+    "ToolCallChunkData",
+    "TruncatedToolCallData",
+    "UsageData",
+]
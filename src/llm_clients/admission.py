@@ -0,0 +1,95 @@
+import asyncio
+from collections import defaultdict
+from collections import deque
+
+from src.errors import OverloadedError
+from src.logger import logger
+from src.settings import settings
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        min_concurrency: int = settings.LLM_ADMISSION_MIN_CONCURRENCY,
+        max_concurrency: int = settings.LLM_ADMISSION_MAX_CONCURRENCY,
+        per_user_concurrency: int = settings.LLM_ADMISSION_PER_USER,
+        queue_size: int = settings.LLM_ADMISSION_QUEUE_SIZE,
+        queue_timeout: float = settings.LLM_ADMISSION_QUEUE_TIMEOUT,
+        latency_target: float = settings.LLM_ADMISSION_LATENCY_TARGET,
+    ) -> None:
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.per_user_concurrency = per_user_concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.latency_target = latency_target
+        self.limit: float = max_concurrency
+        self.active = 0
+        self.user_counts: defaultdict[str, int] = defaultdict(int)
+        self.waiters: deque[tuple[asyncio.Future, str]] = deque()
+
+    async def acquire(self, user_id: str) -> None:
+        if self.user_counts.get(user_id, 0) >= self.per_user_concurrency:
+            raise OverloadedError("Too many messages are being generated for this user")
+        if self.active < int(self.limit) and not self.waiters:
+            self.active += 1
+            self.user_counts[user_id] += 1
+            return
+        if len(self.waiters) >= self.queue_size:
+            logger.warning(f"Admission queue is full, {self.active=}, limit={int(self.limit)}")
+            raise OverloadedError()
+        self.user_counts[user_id] += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append((waiter, user_id))
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await waiter
+        except (TimeoutError, asyncio.CancelledError) as e:
+            # The permit may have been handed over right before the timeout fired
+            if waiter.done() and not waiter.cancelled():
+                if isinstance(e, TimeoutError):
+                    return
+                self.release(user_id)
+                raise
+            # A release in between may already have dropped the cancelled waiter from the queue
+            if (waiter, user_id) in self.waiters:
+                self.waiters.remove((waiter, user_id))
+            self._decrement_user(user_id)
+            if isinstance(e, TimeoutError):
+                raise OverloadedError()
+            raise
+
+    def release(self, user_id: str) -> None:
+        self.active -= 1
+        self._decrement_user(user_id)
+        self._wake_waiters()
+
+    def record_latency(self, latency: float) -> None:
+        if latency > self.latency_target:
+            self._decrease_limit(factor=0.9)
+            return
+        # Additive increase: roughly +1 per limit's worth of successful requests
+        self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+        self._wake_waiters()
+
+    def record_overload(self) -> None:
+        self._decrease_limit(factor=0.5)
+
+    def _decrease_limit(self, factor: float) -> None:
+        new_limit = max(self.min_concurrency, self.limit * factor)
+        if int(new_limit) < int(self.limit):
+            logger.info(f"Lowering LLM concurrency limit to {int(new_limit)}")
+        self.limit = new_limit
+
+    def _decrement_user(self, user_id: str) -> None:
+        self.user_counts[user_id] -= 1
+        if self.user_counts[user_id] <= 0:
+            del self.user_counts[user_id]
+
+    def _wake_waiters(self) -> None:
+        while self.waiters and self.active < int(self.limit):
+            waiter, _ = self.waiters.popleft()
+            if waiter.done():
+                continue
+            self.active += 1
+            waiter.set_result(None)
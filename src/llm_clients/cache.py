@@ -0,0 +1,100 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from pathlib import Path
+from typing import Any
+
+from openai.types.chat import ChatCompletionChunk
+
+from src.logger import logger
+from src.settings import settings
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int, disk_dir: Path | None = None) -> None:
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.entries: OrderedDict[str, tuple[float, list[dict]]] = OrderedDict()
+        if disk_dir is not None:
+            disk_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def get_key(**request: Any) -> str:
+        serialized = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(serialized.encode()).hexdigest()
+
+    async def get(self, key: str) -> list[ChatCompletionChunk] | None:
+        entry = self.entries.get(key)
+        if entry is None and self.disk_dir is not None:
+            entry = await asyncio.to_thread(self._read_from_disk, key)
+            if entry is not None:
+                self._put_in_memory(key, entry)
+        if entry is None:
+            return None
+        expires_at, chunks = entry
+        if expires_at < time.time():
+            self.entries.pop(key, None)
+            return None
+        self.entries.move_to_end(key)
+        return [ChatCompletionChunk.model_validate(chunk) for chunk in chunks]
+
+    async def set(self, key: str, chunks: list[ChatCompletionChunk], ttl: int) -> None:
+        entry = (time.time() + ttl, [chunk.model_dump(mode="json") for chunk in chunks])
+        self._put_in_memory(key, entry)
+        if self.disk_dir is not None:
+            await asyncio.to_thread(self._write_to_disk, key, entry)
+
+    async def record(
+        self, key: str, stream: AsyncIterator[ChatCompletionChunk], ttl: int
+    ) -> AsyncIterator[ChatCompletionChunk]:
+        chunks = []
+        async for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        # Only fully consumed streams are stored, interrupted ones would replay a truncated answer
+        await self.set(key, chunks, ttl)
+
+    @staticmethod
+    async def replay(chunks: list[ChatCompletionChunk]) -> AsyncIterator[ChatCompletionChunk]:
+        for chunk in chunks:
+            # The recorded usage belongs to the original request, a replay must not be stored or calibrated on
+            yield chunk.model_copy(update=dict(usage=None)) if chunk.usage else chunk
+
+    def _put_in_memory(self, key: str, entry: tuple[float, list[dict]]) -> None:
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _read_from_disk(self, key: str) -> tuple[float, list[dict]] | None:
+        assert self.disk_dir
+        path = self.disk_dir / f"{key}.json"
+        try:
+            data = json.loads(path.read_text())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Unreadable LLM cache entry {path}: {e}")
+            return None
+        if data["expires_at"] < time.time():
+            path.unlink(missing_ok=True)
+            return None
+        return data["expires_at"], data["chunks"]
+
+    def _write_to_disk(self, key: str, entry: tuple[float, list[dict]]) -> None:
+        assert self.disk_dir
+        expires_at, chunks = entry
+        path = self.disk_dir / f"{key}.json"
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(dict(expires_at=expires_at, chunks=chunks)))
+        tmp_path.replace(path)
+
+
+response_cache: ResponseCache | None = (
+    ResponseCache(max_entries=settings.LLM_CACHE_MAX_ENTRIES, disk_dir=settings.LLM_CACHE_DIR)
+    if settings.LLM_CACHE_ENABLED
+    else None
+)
@@ -0,0 +1,181 @@
+import asyncio
+import random
+import time
+from collections.abc import AsyncGenerator
+from collections.abc import Sequence
+from typing import Any
+
+from openai.types.chat import ChatCompletionMessageParam
+from openai.types.chat import ChatCompletionToolParam
+
+from .admission import AdmissionController
+from .exceptions import LLMRateLimitError
+from .exceptions import LLMUnavailableError
+from .openai_client import OpenAIClient
+from .types import LLMStreamItem
+from src.logger import logger
+from src.settings import settings
+from src.types import LLMProvider
+
+LLMStream = AsyncGenerator[LLMStreamItem, Any]
+StreamItem = LLMStreamItem | None
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+
+    def allows_request(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return False
+        # Half-open: let a single trial request through per reset period
+        self.opened_at = time.monotonic()
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class LLMDispatcher:
+    def __init__(
+        self,
+        clients: dict[LLMProvider, OpenAIClient],
+        model_to_provider: dict[Any, LLMProvider],
+        fallback_models: dict[str, list[Any]] = settings.LLM_FALLBACK_MODELS,
+        max_retries: int = settings.LLM_MAX_RETRIES,
+        hedge_delay: float | None = settings.LLM_HEDGE_DELAY,
+        admission_controller: AdmissionController | None = None,
+    ) -> None:
+        self.clients = clients
+        self.model_to_provider = model_to_provider
+        self.fallback_models = fallback_models
+        self.max_retries = max_retries
+        self.hedge_delay = hedge_delay
+        self.admission_controller = admission_controller
+        self.breakers: dict[tuple[LLMProvider, str], CircuitBreaker] = {}
+
+    async def stream(
+        self,
+        provider: LLMProvider,
+        model: str,
+        conversation: list[ChatCompletionMessageParam],
+        system_prompt: str | None = None,
+        max_tokens: int | None = None,
+        tools: Sequence[ChatCompletionToolParam] | None = None,
+        cache_ttl: int | None = None,
+    ) -> tuple[str, LLMStream]:
+        # Returns the model that actually serves the stream, it differs from the requested one after a fallback
+        request = dict(
+            conversation=conversation,
+            system_prompt=system_prompt,
+            max_tokens=max_tokens,
+            tools=tools,
+            cache_ttl=cache_ttl,
+        )
+        last_error: LLMUnavailableError | None = None
+        for target_provider, target_model in self.get_targets(provider, model):
+            breaker = self.get_breaker(target_provider, target_model)
+            for attempt in range(self.max_retries + 1):
+                if not breaker.allows_request():
+                    logger.warning(f"Circuit for {target_provider}:{target_model} is open, skipping")
+                    break
+                if attempt:
+                    await asyncio.sleep(self.get_backoff(attempt))
+                started_at = time.monotonic()
+                try:
+                    stream, first_item = await self._start_hedged(target_provider, target_model, request)
+                except LLMUnavailableError as e:
+                    logger.warning(f"Attempt {attempt + 1} to {target_provider}:{target_model} failed: {e.message}")
+                    breaker.record_failure()
+                    if self.admission_controller and isinstance(e, LLMRateLimitError):
+                        self.admission_controller.record_overload()
+                    last_error = e
+                    continue
+                breaker.record_success()
+                if self.admission_controller:
+                    self.admission_controller.record_latency(time.monotonic() - started_at)
+                return target_model, self._resume_stream(first_item, stream)
+        raise last_error or LLMUnavailableError("All LLM models are unavailable")
+
+    def get_targets(self, provider: LLMProvider, model: str) -> list[tuple[LLMProvider, str]]:
+        targets = [(provider, model)]
+        for fallback_model in self.fallback_models.get(model, []):
+            fallback_provider = self.model_to_provider.get(fallback_model)
+            if fallback_provider in self.clients:
+                targets.append((fallback_provider, fallback_model))
+        return targets
+
+    def get_breaker(self, provider: LLMProvider, model: str) -> CircuitBreaker:
+        key = (provider, model)
+        if key not in self.breakers:
+            self.breakers[key] = CircuitBreaker(
+                failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+                reset_timeout=settings.LLM_CIRCUIT_RESET_TIMEOUT,
+            )
+        return self.breakers[key]
+
+    @staticmethod
+    def get_backoff(attempt: int) -> float:
+        max_delay = min(settings.LLM_RETRY_MAX_DELAY, settings.LLM_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+        return random.uniform(0, max_delay)
+
+    async def _start_hedged(self, provider: LLMProvider, model: str, request: dict) -> tuple[LLMStream, StreamItem]:
+        tasks = {asyncio.create_task(self._start(provider, model, request))}
+        try:
+            if self.hedge_delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay)
+                if not done:
+                    logger.info(
+                        f"No first token from {provider}:{model} after {self.hedge_delay}s, sending hedged request"
+                    )
+                    tasks.add(asyncio.create_task(self._start(provider, model, request)))
+            pending = set(tasks)
+            error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if task.exception() is None), None)
+                if winner:
+                    tasks.remove(winner)
+                    return winner.result()
+                error = next(task.exception() for task in done)
+            assert error
+            raise error
+        finally:
+            # Also runs when the caller is cancelled, every request but the winner is stopped and its stream closed
+            for task in tasks:
+                await self._discard(task)
+
+    @staticmethod
+    async def _discard(task: asyncio.Task) -> None:
+        task.cancel()
+        await asyncio.wait({task})
+        if not task.cancelled() and task.exception() is None:
+            await task.result()[0].aclose()
+
+    async def _start(self, provider: LLMProvider, model: str, request: dict) -> tuple[LLMStream, StreamItem]:
+        stream = await self.clients[provider].stream(model=model, **request)
+        # Errors before the first item can still be retried, nothing was sent to the user yet
+        first_item = await anext(stream, None)
+        return stream, first_item
+
+    @staticmethod
+    async def _resume_stream(first_item: StreamItem, stream: LLMStream) -> LLMStream:
+        try:
+            if first_item is None:
+                return
+            yield first_item
+            async for item in stream:
+                yield item
+        finally:
+            await stream.aclose()
@@ -0,0 +1,9 @@
+from src.errors import RemoteServerError
+
+
+class LLMUnavailableError(RemoteServerError):
+    message = "LLM request failed"
+
+
+class LLMRateLimitError(LLMUnavailableError):
+    message = "LLM provider rate limit exceeded"
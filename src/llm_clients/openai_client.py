@@ -1,44 +1,99 @@
+import asyncio
 from collections.abc import AsyncGenerator
+from collections.abc import AsyncIterator
+from collections.abc import Iterator
+from collections.abc import Sequence
 from typing import Any
 
 from httpx import AsyncClient
+from httpx import HTTPError
+from httpx import Limits
+from httpx import Timeout
 from httpx import URL
+from openai import APIConnectionError
 from openai import APIError
 from openai import AsyncOpenAI
 from openai import AsyncStream
 from openai import InternalServerError
 from openai import NOT_GIVEN
 from openai import OpenAIError
+from openai import RateLimitError
 from openai.types.chat import ChatCompletion
 from openai.types.chat import ChatCompletionChunk
 from openai.types.chat import ChatCompletionMessageParam
 from openai.types.chat import ChatCompletionMessageToolCall
 from openai.types.chat import ChatCompletionToolChoiceOptionParam
 from openai.types.chat import ChatCompletionToolParam
-from openai.types.chat.chat_completion_chunk import ChoiceDelta
-from openai.types.chat.chat_completion_message_tool_call import Function
 
+from .cache import response_cache as default_response_cache
+from .cache import ResponseCache
+from .exceptions import LLMRateLimitError
+from .exceptions import LLMUnavailableError
+from .prompt_cache import prompt_cache_stats
+from .prompt_cache import PromptCachePlanner
+from .tool_call_accumulator import ToolCallAccumulator
+from .types import LLMStreamItem
 from .types import TextChunkData
+from .types import TruncatedToolCallData
+from .types import UsageData
 from src.errors import RemoteServerError
 from src.logger import logger
+from src.settings import LLMPoolConfig
 from src.settings import settings
 
-default_http_client: AsyncClient = AsyncClient() if settings.PROXY is None else AsyncClient(proxy=settings.PROXY)
+
+def create_http_client(pool_config: LLMPoolConfig) -> AsyncClient:
+    return AsyncClient(
+        proxy=settings.PROXY,
+        http2=pool_config.http2,
+        limits=Limits(
+            max_connections=pool_config.max_connections,
+            max_keepalive_connections=pool_config.max_keepalive_connections,
+            keepalive_expiry=pool_config.keepalive_expiry,
+        ),
+        timeout=get_request_timeout(pool_config),
+    )
+
+
+def get_request_timeout(pool_config: LLMPoolConfig) -> Timeout:
+    # Read timeout is only a backstop here, stalls are detected per chunk in OpenAIClient.guard_stream
+    read_timeout = max(pool_config.first_byte_timeout, pool_config.chunk_timeout)
+    return Timeout(read_timeout, connect=pool_config.connect_timeout)
 
 
 class OpenAIClient:
     def __init__(
         self,
         api_key: str,
-        http_client: AsyncClient = default_http_client,
         base_url: str | URL | None = None,
+        pool_config: LLMPoolConfig = settings.LLM_POOL_DEFAULT,
+        response_cache: ResponseCache | None = default_response_cache,
     ) -> None:
-        self.llm_client = AsyncOpenAI(
-            api_key=api_key,
-            base_url=base_url,
-            http_client=http_client,
-        )
-        self.request_timeout = 20
+        self.api_key = api_key
+        self.base_url = base_url
+        self.pool_config = pool_config
+        self.request_timeout = get_request_timeout(pool_config)
+        self.response_cache = response_cache
+        self.cache_planner = PromptCachePlanner()
+        self.http_client: AsyncClient | None = None
+        self._llm_client: AsyncOpenAI | None = None
+
+    @property
+    def llm_client(self) -> AsyncOpenAI:
+        if self._llm_client is None:
+            self.open()
+        assert self._llm_client
+        return self._llm_client
+
+    def open(self) -> None:
+        self.http_client = create_http_client(self.pool_config)
+        self._llm_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, http_client=self.http_client)
+
+    async def close(self) -> None:
+        if self.http_client is not None:
+            await self.http_client.aclose()
+        self.http_client = None
+        self._llm_client = None
 
     async def stream(
         self,
@@ -46,9 +101,24 @@ class OpenAIClient:
         conversation: list[ChatCompletionMessageParam],
         system_prompt: str | None = None,
         max_tokens: int | None = None,
-        tools: list[ChatCompletionToolParam] | None = None,
+        tools: Sequence[ChatCompletionToolParam] | None = None,
         tool_choice: ChatCompletionToolChoiceOptionParam = "auto",
-    ) -> AsyncGenerator[list[ChatCompletionMessageToolCall] | TextChunkData, Any]:
+        cache_ttl: int | None = None,
+    ) -> AsyncGenerator[LLMStreamItem, Any]:
+        cache_key = None
+        if self.response_cache is not None and cache_ttl:
+            cache_key = self.response_cache.get_key(
+                model=model,
+                conversation=conversation,
+                system_prompt=system_prompt,
+                max_tokens=max_tokens,
+                tools=tools,
+                tool_choice=tool_choice,
+            )
+            cached_chunks = await self.response_cache.get(cache_key)
+            if cached_chunks is not None:
+                logger.debug(f"LLM response cache hit {cache_key}")
+                return self.formatted_stream_generator(self.response_cache.replay(cached_chunks))
         response = await self.get_response(
             conversation=conversation,
             max_tokens=max_tokens,
@@ -59,7 +129,32 @@ class OpenAIClient:
             tool_choice=tool_choice,
         )
         assert isinstance(response, AsyncStream)
-        return self.formatted_stream_generator(response)
+        if cache_key is not None:
+            assert self.response_cache is not None and cache_ttl
+            guarded_stream = self.response_cache.record(cache_key, self.guard_stream(response), ttl=cache_ttl)
+            return self.formatted_stream_generator(guarded_stream)
+        return self.formatted_stream_generator(self.guard_stream(response))
+
+    async def guard_stream(self, stream: AsyncStream[ChatCompletionChunk]) -> AsyncIterator[ChatCompletionChunk]:
+        chunk_timeout = self.pool_config.first_byte_timeout
+        iterator = stream.__aiter__()
+        try:
+            while True:
+                try:
+                    async with asyncio.timeout(chunk_timeout):
+                        chunk = await anext(iterator)
+                except StopAsyncIteration:
+                    return
+                except TimeoutError:
+                    logger.error(f"LLM stream stalled for more than {chunk_timeout}s")
+                    raise LLMUnavailableError("LLM request timed out")
+                except (APIError, HTTPError) as e:
+                    logger.error(f"LLM stream failed with the following exception:\n{e}")
+                    raise LLMUnavailableError()
+                chunk_timeout = self.pool_config.chunk_timeout
+                yield chunk
+        finally:
+            await stream.close()
 
     async def get_response(
         self,
@@ -69,10 +164,10 @@ class OpenAIClient:
         system_prompt: str | None = None,
         max_tokens: int | None = None,
         stream: bool = False,
-        tools: list[ChatCompletionToolParam] | None = None,
+        tools: Sequence[ChatCompletionToolParam] | None = None,
     ) -> ChatCompletion | AsyncStream[ChatCompletionChunk]:
-        full_conversation = self._get_full_conversation(
-            conversation=conversation, model=model, system_prompt=system_prompt
+        full_conversation, planned_tools = self.cache_planner.plan(
+            model=model, conversation=conversation, system_prompt=system_prompt, tools=tools
         )
         try:
             response = await self.llm_client.chat.completions.create(
@@ -80,74 +175,71 @@ class OpenAIClient:
                 messages=full_conversation,
                 max_tokens=max_tokens,
                 stream=stream,
-                tools=tools or NOT_GIVEN,
+                tools=planned_tools or NOT_GIVEN,
                 tool_choice=tool_choice,
+                stream_options={"include_usage": True} if stream else NOT_GIVEN,
                 timeout=self.request_timeout,
             )
+        except RateLimitError as e:
+            logger.error(f"Provider rate limit exceeded:\n{e}")
+            raise LLMRateLimitError()
+        except (APIConnectionError, InternalServerError) as e:
+            logger.error(f"Provider is unavailable:\n{e}")
+            raise LLMUnavailableError()
         except APIError as e:
             logger.error(e.code)
             logger.error(e.body)
             raise RemoteServerError("LLM request failed")
-        except InternalServerError as e:
-            logger.error(e.response.json())
-            raise RemoteServerError("LLM request failed")
         except OpenAIError as e:
             logger.error(f"Request to Provider failed with the following exception:\n{e}")
             raise RemoteServerError("LLM request failed")
         return response
 
-    def _get_full_conversation(
-        self, conversation: list[ChatCompletionMessageParam], model: str, system_prompt: str | None = None
-    ) -> list[ChatCompletionMessageParam]:
-        if not system_prompt:
-            return conversation
-        system_message = [{"role": "system", "content": system_prompt}]
-        if model.startswith("anthropic"):
-            # Anthropic prompt caching
-            system_message[-1]["cache_control"] = dict(type="ephemeral")  # type: ignore
-        return system_message + conversation
-
-    @staticmethod
-    def get_empty_openai_tool_call() -> dict:
-        return {"id": None, "function": {"arguments": "", "name": ""}, "type": "function"}
-
     @staticmethod
-    def format_tool_calls(tool_calls: dict) -> list[ChatCompletionMessageToolCall]:
-        return [
-            ChatCompletionMessageToolCall(
-                id=tool_calls[key]["id"],
-                function=Function(
-                    name=tool_calls[key]["function"]["name"], arguments=tool_calls[key]["function"]["arguments"]
-                ),
-                type="function",
-            )
-            for key in tool_calls
-        ]
+    def flush_tool_calls(
+        accumulator: ToolCallAccumulator,
+    ) -> Iterator[list[ChatCompletionMessageToolCall] | TruncatedToolCallData]:
+        tool_calls, truncated_tool_calls = accumulator.finish()
+        if tool_calls:
+            yield tool_calls
+        for tool_call in truncated_tool_calls:
+            yield TruncatedToolCallData(tool_call=tool_call)
 
     async def formatted_stream_generator(
         self,
-        stream: AsyncStream[ChatCompletionChunk],
-    ) -> AsyncGenerator[list[ChatCompletionMessageToolCall] | TextChunkData, Any]:
-        tool_calls: dict = {}
+        stream: AsyncIterator[ChatCompletionChunk],
+    ) -> AsyncGenerator[LLMStreamItem, Any]:
+        accumulator = ToolCallAccumulator()
+        usage = None
         async for chunk in stream:
+            if chunk.usage:
+                prompt_cache_stats.record(model=chunk.model, usage=chunk.usage)
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
             choice = chunk.choices[0]
             delta = choice.delta
             logger.debug(delta)
-            if choice.finish_reason == "tool_calls":
-                formatted_tool_calls = self.format_tool_calls(tool_calls)
-                yield formatted_tool_calls
-                continue
-            if delta.content:
+            if delta and delta.content:
                 yield TextChunkData(content=delta.content)
-            if delta.tool_calls:
-                self._add_tool_call_piece(tool_calls=tool_calls, delta=delta)
-
-    def _add_tool_call_piece(self, tool_calls: dict, delta: ChoiceDelta) -> None:
-        piece = delta.tool_calls[0]
-        tool_calls[piece.index] = tool_calls.get(piece.index, self.get_empty_openai_tool_call())
-        if piece.id:
-            tool_calls[piece.index]["id"] = piece.id
-        if piece.function.name:
-            tool_calls[piece.index]["function"]["name"] = piece.function.name
-        if piece.function.arguments:
-            tool_calls[piece.index]["function"]["arguments"] += piece.function.arguments
+            if delta and delta.tool_calls:
+                tool_call_chunks, completed_tool_calls = accumulator.add(delta.tool_calls)
+                if completed_tool_calls:
+                    yield completed_tool_calls
+                for tool_call_chunk in tool_call_chunks:
+                    yield tool_call_chunk
+            if choice.finish_reason:
+                # Some providers finish with "stop" even after tool calls, so any finish reason flushes them
+                for item in self.flush_tool_calls(accumulator):
+                    yield item
+        # Streams may also end without a finish reason, usage only chunks are sent after it
+        for item in self.flush_tool_calls(accumulator):
+            yield item
+        if usage:
+            cache_read_tokens, cache_write_tokens = prompt_cache_stats.get_cache_tokens(usage)
+            yield UsageData(
+                prompt_tokens=usage.prompt_tokens,
+                completion_tokens=usage.completion_tokens,
+                cache_read_tokens=cache_read_tokens,
+                cache_write_tokens=cache_write_tokens,
+            )
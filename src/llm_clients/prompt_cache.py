@@ -0,0 +1,111 @@
+import copy
+from collections.abc import Sequence
+
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletionMessageParam
+from openai.types.chat import ChatCompletionToolParam
+
+from src.logger import logger
+
+EPHEMERAL = dict(type="ephemeral")
+
+
+class PromptCachePlanner:
+    def __init__(self, max_breakpoints: int = 4) -> None:
+        self.max_breakpoints = max_breakpoints
+
+    @staticmethod
+    def supports_cache_control(model: str) -> bool:
+        return model.startswith("anthropic")
+
+    def plan(
+        self,
+        model: str,
+        conversation: list[ChatCompletionMessageParam],
+        system_prompt: str | None = None,
+        tools: Sequence[ChatCompletionToolParam] | None = None,
+    ) -> tuple[list[ChatCompletionMessageParam], list[ChatCompletionToolParam] | None]:
+        # A stable tool order keeps the cached prefix identical between turns
+        ordered_tools = sorted(tools, key=lambda tool: tool["function"]["name"]) if tools else None
+        system_messages: list[ChatCompletionMessageParam] = (
+            [{"role": "system", "content": system_prompt}] if system_prompt else []
+        )
+        if not self.supports_cache_control(model):
+            return system_messages + conversation, ordered_tools
+
+        breakpoints = self.max_breakpoints
+        if ordered_tools:
+            ordered_tools = ordered_tools[:-1] + [{**ordered_tools[-1], "cache_control": EPHEMERAL}]  # type: ignore
+            breakpoints -= 1
+        if system_messages:
+            system_messages = [self.mark_message(system_messages[0])]
+            breakpoints -= 1
+        return system_messages + self.mark_conversation(conversation, breakpoints), ordered_tools
+
+    def mark_conversation(
+        self, conversation: list[ChatCompletionMessageParam], breakpoints: int
+    ) -> list[ChatCompletionMessageParam]:
+        # The latest message is written to the cache for the next request, the start of the current turn
+        # is the longest prefix that is already cached from the previous one
+        candidates = []
+        last_index = self.find_markable(conversation, len(conversation) - 1)
+        if last_index is not None:
+            candidates.append(last_index)
+            turn_start = next(
+                (index for index in range(last_index - 1, -1, -1) if conversation[index]["role"] == "user"), None
+            )
+            if turn_start is not None:
+                candidates.append(turn_start)
+        marked = list(conversation)
+        for index in candidates[: max(breakpoints, 0)]:
+            marked[index] = self.mark_message(conversation[index])
+        return marked
+
+    @staticmethod
+    def find_markable(conversation: list[ChatCompletionMessageParam], start: int) -> int | None:
+        for index in range(start, -1, -1):
+            if conversation[index].get("content"):
+                return index
+        return None
+
+    @staticmethod
+    def mark_message(message: ChatCompletionMessageParam) -> ChatCompletionMessageParam:
+        marked = copy.copy(message)
+        content = message.get("content")
+        if isinstance(content, str):
+            marked["content"] = [dict(type="text", text=content, cache_control=EPHEMERAL)]  # type: ignore
+        elif isinstance(content, list) and content:
+            marked["content"] = content[:-1] + [{**content[-1], "cache_control": EPHEMERAL}]  # type: ignore
+        return marked
+
+
+class PromptCacheStats:
+    def __init__(self) -> None:
+        self.prompt_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+
+    @staticmethod
+    def get_cache_tokens(usage: CompletionUsage) -> tuple[int, int]:
+        details = usage.prompt_tokens_details
+        cache_read = (details.cached_tokens if details else None) or 0
+        extra = usage.model_extra or {}
+        cache_write = extra.get("cache_creation_input_tokens") or extra.get("cache_write_tokens") or 0
+        return cache_read, cache_write
+
+    def record(self, model: str, usage: CompletionUsage) -> None:
+        cache_read, cache_write = self.get_cache_tokens(usage)
+        self.prompt_tokens += usage.prompt_tokens
+        self.cache_read_tokens += cache_read
+        self.cache_write_tokens += cache_write
+        logger.debug(
+            f"Prompt cache for {model}: read={cache_read}, write={cache_write}, prompt={usage.prompt_tokens}, "
+            f"overall hit rate={self.hit_rate:.2%}"
+        )
+
+    @property
+    def hit_rate(self) -> float:
+        return self.cache_read_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+
+prompt_cache_stats = PromptCacheStats()
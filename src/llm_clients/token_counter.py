@@ -0,0 +1,88 @@
+import hashlib
+import math
+from collections import OrderedDict
+from collections.abc import Sequence
+
+import tiktoken
+from openai.types.chat import ChatCompletionMessageParam
+
+from src.logger import logger
+from src.settings import settings
+
+MESSAGE_OVERHEAD = 4
+CHARS_PER_TOKEN = 4
+# Claude's tokenizer yields more tokens than o200k for the same text, calibration refines it from real usage
+INITIAL_RATIOS = {"anthropic": 1.15}
+
+
+class TokenCounter:
+    def __init__(
+        self,
+        encoding_name: str = "o200k_base",
+        max_entries: int = settings.TOKEN_COUNT_CACHE_SIZE,
+        calibration_weight: float = 0.2,
+    ) -> None:
+        self.encoding_name = encoding_name
+        self.max_entries = max_entries
+        self.calibration_weight = calibration_weight
+        self.encoding: tiktoken.Encoding | None = None
+        self.entries: OrderedDict[str, list[int]] = OrderedDict()
+        self.ratios: dict[str, float] = dict(INITIAL_RATIOS)
+
+    def load(self) -> None:
+        try:
+            self.encoding = tiktoken.get_encoding(self.encoding_name)
+        except Exception as e:
+            logger.warning(f"Failed to load {self.encoding_name} encoding, estimating tokens from characters: {e}")
+
+    def count_text(self, text: str) -> int:
+        if self.encoding is None:
+            return math.ceil(len(text) / CHARS_PER_TOKEN)
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def count_message(self, message: ChatCompletionMessageParam) -> int:
+        tokens = MESSAGE_OVERHEAD
+        content = message.get("content")
+        if isinstance(content, str):
+            tokens += self.count_text(content)
+        elif isinstance(content, list):
+            tokens += sum(self.count_text(part.get("text", "")) for part in content)  # type: ignore
+        for tool_call in message.get("tool_calls") or []:  # type: ignore
+            function = tool_call["function"]
+            tokens += self.count_text(function["name"]) + self.count_text(function["arguments"] or "")
+        return tokens
+
+    def count_messages(self, key: str, messages: Sequence[ChatCompletionMessageParam]) -> list[int]:
+        # Stored messages never change, so their counts are cached by message id
+        counts = self.entries.get(key)
+        if counts is None:
+            counts = [self.count_message(message) for message in messages]
+            if self.encoding is None:
+                # Estimates made before the encoding loaded are recounted once it is there
+                return counts
+            self.entries[key] = counts
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        self.entries.move_to_end(key)
+        return counts
+
+    def count_tools(self, tools_json: str) -> int:
+        key = f"tools:{hashlib.sha256(tools_json.encode()).hexdigest()}"
+        return self.count_messages(key, [{"role": "system", "content": tools_json}])[0]
+
+    @staticmethod
+    def get_family(model: str) -> str:
+        return model.split("/")[0]
+
+    def estimate(self, model: str, tokens: int) -> int:
+        return math.ceil(tokens * self.ratios.get(self.get_family(model), 1.0))
+
+    def calibrate(self, model: str, tokens: int, prompt_tokens: int) -> None:
+        if not tokens or not prompt_tokens:
+            return
+        family = self.get_family(model)
+        ratio = self.ratios.get(family, 1.0)
+        self.ratios[family] = ratio + self.calibration_weight * (prompt_tokens / tokens - ratio)
+
+
+token_counter = TokenCounter()
@@ -0,0 +1,95 @@
+import json
+from json import JSONDecodeError
+
+from openai.types.chat import ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_chunk import ChoiceDeltaToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+
+from .types import ToolCallChunkData
+from src.database.id import generate_shortid
+from src.logger import logger
+
+
+class ToolCallAccumulator:
+    def __init__(self) -> None:
+        self.tool_calls: dict[int, dict] = {}
+        self.completed: set[int] = set()
+        self.max_index = -1
+        self.interleaved = False
+
+    def add(
+        self, pieces: list[ChoiceDeltaToolCall]
+    ) -> tuple[list[ToolCallChunkData], list[ChatCompletionMessageToolCall]]:
+        chunks = []
+        completed = []
+        for piece in pieces:
+            if piece.index in self.completed:
+                logger.error(f"Dropping a fragment of tool call {piece.index} that was already handed out")
+                continue
+            if piece.index > self.max_index:
+                # Calls are normally streamed one after another, so a new index means the previous ones are complete
+                completed += self.complete_pending()
+                self.max_index = piece.index
+            elif piece.index < self.max_index:
+                self.interleaved = True
+            chunks.append(self.add_piece(piece))
+        return chunks, completed
+
+    def add_piece(self, piece: ChoiceDeltaToolCall) -> ToolCallChunkData:
+        tool_call = self.tool_calls.setdefault(piece.index, dict(id=None, name="", arguments=""))
+        name = piece.function.name if piece.function else None
+        arguments = piece.function.arguments if piece.function else None
+        if piece.id:
+            tool_call["id"] = piece.id
+        if name:
+            tool_call["name"] = name
+        if arguments:
+            tool_call["arguments"] += arguments
+        return ToolCallChunkData(index=piece.index, tool_call_id=piece.id, name=name, arguments=arguments or "")
+
+    def complete_pending(self) -> list[ChatCompletionMessageToolCall]:
+        # Once a provider interleaves fragments of several calls, nothing is complete before the stream finishes
+        if self.interleaved:
+            return []
+        pending = [index for index in sorted(self.tool_calls) if index not in self.completed]
+        ready = [index for index in pending if self.has_complete_arguments(self.tool_calls[index]["arguments"])]
+        if len(ready) < len(pending):
+            return []
+        return self.pop(ready)
+
+    def finish(self) -> tuple[list[ChatCompletionMessageToolCall], list[ChatCompletionMessageToolCall]]:
+        pending = [index for index in sorted(self.tool_calls) if index not in self.completed]
+        # Arguments cut off mid stream, e.g. by the output token limit, never parse and can't be run
+        truncated = [
+            index
+            for index in pending
+            if self.tool_calls[index]["arguments"]
+            and not self.has_complete_arguments(self.tool_calls[index]["arguments"])
+        ]
+        for index in truncated:
+            logger.error(
+                f"Tool call {self.tool_calls[index]['name']} was cut off: {self.tool_calls[index]['arguments']}"
+            )
+            self.tool_calls[index]["arguments"] = ""
+        return self.pop([index for index in pending if index not in truncated]), self.pop(truncated)
+
+    def pop(self, indexes: list[int]) -> list[ChatCompletionMessageToolCall]:
+        self.completed.update(indexes)
+        return [self.format_tool_call(self.tool_calls[index]) for index in indexes]
+
+    @staticmethod
+    def has_complete_arguments(arguments: str) -> bool:
+        # Arguments are a JSON object, no prefix of it parses as one, while empty ones may still be streamed
+        try:
+            return isinstance(json.loads(arguments), dict)
+        except JSONDecodeError:
+            return False
+
+    @staticmethod
+    def format_tool_call(tool_call: dict) -> ChatCompletionMessageToolCall:
+        return ChatCompletionMessageToolCall(
+            # Some providers stream calls without ids, the history still needs one to match the results
+            id=tool_call["id"] or f"call_{generate_shortid()}",
+            function=Function(name=tool_call["name"], arguments=tool_call["arguments"]),
+            type="function",
+        )
@@ -1,5 +1,31 @@
+from openai.types.chat import ChatCompletionMessageToolCall
+
 from src.base_schema import BaseSchema
 
 
 class TextChunkData(BaseSchema):
     content: str
+
+
+class UsageData(BaseSchema):
+    prompt_tokens: int
+    completion_tokens: int
+    cache_read_tokens: int
+    cache_write_tokens: int
+
+
+class ToolCallChunkData(BaseSchema):
+    index: int
+    tool_call_id: str | None
+    name: str | None
+    arguments: str
+
+
+class TruncatedToolCallData(BaseSchema):
+    # Handed out without its arguments, the call is answered with an error instead of being run
+    tool_call: ChatCompletionMessageToolCall
+
+
+LLMStreamItem = (
+    list[ChatCompletionMessageToolCall] | TextChunkData | ToolCallChunkData | TruncatedToolCallData | UsageData
+)
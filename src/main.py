@@ -1,3 +1,4 @@
+import asyncio
 from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
 
@@ -7,12 +8,23 @@ from fastapi.middleware.cors import CORSMiddleware
 from src.agents.router import router as agents_router
 from src.chats.router import router as chats_router
 from src.images.router import router as images_router
+from src.llm_clients.token_counter import token_counter
+from src.messages.constants import provider_to_client
+from src.messages.turns import turn_runner
 from src.reports.router import router as reports_router
 
 
 @asynccontextmanager
 async def lifespan(fastapi: FastAPI) -> AsyncGenerator:
+    for llm_client in provider_to_client.values():
+        llm_client.open()
+    # Loading may download the encoding, token counts are estimated from characters until it is done
+    loading = asyncio.create_task(asyncio.to_thread(token_counter.load))
     yield
+    loading.cancel()
+    await turn_runner.drain()
+    for llm_client in provider_to_client.values():
+        await llm_client.close()
 
 
 app = FastAPI(lifespan=lifespan)
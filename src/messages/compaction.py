@@ -0,0 +1,97 @@
+import asyncio
+import json
+
+from .constants import llm_dispatcher
+from .repository import MessageRepository
+from .types import MessageSource
+from src.agents.constants import model_to_provider
+from src.database import Message
+from src.database.session import session_maker
+from src.llm_clients import TextChunkData
+from src.logger import logger
+from src.prompts.summary import summary_prompt
+from src.settings import settings
+from src.types import LLMModel
+
+
+class ContextCompactor:
+    def __init__(
+        self,
+        keep_turns: int = settings.CONTEXT_KEEP_TURNS,
+        batch_turns: int = settings.CONTEXT_COMPACTION_BATCH_TURNS,
+        model: LLMModel = settings.CONTEXT_SUMMARY_MODEL,
+    ) -> None:
+        self.keep_turns = keep_turns
+        self.batch_turns = batch_turns
+        self.model = model
+        self.running: dict[str, asyncio.Task] = {}
+
+    def get_messages_to_compact(self, messages: list[Message]) -> list[Message]:
+        # Cut only at user messages so an assistant tool call is never separated from its results
+        turn_starts = [index for index, message in enumerate(messages) if message.source == MessageSource.user]
+        if len(turn_starts) < self.keep_turns + self.batch_turns:
+            return []
+        return messages[: turn_starts[-self.keep_turns]]
+
+    def schedule(self, chat_id: str, messages: list[Message]) -> None:
+        if not settings.CONTEXT_COMPACTION_ENABLED or chat_id in self.running:
+            return
+        if not self.get_messages_to_compact(messages):
+            return
+        task = asyncio.create_task(self.compact(chat_id))
+        self.running[chat_id] = task
+        task.add_done_callback(lambda _: self.running.pop(chat_id, None))
+
+    async def compact(self, chat_id: str) -> None:
+        try:
+            async with session_maker() as session:
+                repo = MessageRepository(session)
+                summary = await repo.get_chat_summary(chat_id)
+                query = await repo.get_messages(chat_id, order="asc", after=summary.covered_until if summary else None)
+                messages = list((await session.execute(query)).scalars().all())
+                messages_to_compact = self.get_messages_to_compact(messages)
+                if not messages_to_compact:
+                    return
+                await repo.expand_messages(messages_to_compact, fields=("content",))
+                text = await self.summarize(summary.text if summary else None, messages_to_compact)
+                await repo.upsert_chat_summary(
+                    chat_id=chat_id, text=text, model=self.model, covered_until=messages_to_compact[-1].created_at
+                )
+                await session.commit()
+                logger.info(f"Compacted {len(messages_to_compact)} messages of chat {chat_id}")
+        except Exception as e:
+            logger.error(f"Context compaction failed for chat {chat_id}: {e}")
+
+    async def summarize(self, previous_summary: str | None, messages: list[Message]) -> str:
+        transcript = self.format_transcript(messages)
+        request = f"Current summary:\n{previous_summary or '(empty)'}\n\nTranscript:\n{transcript}"
+        _, stream = await llm_dispatcher.stream(
+            provider=model_to_provider[self.model],
+            model=self.model,
+            conversation=[{"role": "user", "content": request}],
+            system_prompt=summary_prompt,
+        )
+        chunks = [chunk.content async for chunk in stream if isinstance(chunk, TextChunkData)]
+        return "".join(chunks)
+
+    @staticmethod
+    def format_transcript(messages: list[Message]) -> str:
+        lines = []
+        for message in messages:
+            for content in message.content:
+                if message.source == MessageSource.user:
+                    lines.append(f"User: {content['content']}")
+                elif message.source == MessageSource.llm:
+                    if content.get("content"):
+                        lines.append(f"Assistant: {content['content']}")
+                    for tool_call in content.get("tool_calls") or []:
+                        function = tool_call["function"]
+                        lines.append(f"Assistant called tool {function['name']} with {function['arguments']}")
+                else:
+                    result = content.get("content")
+                    result = result if isinstance(result, str) else json.dumps(result)
+                    lines.append(f"Tool result: {result[: settings.CONTEXT_SUMMARY_TOOL_RESULT_CHARS]}")
+        return "\n".join(lines)
+
+
+context_compactor = ContextCompactor()
@@ -1,8 +1,21 @@
+from src.agents.constants import model_to_provider
+from src.llm_clients import AdmissionController
+from src.llm_clients import LLMDispatcher
 from src.llm_clients import OpenAIClient
 from src.settings import settings
 from src.types import LLMProvider
 
 
 provider_to_client: dict[LLMProvider, OpenAIClient] = {
-    LLMProvider.openrouter: OpenAIClient(base_url="https://openrouter.ai/api/v1", api_key=settings.OPENROUTER_API_KEY),
+    LLMProvider.openrouter: OpenAIClient(
+        base_url="https://openrouter.ai/api/v1",
+        api_key=settings.OPENROUTER_API_KEY,
+        pool_config=settings.LLM_POOLS.get(LLMProvider.openrouter, settings.LLM_POOL_DEFAULT),
+    ),
 }
+
+admission_controller = AdmissionController()
+
+llm_dispatcher = LLMDispatcher(
+    clients=provider_to_client, model_to_provider=model_to_provider, admission_controller=admission_controller
+)
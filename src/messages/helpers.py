@@ -1,4 +1,6 @@
+import asyncio
 from collections.abc import AsyncGenerator
+from contextlib import aclosing
 from typing import Any
 
 from .types import EventType
@@ -9,8 +11,17 @@ from src.messages.schemas import Event
 
 async def convert_stream_errors(stream: AsyncGenerator[str, Any]) -> AsyncGenerator[str, Any]:
     try:
-        async for chunk in stream:
-            yield chunk
+        async with aclosing(stream):
+            async for chunk in stream:
+                yield chunk
     except FastApiError as error:
         data = ErrorData(status_code=error.status_code, detail=error.detail)
         yield Event(event_type=EventType.error, data=data).model_dump_json()
+
+
+async def cancel_task(task: asyncio.Task) -> None:
+    if task.done():
+        return
+    task.cancel()
+    # Waiting for the task lets it release its connections before the turn finishes
+    await asyncio.wait({task})
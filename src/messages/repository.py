@@ -1,22 +1,37 @@
 import json
+import zlib
+from datetime import datetime
+from typing import Any
 from typing import Literal
 from typing import Self
 
 from fastapi import Depends
 from sqlalchemy import delete
 from sqlalchemy import exists
+from sqlalchemy import func
 from sqlalchemy import Select
 from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as postgresql_upsert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
 
 from .schemas import DeepResearchLogData
 from .schemas import GenericLogData
 from .schemas import MessageCreate
 from .schemas import ToolCallData
+from .schemas import UsageRollup
 from .types import MessageSource
 from src.database import Agent
+from src.database import ChatSummary
 from src.database import get_session
 from src.database import Message
+from src.database import MessagePayload
+from src.database import TurnJob
+from src.database.id import generate_shortid
+from src.llm_clients import UsageData
+from src.settings import settings
+
+PAYLOAD_FIELDS = ("content", "tool_call_logs")
 
 
 class MessageRepository:
@@ -31,8 +46,12 @@ class MessageRepository:
         return agent
 
     @staticmethod
-    async def get_messages(chat_id: str, order: Literal["asc", "desc"] = "desc") -> Select:
+    async def get_messages(
+        chat_id: str, order: Literal["asc", "desc"] = "desc", after: datetime | None = None
+    ) -> Select:
         query = select(Message).where(Message.chat_id == chat_id)
+        if after:
+            query = query.where(Message.created_at > after)
         if order == "desc":
             query = query.order_by(Message.created_at.desc())
         else:
@@ -57,21 +76,45 @@ class MessageRepository:
         self,
         chat_id: str,
         agent: Agent,
+        model: str,
         tool_calls: list[ToolCallData],
         creation_data: MessageCreate,
+        usage: UsageData | None = None,
+        ttft_ms: int | None = None,
+        latency_ms: int | None = None,
     ) -> Message:
         message = Message(
             chat_id=chat_id,
             agent_id=agent.id,
-            model=agent.model,
+            model=model,
             source=MessageSource.llm,
             content=[self.format_llm_message(text=creation_data.data.text, tool_calls=tool_calls)],
             user_id=creation_data.current_user_id,
+            ttft_ms=ttft_ms,
+            latency_ms=latency_ms,
+            **(usage.model_dump() if usage else {}),
         )
         self.session.add(message)
         await self.session.flush()
         return message
 
+    async def get_usage(self, user_id: str, chat_id: str | None = None, agent_id: str | None = None) -> UsageRollup:
+        query = select(
+            func.count(Message.id).label("llm_messages"),
+            func.coalesce(func.sum(Message.prompt_tokens), 0).label("prompt_tokens"),
+            func.coalesce(func.sum(Message.completion_tokens), 0).label("completion_tokens"),
+            func.coalesce(func.sum(Message.cache_read_tokens), 0).label("cache_read_tokens"),
+            func.coalesce(func.sum(Message.cache_write_tokens), 0).label("cache_write_tokens"),
+            func.avg(Message.ttft_ms).label("avg_ttft_ms"),
+            func.avg(Message.latency_ms).label("avg_latency_ms"),
+        ).where(Message.user_id == user_id, Message.source == MessageSource.llm)
+        if chat_id:
+            query = query.where(Message.chat_id == chat_id)
+        if agent_id:
+            query = query.where(Message.agent_id == agent_id)
+        row = (await self.session.execute(query)).one()
+        return UsageRollup.model_validate(row._mapping)
+
     async def create_tool_message(
         self,
         chat_id: str,
@@ -86,18 +129,77 @@ class MessageRepository:
                 tool_call_id=tool_call_id, tool_call_result=tool_call_result, tool_call_logs=tool_call_logs
             )
         ]
+        message_id = generate_shortid()
+        payloads: list[MessagePayload] = []
+        stored_content = [self.compact_content(content, message_id, payloads) for content in message_content]
         message = Message(
+            id=message_id,
             chat_id=chat_id,
             agent_id=agent.id,
             model=agent.model,
             source=MessageSource.tool,
-            content=message_content,
+            content=stored_content,
             user_id=current_user_id,
         )
         self.session.add(message)
         await self.session.flush()
+        if payloads:
+            self.session.add_all(payloads)
+            await self.session.flush()
+        # The caller keeps working with the full content, only the stored row is compact
+        set_committed_value(message, "content", message_content)
         return message
 
+    @staticmethod
+    def compact_content(content: dict, message_id: str, payloads: list[MessagePayload]) -> dict:
+        compact = dict(content)
+        for field in PAYLOAD_FIELDS:
+            if compact.get(field) is None:
+                continue
+            serialized = json.dumps(compact[field]).encode()
+            if len(serialized) <= settings.MESSAGE_PAYLOAD_INLINE_LIMIT:
+                continue
+            payload = MessagePayload(
+                id=generate_shortid(), message_id=message_id, data=zlib.compress(serialized), size=len(serialized)
+            )
+            payloads.append(payload)
+            del compact[field]
+            compact[f"{field}_ref"] = payload.id
+        return compact
+
+    async def expand_messages(self, messages: list[Message], fields: tuple[str, ...] = PAYLOAD_FIELDS) -> None:
+        payload_ids = [
+            content[f"{field}_ref"]
+            for message in messages
+            for content in message.content
+            for field in fields
+            if f"{field}_ref" in content
+        ]
+        if not payload_ids:
+            return
+        payloads = await self.get_payloads(payload_ids)
+        for message in messages:
+            expanded_content = self.expand_content(message.content, payloads, fields)
+            if expanded_content != message.content:
+                set_committed_value(message, "content", expanded_content)
+
+    async def get_payloads(self, payload_ids: list[str]) -> dict[str, Any]:
+        query = select(MessagePayload.id, MessagePayload.data).where(MessagePayload.id.in_(payload_ids))
+        rows = (await self.session.execute(query)).all()
+        return {row.id: json.loads(zlib.decompress(row.data)) for row in rows}
+
+    @staticmethod
+    def expand_content(content: list[dict], payloads: dict[str, Any], fields: tuple[str, ...]) -> list[dict]:
+        expanded_content = []
+        for item in content:
+            item = dict(item)
+            for field in fields:
+                payload_id = item.pop(f"{field}_ref", None)
+                if payload_id is not None:
+                    item[field] = payloads.get(payload_id)
+            expanded_content.append(item)
+        return expanded_content
+
     @staticmethod
     def format_tool_message(
         tool_call_id: str, tool_call_result: str, tool_call_logs: list[DeepResearchLogData | GenericLogData]
@@ -149,6 +251,49 @@ class MessageRepository:
         ]
         return dict(role="assistant", content=text, tool_calls=llm_tool_calls if len(llm_tool_calls) > 0 else None)
 
+    async def get_chat_summary(self, chat_id: str) -> ChatSummary | None:
+        query = select(ChatSummary).where(ChatSummary.chat_id == chat_id)
+        return (await self.session.execute(query)).scalar_one_or_none()
+
+    async def upsert_chat_summary(self, chat_id: str, text: str, model: str, covered_until: datetime) -> None:
+        query = postgresql_upsert(ChatSummary).values(
+            id=generate_shortid(),
+            chat_id=chat_id,
+            text=text,
+            model=model,
+            covered_until=covered_until,
+            created_at=datetime.now(),
+            updated_at=datetime.now(),
+        )
+        query = query.on_conflict_do_update(
+            index_elements=[ChatSummary.chat_id],
+            set_=dict(
+                text=query.excluded.text,
+                model=query.excluded.model,
+                covered_until=query.excluded.covered_until,
+                updated_at=query.excluded.updated_at,
+            ),
+            # A slower concurrent compaction must not overwrite a more recent summary
+            where=ChatSummary.covered_until < query.excluded.covered_until,
+        )
+        await self.session.execute(query)
+
+    async def upsert_turn_job(self, turn_id: str, chat_id: str, user_id: str, status: str, worker_id: str) -> None:
+        query = postgresql_upsert(TurnJob).values(
+            id=turn_id,
+            chat_id=chat_id,
+            user_id=user_id,
+            status=status,
+            worker_id=worker_id,
+            created_at=datetime.now(),
+            updated_at=datetime.now(),
+        )
+        query = query.on_conflict_do_update(
+            index_elements=[TurnJob.id],
+            set_=dict(status=query.excluded.status, updated_at=query.excluded.updated_at),
+        )
+        await self.session.execute(query)
+
     @classmethod
     def get_new_instance(
         cls,
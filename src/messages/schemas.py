@@ -24,6 +24,22 @@ class MessageRead(BaseSchema):
     source: MessageSource
     content: list[dict]
     created_at: datetime
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    cache_read_tokens: int | None = None
+    cache_write_tokens: int | None = None
+    ttft_ms: int | None = None
+    latency_ms: int | None = None
+
+
+class UsageRollup(BaseSchema):
+    llm_messages: int
+    prompt_tokens: int
+    completion_tokens: int
+    cache_read_tokens: int
+    cache_write_tokens: int
+    avg_ttft_ms: float | None
+    avg_latency_ms: float | None
 
 
 class MessageCreateData(BaseSchema):
@@ -52,6 +68,15 @@ class ToolCallData(BaseSchema):
     arguments: dict | None
 
 
+class ToolCallDeltaData(BaseSchema):
+    tool_call_id: str
+    index: int
+    server_logo: str | None
+    server_id: int | None
+    tool_name: str
+    arguments_delta: str
+
+
 class DeepResearchStageStart(BaseSchema):
     title: str
 
@@ -73,13 +98,25 @@ class GenericLogData(BaseSchema):
     data: Any
 
 
+class TurnData(BaseSchema):
+    turn_id: str
+
+
 class ErrorData(BaseSchema):
     status_code: int
     detail: dict
 
 
 EventData: TypeAlias = Union[
-    TextChunkData, MessageRead, ToolCallData, ToolCallResult, DeepResearchLogData, GenericLogData, ErrorData
+    TextChunkData,
+    MessageRead,
+    ToolCallData,
+    ToolCallDeltaData,
+    ToolCallResult,
+    DeepResearchLogData,
+    GenericLogData,
+    ErrorData,
+    TurnData,
 ]
 
 
@@ -1,22 +1,31 @@
 import asyncio
 import json
-from asyncio import Queue
+import time
 from collections.abc import AsyncGenerator
+from collections.abc import Awaitable
+from contextlib import aclosing
+from dataclasses import dataclass
+from dataclasses import field
 from typing import Any
 from typing import Self
 
+import anyio
 from fastapi import Depends
+from httpx import HTTPError
 from openai.types.chat import ChatCompletionMessageParam
 from openai.types.chat import ChatCompletionMessageToolCall
 from sqlalchemy import Select
 
 from ..chats.types import RoutingMode
 from ..darp_servers.registry_client import RegistryClient
-from .constants import provider_to_client
+from .compaction import context_compactor
+from .constants import llm_dispatcher
+from .helpers import cancel_task
 from .repository import MessageRepository
 from .schemas import AssistantMessage
 from .schemas import DeepResearchLogData
 from .schemas import Event
+from .schemas import EventData
 from .schemas import GenericLogData
 from .schemas import MessageCreate
 from .schemas import MessageCreateData
@@ -24,19 +33,76 @@ from .schemas import MessageRead
 from .schemas import ToolCallData
 from .schemas import ToolCallResult
 from .schemas import ToolMessageForLLM
+from .schemas import UsageRollup
 from .types import EventType
 from .types import MessageSource
 from src.agents.repository import AgentRepository
 from src.chats.repository import ChatRepository
+from src.darp_servers.catalog import tool_catalog_cache
+from src.darp_servers.channel import ToolCallChannel
+from src.darp_servers.local_router import local_router
 from src.darp_servers.manager import ToolManager
 from src.darp_servers.repository import DARPServerRepository
+from src.darp_servers.schemas import RegistryServerSchema
+from src.darp_servers.tool_selection import tool_selector
 from src.database import Agent
+from src.database import ChatSummary
+from src.database import DARPServer
 from src.database import Message
+from src.database import release_connection
+from src.errors import InternalError
 from src.errors import InvalidData
 from src.errors import NotFoundError
-from src.llm_clients import OpenAIClient
+from src.errors import RemoteServerError
 from src.llm_clients import TextChunkData
+from src.llm_clients import ToolCallChunkData
+from src.llm_clients import TruncatedToolCallData
+from src.llm_clients import UsageData
+from src.llm_clients.token_counter import token_counter
 from src.logger import logger
+from src.settings import settings
+from src.types import LocalRoutingMode
+
+
+@dataclass
+class ToolCallRun:
+    tool_call: ChatCompletionMessageToolCall
+    channel: ToolCallChannel
+    task: asyncio.Task | None = None
+
+
+@dataclass
+class StreamedToolCall:
+    # Providers may send a call's id and name in different fragments, deltas are held back until both are known
+    tool_call_id: str | None = None
+    name: str | None = None
+    buffered_arguments: str = ""
+    announced: bool = False
+
+    def add(self, chunk: ToolCallChunkData) -> tuple[str, str, str] | None:
+        self.tool_call_id = self.tool_call_id or chunk.tool_call_id
+        self.name = self.name or chunk.name
+        self.buffered_arguments += chunk.arguments
+        if not self.tool_call_id or not self.name or (self.announced and not self.buffered_arguments):
+            return None
+        arguments_delta, self.buffered_arguments = self.buffered_arguments, ""
+        self.announced = True
+        return self.tool_call_id, self.name, arguments_delta
+
+
+@dataclass
+class AgentLoopState:
+    agent: Agent
+    chat_id: str
+    current_user_id: str
+    tool_manager: ToolManager
+    system_prompt: str
+    # Appended to in place as the turn goes, only trimmed from the front to fit the context window
+    conversation: list[ChatCompletionMessageParam] = field(default_factory=list)
+    # Local token counts of the system prompt and tools, and of every conversation entry
+    base_tokens: int = 0
+    conversation_tokens: list[int] = field(default_factory=list)
+    tool_calls: list[ToolCallRun] = field(default_factory=list)
 
 
 class MessageService:
@@ -60,6 +126,13 @@ class MessageService:
             raise NotFoundError("Chat with this id does not exist")
         return await self.repo.get_messages(chat_id=chat_id)
 
+    async def get_usage(self, user_id: str, chat_id: str | None = None, agent_id: str | None = None) -> UsageRollup:
+        if chat_id and not await self.chat_repo.chat_exists(chat_id=chat_id, user_id=user_id):
+            raise NotFoundError("Chat with this id does not exist")
+        if agent_id and not await self.agent_repo.agent_exists(agent_id=agent_id, user_id=user_id):
+            raise NotFoundError("Agent with this id does not exist")
+        return await self.repo.get_usage(user_id=user_id, chat_id=chat_id, agent_id=agent_id)
+
     async def new_message_agent(self, chat_id: str, current_user_id: str) -> Agent:
         chat = await self.chat_repo.get_chat(chat_id=chat_id, user_id=current_user_id)
         if not chat:
@@ -73,16 +146,30 @@ class MessageService:
         message = await self.repo.create_user_message(chat_id=chat_id, creation_data=creation_data, agent=agent)
         return message
 
-    async def get_previous_messages(self, chat_id: str) -> list[Message]:
-        messages_query = await self.repo.get_messages(chat_id, order="asc")
-        messages = (await self.repo.session.execute(messages_query)).scalars().all()
-        return list(messages)
+    async def get_chat_summary(self, chat_id: str) -> ChatSummary | None:
+        if not settings.CONTEXT_COMPACTION_ENABLED:
+            return None
+        return await self.repo.get_chat_summary(chat_id)
 
-    def get_formatted_messages(self, messages: list[Message]) -> list[ChatCompletionMessageParam]:
-        formatted_messages: list[ChatCompletionMessageParam] = []
-        for message in messages:
-            formatted_messages += self.format_message_for_llm(message)
-        return formatted_messages
+    async def get_previous_messages(self, chat_id: str, summary: ChatSummary | None = None) -> list[Message]:
+        messages_query = await self.repo.get_messages(
+            chat_id, order="asc", after=summary.covered_until if summary else None
+        )
+        messages = list((await self.repo.session.execute(messages_query)).scalars().all())
+        # Tool call logs are never sent to the LLM, so only the results are resolved
+        await self.repo.expand_messages(messages, fields=("content",))
+        context_compactor.schedule(chat_id=chat_id, messages=messages)
+        return messages
+
+    @staticmethod
+    def get_system_prompt(agent: Agent, summary: ChatSummary | None) -> str:
+        if not summary:
+            return agent.system_prompt
+        return f"{agent.system_prompt}\n\nSummary of the earlier part of this conversation:\n{summary.text}"
+
+    async def expand_messages(self, messages: list[Message]) -> list[Message]:
+        await self.repo.expand_messages(messages)
+        return messages
 
     @staticmethod
     def format_message_for_llm(message: Message) -> list[ChatCompletionMessageParam]:
@@ -99,120 +186,369 @@ class MessageService:
             return llm_messages
         return message.content  # type: ignore
 
-    async def create_llm_message(
+    @staticmethod
+    def emit(event_type: EventType, data: EventData) -> str:
+        return Event(event_type=event_type, data=data).model_dump_json()
+
+    async def run_turn(
         self,
         agent: Agent,
         chat_id: str,
         current_user_id: str,
         previous_messages: list[Message],
         tool_manager: ToolManager,
+        summary: ChatSummary | None = None,
     ) -> AsyncGenerator[str, Any]:
         last_message = previous_messages[-1]
         if last_message.source == MessageSource.user:
-            message_data = MessageRead.model_validate(last_message)
-            yield Event(event_type=EventType.message_creation, data=message_data).model_dump_json()
-        # Initial LLM message
-        llm_client: OpenAIClient = provider_to_client[agent.provider]
-        conversation = self.get_formatted_messages(previous_messages)
-        llm_stream = await llm_client.stream(
-            model=agent.model, conversation=conversation, tools=tool_manager.tools, system_prompt=agent.system_prompt
+            yield self.emit(EventType.message_creation, MessageRead.model_validate(last_message))
+        state = AgentLoopState(
+            agent=agent,
+            chat_id=chat_id,
+            current_user_id=current_user_id,
+            tool_manager=tool_manager,
+            system_prompt=self.get_system_prompt(agent, summary),
+        )
+        state.base_tokens = token_counter.count_text(state.system_prompt)
+        if tool_manager.tools:
+            state.base_tokens += token_counter.count_tools(tool_manager.tools_json)
+        for message in previous_messages:
+            self.extend_conversation(state, message)
+        for _ in range(settings.AGENT_MAX_ITERATIONS):
+            async with aclosing(self.stream_llm_step(state)) as llm_events:
+                async for event in llm_events:
+                    yield event
+            if not state.tool_calls:
+                return
+            async with aclosing(self.stream_tool_step(state)) as tool_events:
+                async for event in tool_events:
+                    yield event
+        logger.warning(f"Turn in chat {chat_id} hit the limit of {settings.AGENT_MAX_ITERATIONS} LLM calls")
+        raise InternalError("The agent made too many tool calls in a row, the turn was stopped")
+
+    def extend_conversation(self, state: AgentLoopState, message: Message) -> None:
+        entries = self.format_message_for_llm(message)
+        state.conversation.extend(entries)
+        state.conversation_tokens.extend(token_counter.count_messages(message.id, entries))
+
+    @staticmethod
+    def fit_context(state: AgentLoopState) -> tuple[int, int | None]:
+        model = state.agent.model
+        usable_tokens = int(
+            settings.LLM_CONTEXT_LIMITS.get(model, settings.LLM_DEFAULT_CONTEXT_LIMIT)
+            * (1 - settings.LLM_CONTEXT_SAFETY_MARGIN)
+        )
+        max_output_tokens = settings.LLM_MAX_OUTPUT_TOKENS.get(model, settings.LLM_DEFAULT_MAX_OUTPUT_TOKENS)
+        while True:
+            prompt_tokens = state.base_tokens + sum(state.conversation_tokens)
+            available_tokens = usable_tokens - token_counter.estimate(model, prompt_tokens)
+            if available_tokens >= max_output_tokens:
+                # The model's own output limit fits, so the provider's default max_tokens is kept
+                return prompt_tokens, None
+            if available_tokens >= min(max_output_tokens, settings.LLM_MIN_OUTPUT_TOKENS):
+                return prompt_tokens, available_tokens
+            # Whole turns are dropped so an assistant tool call is never separated from its results
+            cut = next(
+                (index for index, entry in enumerate(state.conversation) if index and entry["role"] == "user"), None
+            )
+            if cut is None:
+                raise InvalidData("The conversation is too long for the model's context window")
+            logger.warning(f"Dropping {cut} messages of chat {state.chat_id} to fit the context window of {model}")
+            del state.conversation[:cut]
+            del state.conversation_tokens[:cut]
+
+    async def stream_llm_step(self, state: AgentLoopState) -> AsyncGenerator[str, Any]:
+        prompt_tokens, max_tokens = self.fit_context(state)
+        started_at = time.monotonic()
+        model, llm_stream = await llm_dispatcher.stream(
+            provider=state.agent.provider,
+            model=state.agent.model,
+            conversation=state.conversation,
+            tools=state.tool_manager.tools,
+            system_prompt=state.system_prompt,
+            max_tokens=max_tokens,
+            cache_ttl=settings.LLM_CACHE_AGENT_TTLS.get(state.agent.id, settings.LLM_CACHE_TTL),
         )
         collected_text_message = []
-        tool_calls = []
+        tool_call_runs: list[ToolCallRun] = []
+        streamed_tool_calls: dict[int, StreamedToolCall] = {}
         db_tool_calls: list[ToolCallData] = []
-        async for chunk in llm_stream:
-            if isinstance(chunk, TextChunkData):
-                collected_text_message.append(chunk.content)
-                data = TextChunkData(content=chunk.content)
-                yield Event(event_type=EventType.text_chunk, data=data).model_dump_json()
-                continue
-            for tool_call in chunk:
-                logger.info(tool_call)
-                tool_call_data = tool_manager.format_tool_call(tool_call)
-                yield Event(event_type=EventType.tool_call, data=tool_call_data).model_dump_json()
-                tool_calls.append(tool_call)
-                db_tool_calls.append(tool_call_data)
-        llm_message_text = "".join(collected_text_message) if collected_text_message else None
-        llm_message = await self.repo.create_llm_message(
-            chat_id=chat_id,
-            agent=agent,
-            tool_calls=tool_manager.rename_tool_calls(db_tool_calls),
-            creation_data=MessageCreate(current_user_id=current_user_id, data=MessageCreateData(text=llm_message_text)),
-        )
-        llm_message_data = MessageRead.model_validate(llm_message)
-        yield Event(event_type=EventType.message_creation, data=llm_message_data).model_dump_json()
-        if tool_calls:
-            stream = self.handle_tool_calls(
-                agent=agent,
-                tool_calls=tool_calls,
-                tool_manager=tool_manager,
-                chat_id=chat_id,
-                current_user_id=current_user_id,
-                conversation=previous_messages + [llm_message],
+        usage = None
+        first_chunk_at = None
+        try:
+            async with aclosing(llm_stream):
+                try:
+                    async for chunk in llm_stream:
+                        first_chunk_at = first_chunk_at or time.monotonic()
+                        if isinstance(chunk, UsageData):
+                            usage = chunk
+                            token_counter.calibrate(model, prompt_tokens, usage.prompt_tokens)
+                            continue
+                        if isinstance(chunk, TextChunkData):
+                            collected_text_message.append(chunk.content)
+                            yield self.emit(EventType.text_chunk, TextChunkData(content=chunk.content))
+                            continue
+                        if isinstance(chunk, ToolCallChunkData):
+                            delta = streamed_tool_calls.setdefault(chunk.index, StreamedToolCall()).add(chunk)
+                            if delta:
+                                tool_call_id, name, arguments_delta = delta
+                                tool_call_delta = state.tool_manager.format_tool_call_delta(
+                                    index=chunk.index,
+                                    tool_call_id=tool_call_id,
+                                    name=name,
+                                    arguments_delta=arguments_delta,
+                                )
+                                yield self.emit(EventType.tool_call_delta, tool_call_delta)
+                            continue
+                        truncated = isinstance(chunk, TruncatedToolCallData)
+                        for tool_call in [chunk.tool_call] if isinstance(chunk, TruncatedToolCallData) else chunk:
+                            logger.info(tool_call)
+                            tool_call_data = state.tool_manager.format_tool_call(tool_call)
+                            yield self.emit(EventType.tool_call, tool_call_data)
+                            tool_call_runs.append(self.start_tool_call(state, tool_call, truncated=truncated))
+                            db_tool_calls.append(tool_call_data)
+                except (asyncio.CancelledError, GeneratorExit):
+                    # The text the user already saw is kept, tool calls are dropped as they will never get results
+                    if collected_text_message:
+                        await self.persist_interrupted_turn(
+                            self.repo.create_llm_message(
+                                chat_id=state.chat_id,
+                                agent=state.agent,
+                                model=model,
+                                tool_calls=[],
+                                creation_data=MessageCreate(
+                                    current_user_id=state.current_user_id,
+                                    data=MessageCreateData(text="".join(collected_text_message)),
+                                ),
+                            )
+                        )
+                    raise
+            finished_at = time.monotonic()
+            llm_message_text = "".join(collected_text_message) if collected_text_message else None
+            llm_message = await self.repo.create_llm_message(
+                chat_id=state.chat_id,
+                agent=state.agent,
+                model=model,
+                tool_calls=state.tool_manager.rename_tool_calls(db_tool_calls),
+                creation_data=MessageCreate(
+                    current_user_id=state.current_user_id, data=MessageCreateData(text=llm_message_text)
+                ),
+                usage=usage,
+                ttft_ms=round(((first_chunk_at or finished_at) - started_at) * 1000),
+                latency_ms=round((finished_at - started_at) * 1000),
             )
-            async for new_chunk in stream:
-                yield new_chunk
+            await release_connection(self.repo.session)
+        except BaseException:
+            # Calls started while the LLM was still streaming have no stored assistant message to answer
+            await self.stop_tool_calls(tool_call_runs)
+            raise
+        self.extend_conversation(state, llm_message)
+        state.tool_calls = tool_call_runs
+        yield self.emit(EventType.message_creation, MessageRead.model_validate(llm_message))
 
-    async def handle_tool_calls(
-        self,
-        agent: Agent,
-        tool_calls: list[ChatCompletionMessageToolCall],
-        tool_manager: ToolManager,
-        chat_id: str,
-        current_user_id: str,
-        conversation: list[Message],
-    ) -> AsyncGenerator[str, Any]:
-        call_result_messages = []
-        for tool_call in tool_calls:
-            tool_call_logs: list[DeepResearchLogData | GenericLogData] = []
-            asyncio.create_task(tool_manager.handle_tool_call(tool_call))
-            events = self.procure_tool_call_events(tool_manager)
-            async for event in events:
-                if event.event_type == EventType.tool_call_logs:
-                    yield event.model_dump_json()
-                    tool_call_logs.append(event.data)
-                    continue
-                yield event.model_dump_json()
-                tool_result_message = await self.repo.create_tool_message(
-                    chat_id=chat_id,
-                    agent=agent,
-                    tool_call_id=event.data.tool_call_id,
-                    tool_call_result=json.dumps(event.data.result),
-                    current_user_id=current_user_id,
-                    tool_call_logs=tool_call_logs,
+    @staticmethod
+    def start_tool_call(
+        state: AgentLoopState, tool_call: ChatCompletionMessageToolCall, truncated: bool = False
+    ) -> ToolCallRun:
+        tool_call_run = ToolCallRun(tool_call=tool_call, channel=ToolCallChannel())
+        if truncated:
+            # The model still gets a result for the call, so it can retry with shorter arguments
+            tool_call_run.task = asyncio.create_task(
+                state.tool_manager.reject_tool_call(
+                    tool_call, tool_call_run.channel, "Error: Tool call arguments were cut off"
                 )
-                call_result_messages.append(tool_result_message)
-                message_data = MessageRead.model_validate(tool_result_message)
-                yield Event(event_type=EventType.message_creation, data=message_data).model_dump_json()
+            )
+        elif settings.TOOL_CALL_EARLY_START:
+            # Runs while the LLM is still streaming the remaining calls, events wait in the bounded channel
+            tool_call_run.task = asyncio.create_task(
+                state.tool_manager.handle_tool_call(tool_call, tool_call_run.channel)
+            )
+        return tool_call_run
 
-        # Follow up llm message
-        new_event_stream = self.create_llm_message(
-            agent=agent,
-            chat_id=chat_id,
-            current_user_id=current_user_id,
-            previous_messages=conversation + call_result_messages,
-            tool_manager=tool_manager,
-        )
-        async for new_chunk in new_event_stream:
-            yield new_chunk
+    @staticmethod
+    async def stop_tool_calls(tool_call_runs: list[ToolCallRun]) -> None:
+        for tool_call_run in tool_call_runs:
+            # Unblocks the producer if the client went away before the result was consumed
+            await tool_call_run.channel.close()
+            if tool_call_run.task:
+                await cancel_task(tool_call_run.task)
 
-    async def procure_tool_call_events(self, tool_manager: ToolManager) -> AsyncGenerator[Event, Any]:
+    async def stream_tool_step(self, state: AgentLoopState) -> AsyncGenerator[str, Any]:
+        answered_tool_call_ids: set[str] = set()
+        try:
+            for tool_call_run in state.tool_calls:
+                tool_call = tool_call_run.tool_call
+                tool_call_logs: list[DeepResearchLogData | GenericLogData] = []
+                if not tool_call_run.task:
+                    tool_call_run.task = asyncio.create_task(
+                        state.tool_manager.handle_tool_call(tool_call, tool_call_run.channel)
+                    )
+                # The calls are owned by the turn: they never outlive this step, even if the client disconnects
+                try:
+                    async for event in self.procure_tool_call_events(tool_call_run.channel):
+                        if event.event_type == EventType.tool_call_logs:
+                            yield event.model_dump_json()
+                            tool_call_logs.append(event.data)
+                            continue
+                        yield event.model_dump_json()
+                        tool_result_message = await self.repo.create_tool_message(
+                            chat_id=state.chat_id,
+                            agent=state.agent,
+                            tool_call_id=event.data.tool_call_id,
+                            tool_call_result=json.dumps(event.data.result),
+                            current_user_id=state.current_user_id,
+                            tool_call_logs=tool_call_logs,
+                        )
+                        answered_tool_call_ids.add(tool_call.id)
+                        await release_connection(self.repo.session)
+                        self.extend_conversation(state, tool_result_message)
+                        yield self.emit(EventType.message_creation, MessageRead.model_validate(tool_result_message))
+                finally:
+                    await self.stop_tool_calls([tool_call_run])
+        except (asyncio.CancelledError, GeneratorExit):
+            # Every assistant tool call needs a result, otherwise the chat history is rejected by the provider
+            await self.persist_interrupted_turn(
+                self.create_cancelled_tool_messages(
+                    agent=state.agent,
+                    chat_id=state.chat_id,
+                    current_user_id=state.current_user_id,
+                    tool_call_ids=[
+                        tool_call_run.tool_call.id
+                        for tool_call_run in state.tool_calls
+                        if tool_call_run.tool_call.id not in answered_tool_call_ids
+                    ],
+                )
+            )
+            raise
+        finally:
+            await self.stop_tool_calls(state.tool_calls)
+        state.tool_calls = []
+
+    async def create_cancelled_tool_messages(
+        self, agent: Agent, chat_id: str, current_user_id: str, tool_call_ids: list[str]
+    ) -> None:
+        for tool_call_id in tool_call_ids:
+            await self.repo.create_tool_message(
+                chat_id=chat_id,
+                agent=agent,
+                tool_call_id=tool_call_id,
+                tool_call_result=json.dumps("Error: Tool call was cancelled"),
+                current_user_id=current_user_id,
+                tool_call_logs=[],
+            )
+
+    async def persist_interrupted_turn(self, write: Awaitable[Any]) -> None:
+        # The request is being cancelled, shield the writes so the turn is stored in a consistent state
+        with anyio.CancelScope(shield=True):
+            try:
+                await write
+                await self.repo.session.commit()
+            except Exception as e:
+                logger.error(f"Failed to persist an interrupted turn: {e}")
+
+    async def procure_tool_call_events(self, channel: ToolCallChannel) -> AsyncGenerator[Event, Any]:
         while True:
-            tool_call_event = await tool_manager.queue.get()
+            tool_call_event = await channel.get()
             if isinstance(tool_call_event, ToolCallResult):
                 yield Event(event_type=EventType.tool_call_result, data=tool_call_event)
                 break
             yield Event(event_type=EventType.tool_call_logs, data=tool_call_event)
 
-    async def get_tool_manager(self, query: str, routing_mode: RoutingMode, agent: Agent) -> ToolManager:
-        if routing_mode == RoutingMode.off:
-            servers = await self.server_repo.get_servers_by_agent(agent_id=agent.id)
-        else:
-            registry_servers = await self.registry_client.get_fitting_servers(query=query, routing_mode=routing_mode)
-            await self.server_repo.upsert_servers(servers=registry_servers)
-            string_ids = [str(server.id) for server in registry_servers]
-            servers = await self.server_repo.get_servers_by_ids(server_ids=string_ids)
-        return ToolManager(darp_servers=servers, queue=Queue())
+    async def start_turn(
+        self, chat_id: str, creation_data: MessageCreate, agent: Agent
+    ) -> tuple[ChatSummary | None, list[Message], Message, ToolManager]:
+        async def load_history() -> tuple[ChatSummary | None, list[Message], Message]:
+            summary = await self.get_chat_summary(chat_id=chat_id)
+            previous_messages = await self.get_previous_messages(chat_id=chat_id, summary=summary)
+            message = await self.create_user_message(chat_id=chat_id, creation_data=creation_data, agent=agent)
+            await release_connection(self.repo.session)
+            return summary, previous_messages, message
+
+        query = creation_data.data.text
+        if not query:
+            raise InvalidData("User message must contain text")
+        if creation_data.routing_mode == RoutingMode.off:
+            summary, previous_messages, message = await load_history()
+            tool_manager = await self.get_agent_tool_manager(
+                query=query, agent=agent, previous_messages=previous_messages
+            )
+            return summary, previous_messages, message, tool_manager
+        # Routing only talks to the registry or uses its own session, so it overlaps with the history queries
+        history_task = asyncio.create_task(load_history())
+        try:
+            fitting_servers = await self.get_fitting_servers(query=query, routing_mode=creation_data.routing_mode)
+            summary, previous_messages, message = await history_task
+        finally:
+            # The history queries must not keep using the session once the request unwinds
+            await cancel_task(history_task)
+        tool_manager = await self.get_routed_tool_manager(fitting_servers=fitting_servers)
+        return summary, previous_messages, message, tool_manager
+
+    async def get_agent_tool_manager(self, query: str, agent: Agent, previous_messages: list[Message]) -> ToolManager:
+        catalog = await tool_catalog_cache.get(
+            key=f"agent:{agent.id}",
+            version=await self.server_repo.get_agent_server_versions(agent_id=agent.id),
+            load_servers=lambda: self.server_repo.get_servers_by_agent(agent_id=agent.id),
+        )
+        if not settings.TOOL_SELECTION_ENABLED:
+            return ToolManager(catalog=catalog)
+        tools = tool_selector.select(
+            catalog=catalog,
+            query=query,
+            history=self.get_recent_user_texts(previous_messages),
+            used_tools=self.get_used_tools(previous_messages),
+        )
+        return ToolManager(catalog=catalog, tools=tools)
+
+    async def get_routed_tool_manager(
+        self, fitting_servers: list[RegistryServerSchema] | list[DARPServer]
+    ) -> ToolManager:
+        registry_servers = [server for server in fitting_servers if isinstance(server, RegistryServerSchema)]
+        await self.server_repo.upsert_servers(servers=registry_servers)
+        string_ids = sorted(str(server.id) for server in fitting_servers)
+        catalog = await tool_catalog_cache.get(
+            key=f"servers:{','.join(string_ids)}",
+            version=await self.server_repo.get_server_versions(server_ids=string_ids),
+            load_servers=lambda: self.server_repo.get_servers_by_ids(server_ids=string_ids),
+        )
+        return ToolManager(catalog=catalog)
+
+    async def get_fitting_servers(
+        self, query: str, routing_mode: RoutingMode
+    ) -> list[RegistryServerSchema] | list[DARPServer]:
+        # The local index only ranks servers by the query, other modes are left to the registry
+        local_routing_mode = settings.LOCAL_ROUTING_MODE if routing_mode == RoutingMode.auto else LocalRoutingMode.off
+        if local_routing_mode == LocalRoutingMode.primary:
+            return await local_router.get_fitting_servers(query=query)
+        timeout = settings.REGISTRY_ROUTING_TIMEOUT if local_routing_mode == LocalRoutingMode.fallback else None
+        try:
+            async with asyncio.timeout(timeout):
+                return await self.registry_client.get_fitting_servers(query=query, routing_mode=routing_mode)
+        except (RemoteServerError, HTTPError, TimeoutError) as e:
+            if local_routing_mode != LocalRoutingMode.fallback:
+                raise
+            logger.warning(f"Registry routing failed, falling back to the local index: {e!r}")
+            return await local_router.get_fitting_servers(query=query)
+
+    @staticmethod
+    def get_recent_user_texts(messages: list[Message]) -> list[str]:
+        user_messages = [message for message in messages if message.source == MessageSource.user]
+        return [
+            content["content"]
+            for message in user_messages[-settings.TOOL_SELECTION_HISTORY_TURNS :]
+            for content in message.content
+            if isinstance(content.get("content"), str)
+        ]
+
+    @staticmethod
+    def get_used_tools(messages: list[Message]) -> set[str]:
+        return {
+            tool_call["function"]["name"]
+            for message in messages
+            if message.source == MessageSource.llm
+            for content in message.content
+            for tool_call in content.get("tool_calls") or []
+        }
 
     @classmethod
     def get_new_instance(
@@ -0,0 +1,240 @@
+import asyncio
+import os
+import socket
+from collections import deque
+from collections.abc import AsyncGenerator
+from collections.abc import Callable
+from contextlib import aclosing
+from typing import Any
+
+import anyio
+from fastapi import status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sse_starlette import ServerSentEvent
+
+from ..agents.repository import AgentRepository
+from ..chats.repository import ChatRepository
+from ..darp_servers.registry_client import RegistryClient
+from ..darp_servers.repository import DARPServerRepository
+from .constants import admission_controller
+from .helpers import convert_stream_errors
+from .repository import MessageRepository
+from .schemas import ErrorData
+from .schemas import Event
+from .schemas import TurnData
+from .service import MessageService
+from .types import EventType
+from .types import TurnStatus
+from src.database import manage_stream_session
+from src.database.id import generate_shortid
+from src.database.session import session_maker
+from src.errors import FastApiError
+from src.errors import NotFoundError
+from src.errors import OverloadedError
+from src.logger import logger
+from src.settings import settings
+
+TurnStreamFactory = Callable[[MessageService], AsyncGenerator[str, Any]]
+
+
+class Turn:
+    def __init__(self, chat_id: str, user_id: str, buffer_size: int = settings.TURN_EVENT_BUFFER_SIZE) -> None:
+        self.id = generate_shortid()
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.events: deque[tuple[int, str]] = deque(maxlen=buffer_size)
+        self.next_event_id = 0
+        self.finished = False
+        self.changed = asyncio.Condition()
+        self.subscribers = 0
+        self.task: asyncio.Task | None = None
+        self.abandon_timer: asyncio.TimerHandle | None = None
+
+    async def publish(self, data: str) -> None:
+        async with self.changed:
+            self.events.append((self.next_event_id, data))
+            self.next_event_id += 1
+            self.changed.notify_all()
+
+    async def finish(self) -> None:
+        async with self.changed:
+            self.finished = True
+            self.changed.notify_all()
+
+    async def run(self, stream: AsyncGenerator[str, Any]) -> None:
+        await self.publish(Event(event_type=EventType.turn_started, data=TurnData(turn_id=self.id)).model_dump_json())
+        try:
+            async with aclosing(stream):
+                async for data in stream:
+                    await self.publish(data)
+        except FastApiError as error:
+            error_data = ErrorData(status_code=error.status_code, detail=error.detail)
+            await self.publish(Event(event_type=EventType.error, data=error_data).model_dump_json())
+        finally:
+            await self.finish()
+
+    async def subscribe(self, last_event_id: int | None = None) -> AsyncGenerator[ServerSentEvent, Any]:
+        self._add_subscriber()
+        next_event_id = 0 if last_event_id is None else last_event_id + 1
+        try:
+            while True:
+                async with self.changed:
+                    await self.changed.wait_for(lambda: self.finished or self.next_event_id > next_event_id)
+                    events = [(event_id, data) for event_id, data in self.events if event_id >= next_event_id]
+                    finished = self.finished
+                if events and events[0][0] > next_event_id:
+                    # Skipping the gap would leave the client with a corrupted message, it has to reload it instead
+                    logger.warning(f"Turn {self.id} dropped events {next_event_id}-{events[0][0] - 1} from its buffer")
+                    error_data = ErrorData(
+                        status_code=status.HTTP_410_GONE,
+                        detail=dict(message="Turn events are no longer available, reload the chat messages"),
+                    )
+                    yield ServerSentEvent(data=Event(event_type=EventType.error, data=error_data).model_dump_json())
+                    return
+                for event_id, data in events:
+                    yield ServerSentEvent(data=data, id=str(event_id))
+                    next_event_id = event_id + 1
+                if finished and next_event_id >= self.next_event_id:
+                    return
+        finally:
+            self._remove_subscriber()
+
+    def _add_subscriber(self) -> None:
+        self.subscribers += 1
+        if self.abandon_timer:
+            self.abandon_timer.cancel()
+            self.abandon_timer = None
+
+    def _remove_subscriber(self) -> None:
+        self.subscribers -= 1
+        if self.subscribers == 0 and not self.finished and settings.TURN_ABANDON_TIMEOUT is not None:
+            # Give the client a chance to reconnect before the turn's work is cancelled
+            self.abandon_timer = asyncio.get_running_loop().call_later(settings.TURN_ABANDON_TIMEOUT, self._abandon)
+
+    def _abandon(self) -> None:
+        self.abandon_timer = None
+        if self.subscribers == 0 and self.task and not self.task.done():
+            logger.info(f"Cancelling turn {self.id} of chat {self.chat_id}, no clients are listening")
+            self.task.cancel()
+
+
+class TurnRunner:
+    def __init__(
+        self,
+        max_concurrent_turns: int = settings.TURN_MAX_CONCURRENT,
+        drain_timeout: float = settings.TURN_DRAIN_TIMEOUT,
+        record_jobs: bool = settings.TURN_JOBS_TABLE,
+    ) -> None:
+        self.max_concurrent_turns = max_concurrent_turns
+        self.drain_timeout = drain_timeout
+        self.record_jobs = record_jobs
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.accepting = True
+        self.reserved = 0
+        self.tasks: set[asyncio.Task] = set()
+
+    def reserve(self) -> None:
+        if not self.accepting:
+            raise OverloadedError("Server is restarting, try again later")
+        if len(self.tasks) + self.reserved >= self.max_concurrent_turns:
+            logger.warning(f"Worker {self.worker_id} is running {len(self.tasks)} turns, rejecting a new one")
+            raise OverloadedError()
+        self.reserved += 1
+
+    def release_reservation(self) -> None:
+        self.reserved -= 1
+
+    def submit(self, turn: Turn, create_stream: TurnStreamFactory) -> asyncio.Task:
+        self.reserved -= 1
+        # Started eagerly so execute is inside its try before anyone can cancel it, its cleanup always runs
+        task = asyncio.Task(self.execute(turn, create_stream), loop=asyncio.get_running_loop(), eager_start=True)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def execute(self, turn: Turn, create_stream: TurnStreamFactory) -> None:
+        try:
+            await self.record_job(turn, TurnStatus.running)
+            # The request's session is committed and closed when the response starts, the turn outlives it
+            session = session_maker()
+            stream = convert_stream_errors(create_stream(self.create_service(session)))
+            await turn.run(manage_stream_session(stream, session))
+        except asyncio.CancelledError:
+            await self.record_job(turn, TurnStatus.interrupted if not self.accepting else TurnStatus.cancelled)
+            raise
+        except Exception as e:
+            logger.error(f"Turn {turn.id} failed: {e!r}")
+            await self.record_job(turn, TurnStatus.failed)
+            return
+        finally:
+            # A turn cancelled before its stream started would otherwise keep the permit and its subscribers waiting
+            admission_controller.release(turn.user_id)
+            await turn.finish()
+        await self.record_job(turn, TurnStatus.finished)
+
+    @staticmethod
+    def create_service(session: AsyncSession) -> MessageService:
+        return MessageService(
+            repo=MessageRepository(session),
+            chat_repo=ChatRepository(session),
+            agent_repo=AgentRepository(session),
+            server_repo=DARPServerRepository(session),
+            registry_client=RegistryClient.get_new_instance(),
+        )
+
+    async def record_job(self, turn: Turn, status: TurnStatus) -> None:
+        if not self.record_jobs:
+            return
+        with anyio.CancelScope(shield=True):
+            try:
+                async with session_maker() as session:
+                    await MessageRepository(session).upsert_turn_job(
+                        turn_id=turn.id,
+                        chat_id=turn.chat_id,
+                        user_id=turn.user_id,
+                        status=status,
+                        worker_id=self.worker_id,
+                    )
+                    await session.commit()
+            except Exception as e:
+                logger.error(f"Failed to record status {status} of turn {turn.id}: {e}")
+
+    async def drain(self) -> None:
+        self.accepting = False
+        if not self.tasks:
+            return
+        logger.info(f"Waiting up to {self.drain_timeout}s for {len(self.tasks)} running turns")
+        _, pending = await asyncio.wait(set(self.tasks), timeout=self.drain_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            # Cancelled turns still persist their partial results before finishing
+            await asyncio.wait(pending)
+
+
+class TurnRegistry:
+    def __init__(self, runner: TurnRunner, retention: float = settings.TURN_RETENTION) -> None:
+        self.runner = runner
+        self.retention = retention
+        self.turns: dict[str, Turn] = {}
+
+    def start(self, chat_id: str, user_id: str, create_stream: TurnStreamFactory) -> Turn:
+        turn = Turn(chat_id=chat_id, user_id=user_id)
+        self.turns[turn.id] = turn
+        turn.task = self.runner.submit(turn, create_stream)
+        turn.task.add_done_callback(lambda _: self._schedule_removal(turn.id))
+        return turn
+
+    def get_turn(self, turn_id: str, chat_id: str, user_id: str) -> Turn:
+        turn = self.turns.get(turn_id)
+        if not turn or turn.chat_id != chat_id or turn.user_id != user_id:
+            raise NotFoundError("Turn with this id does not exist or has expired")
+        return turn
+
+    def _schedule_removal(self, turn_id: str) -> None:
+        # Finished turns stay replayable for a while so late reconnects still get the tail of the stream
+        asyncio.get_running_loop().call_later(self.retention, self.turns.pop, turn_id, None)
+
+
+turn_runner = TurnRunner()
+turn_registry = TurnRegistry(runner=turn_runner)
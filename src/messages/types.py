@@ -8,8 +8,10 @@ class MessageSource(StrEnum):
 
 
 class EventType(StrEnum):
+    turn_started = "turn_started"
     message_creation = "message_creation"
     text_chunk = "text_chunk"
+    tool_call_delta = "tool_call_delta"
     tool_call = "tool_call"
     tool_call_logs = "tool_call_logs"
     tool_call_result = "tool_call_result"
@@ -19,3 +21,11 @@ class EventType(StrEnum):
 class DeepResearchLogEvent(StrEnum):
     stage_started = "stage_started"
     stage_finished = "stage_finished"
+
+
+class TurnStatus(StrEnum):
+    running = "running"
+    finished = "finished"
+    failed = "failed"
+    cancelled = "cancelled"
+    interrupted = "interrupted"
@@ -0,0 +1,15 @@
+summary_prompt = """\
+You maintain a running summary of a conversation between a user and an AI agent that can call tools.
+
+You receive the current summary (possibly empty) and a transcript of the conversation turns that follow it.
+Produce a new summary that replaces the current one and covers both.
+
+Keep:
+- The user's goals, requirements, preferences and constraints
+- Decisions made and conclusions reached
+- Facts, numbers, names, URLs and identifiers obtained from tool results that may be needed later
+- Open questions and unfinished tasks
+
+Drop greetings, repetition and raw tool output that has no lasting value.
+Write in the language of the conversation, as plain prose with short paragraphs, without any preamble.\
+"""
@@ -9,7 +9,7 @@ from fastapi_pagination.ext.sqlalchemy import paginate
 from sqlalchemy import Select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database import get_session
+from src.database import get_read_session
 from src.database import Report
 from src.reports.schemas import ReportCreateSchema
 from src.reports.schemas import ReportReadSchema
@@ -30,7 +30,7 @@ async def get_reports(
         default=None,
     ),
     service: ReportService = Depends(ReportService.get_new_instance),
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
 ) -> Page[ReportReadSchema]:
     query: Select = await service.get_reports(creator_id=creator_id)
     return await paginate(
@@ -1,10 +1,25 @@
 from pathlib import Path
 
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings
 from pydantic_settings import SettingsConfigDict
 
+from .types import ChannelOverflowPolicy
+from .types import DBPoolMode
 from .types import Environment
 from .types import LLMModel
+from .types import LLMProvider
+from .types import LocalRoutingMode
+
+
+class LLMPoolConfig(BaseModel):
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30
+    http2: bool = False
+    connect_timeout: float = 5
+    first_byte_timeout: float = 20
+    chunk_timeout: float = 20
 
 
 class Settings(BaseSettings):
@@ -15,16 +30,49 @@ class Settings(BaseSettings):
     PROXY: str | None = None
     API_PORT: int
     REGISTRY_URL: str = "http://registry:80"
+    REGISTRY_ROUTING_TIMEOUT: float = 30
+    LOCAL_ROUTING_MODE: LocalRoutingMode = LocalRoutingMode.fallback
+    LOCAL_ROUTING_TOP_K: int = 5
 
     PG_USER: str
     PG_PASSWORD: str
     PG_DB: str = "portal_backend"
     PG_HOST: str = "portal_postgres"
     PG_PORT: int = 5432
+    PG_REPLICA_HOST: str | None = None
+    PG_REPLICA_PORT: int = 5432
 
+    DB_POOL_MODE: DBPoolMode = DBPoolMode.app
     DB_POOL_SIZE: int = 50
     DB_MAX_OVERFLOW: int = 25
+    DB_STREAM_SHORT_TRANSACTIONS: bool = True
+    DB_REPLICA_CONNECT_TIMEOUT: float = 2
+    DB_REPLICA_READ_YOUR_WRITES_WINDOW: float = 5
     LOG_LEVEL: str = "INFO"
+    MESSAGE_PAYLOAD_INLINE_LIMIT: int = 16384
+
+    CONTEXT_COMPACTION_ENABLED: bool = True
+    CONTEXT_KEEP_TURNS: int = 10
+    CONTEXT_COMPACTION_BATCH_TURNS: int = 5
+    CONTEXT_SUMMARY_MODEL: LLMModel = "anthropic/claude-3.5-haiku"
+    CONTEXT_SUMMARY_TOOL_RESULT_CHARS: int = 4000
+
+    AGENT_MAX_ITERATIONS: int = 25
+    TURN_EVENT_BUFFER_SIZE: int = 2000
+    # None keeps turns running to completion after every client has disconnected
+    TURN_ABANDON_TIMEOUT: float | None = 30
+    TURN_RETENTION: float = 120
+    TURN_MAX_CONCURRENT: int = 100
+    TURN_DRAIN_TIMEOUT: float = 60
+    TURN_JOBS_TABLE: bool = False
+    TOOL_CALL_CHANNEL_SIZE: int = 256
+    TOOL_CALL_CHANNEL_OVERFLOW: ChannelOverflowPolicy = ChannelOverflowPolicy.drop_oldest
+    TOOL_CALL_EARLY_START: bool = True
+    TOOL_SELECTION_ENABLED: bool = True
+    TOOL_SELECTION_TOP_K: int = 15
+    TOOL_SELECTION_MIN_TOOLS: int = 30
+    TOOL_SELECTION_HISTORY_TURNS: int = 3
+    TOOL_SELECTION_HISTORY_WEIGHT: float = 0.5
 
     DEFAULT_LLM_MODEL: LLMModel = "anthropic/claude-3.7-sonnet"
     DEFAULT_AVATAR_URL: str = (
@@ -35,6 +83,43 @@ class Settings(BaseSettings):
     DEFAULT_AGENT_DESCRIPTION: str = "Default agent"
 
     OPENROUTER_API_KEY: str
+    LLM_POOL_DEFAULT: LLMPoolConfig = LLMPoolConfig()
+    LLM_POOLS: dict[LLMProvider, LLMPoolConfig] = {}
+    LLM_MAX_RETRIES: int = 2
+    LLM_RETRY_BASE_DELAY: float = 0.5
+    LLM_RETRY_MAX_DELAY: float = 4
+    LLM_HEDGE_DELAY: float | None = None
+    LLM_FALLBACK_MODELS: dict[str, list[LLMModel]] = {}
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    LLM_CIRCUIT_RESET_TIMEOUT: float = 30
+    # Every stream holds a DB session, keep the ceiling below DB_POOL_SIZE + DB_MAX_OVERFLOW
+    LLM_ADMISSION_MAX_CONCURRENCY: int = 70
+    LLM_ADMISSION_MIN_CONCURRENCY: int = 5
+    LLM_ADMISSION_PER_USER: int = 3
+    LLM_ADMISSION_QUEUE_SIZE: int = 100
+    LLM_ADMISSION_QUEUE_TIMEOUT: float = 10
+    LLM_ADMISSION_LATENCY_TARGET: float = 15
+    RETRY_AFTER: int = 5
+
+    LLM_CACHE_ENABLED: bool = False
+    LLM_CACHE_MAX_ENTRIES: int = 1000
+    LLM_CACHE_DIR: Path | None = None
+    LLM_CACHE_TTL: int = 0
+    LLM_CACHE_AGENT_TTLS: dict[str, int] = {}
+
+    LLM_CONTEXT_LIMITS: dict[str, int] = {
+        "anthropic/claude-3.7-sonnet": 200000,
+        "anthropic/claude-3.5-haiku": 200000,
+        "deepseek/deepseek-chat-v3-0324": 163840,
+    }
+    LLM_DEFAULT_CONTEXT_LIMIT: int = 128000
+    # Output the window must leave room for, max_tokens is only sent when less than this is left
+    LLM_MAX_OUTPUT_TOKENS: dict[str, int] = {}
+    LLM_DEFAULT_MAX_OUTPUT_TOKENS: int = 8192
+    LLM_MIN_OUTPUT_TOKENS: int = 1024
+    # Headroom for local token counts being lower than the provider's
+    LLM_CONTEXT_SAFETY_MARGIN: float = 0.05
+    TOKEN_COUNT_CACHE_SIZE: int = 50000
 
     S3_ACCESS: str
     S3_SECRET: str
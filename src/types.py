@@ -7,6 +7,23 @@ class Environment(StrEnum):
     deployed = "deployed"
 
 
+class DBPoolMode(StrEnum):
+    app = "app"
+    pgbouncer = "pgbouncer"
+
+
+class ChannelOverflowPolicy(StrEnum):
+    block = "block"
+    drop_oldest = "drop_oldest"
+    coalesce = "coalesce"
+
+
+class LocalRoutingMode(StrEnum):
+    off = "off"
+    fallback = "fallback"
+    primary = "primary"
+
+
 class LLMProvider(StrEnum):
     openrouter = "OpenRouter"
 
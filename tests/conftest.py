@@ -0,0 +1,15 @@
+import os
+
+# Settings are read at import time, the values only need to exist as no test talks to real services
+for name, value in dict(
+    API_PORT="8000",
+    PG_USER="test",
+    PG_PASSWORD="test",
+    OPENROUTER_API_KEY="test",
+    S3_ACCESS="test",
+    S3_SECRET="test",
+    S3_BUCKET="test",
+    S3_HOST="test",
+    CDN_BASE_URL="test",
+).items():
+    os.environ.setdefault(name, value)
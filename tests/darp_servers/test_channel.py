@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from src.darp_servers.channel import ToolCallChannel
+from src.darp_servers.channel import ToolCallChannelClosedError
+from src.darp_servers.channel import ToolCallEvent
+from src.messages.schemas import DeepResearchLogData
+from src.messages.schemas import DeepResearchStageStart
+from src.messages.schemas import GenericLogData
+from src.messages.schemas import ToolCallResult
+from src.messages.types import DeepResearchLogEvent
+from src.types import ChannelOverflowPolicy
+
+
+async def test_close_wakes_a_blocked_consumer() -> None:
+    channel = ToolCallChannel()
+    consumer = asyncio.create_task(channel.get())
+    await asyncio.sleep(0)
+
+    await channel.close()
+
+    with pytest.raises(ToolCallChannelClosedError):
+        await asyncio.wait_for(consumer, timeout=1)
+
+
+def create_log(index: int) -> GenericLogData:
+    return GenericLogData(data=f"log {index}")
+
+
+def create_stage(title: str) -> DeepResearchLogData:
+    return DeepResearchLogData(
+        event_type=DeepResearchLogEvent.stage_started,
+        data=DeepResearchStageStart(title=title),
+        origin="darp/deepresearch",
+    )
+
+
+def create_result() -> ToolCallResult:
+    return ToolCallResult(tool_call_id="call_1", server_id=1, tool_name="lookup", result="ok", success=True)
+
+
+async def put_all(channel: ToolCallChannel, items: list[ToolCallEvent]) -> None:
+    for item in items:
+        await asyncio.wait_for(channel.put(item), timeout=1)
+
+
+async def test_block_waits_for_the_consumer() -> None:
+    channel = ToolCallChannel(max_size=2, overflow_policy=ChannelOverflowPolicy.block)
+    await put_all(channel, [create_log(0), create_log(1)])
+    producer = asyncio.create_task(channel.put(create_log(2)))
+    await asyncio.sleep(0.01)
+    assert not producer.done()
+
+    assert await channel.get() == create_log(0)
+    await asyncio.wait_for(producer, timeout=1)
+
+    assert list(channel.items) == [create_log(1), create_log(2)]
+    assert channel.dropped == 0
+
+
+async def test_drop_oldest_only_evicts_generic_logs() -> None:
+    channel = ToolCallChannel(max_size=3, overflow_policy=ChannelOverflowPolicy.drop_oldest)
+    await put_all(channel, [create_stage("search"), create_log(0), create_log(1), create_log(2), create_log(3)])
+
+    assert list(channel.items) == [create_stage("search"), create_log(2), create_log(3)]
+    assert channel.dropped == 2
+
+
+async def test_coalesce_keeps_the_latest_of_consecutive_logs() -> None:
+    channel = ToolCallChannel(max_size=2, overflow_policy=ChannelOverflowPolicy.coalesce)
+    await put_all(channel, [create_stage("search"), create_log(0), create_log(1), create_log(2)])
+
+    assert list(channel.items) == [create_stage("search"), create_log(2)]
+    assert channel.dropped == 2
+
+
+@pytest.mark.parametrize("overflow_policy", list(ChannelOverflowPolicy))
+async def test_results_and_stages_are_never_dropped(overflow_policy: ChannelOverflowPolicy) -> None:
+    channel = ToolCallChannel(max_size=1, overflow_policy=overflow_policy)
+    await put_all(channel, [create_stage("search")])
+    producer = asyncio.create_task(put_all(channel, [create_log(0), create_result()]))
+
+    # Nothing in a full channel can be evicted for them, the producer waits instead
+    received = [await asyncio.wait_for(channel.get(), timeout=1) for _ in range(3)]
+    await producer
+
+    assert received == [create_stage("search"), create_log(0), create_result()]
+
+
+async def test_close_releases_blocked_producers() -> None:
+    channel = ToolCallChannel(max_size=1, overflow_policy=ChannelOverflowPolicy.block)
+    await put_all(channel, [create_log(0)])
+    producer = asyncio.create_task(channel.put(create_result()))
+    await asyncio.sleep(0)
+
+    await channel.close()
+    await asyncio.wait_for(producer, timeout=1)
+    await channel.put(create_log(1))
+
+    assert not channel.items
@@ -0,0 +1,49 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+from openai.types.chat import ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+
+from src.darp_servers.catalog import ToolCatalog
+from src.darp_servers.channel import ToolCallChannel
+from src.darp_servers.manager import ToolManager
+from src.messages.schemas import ToolCallResult
+
+
+def create_tool_manager(transport_protocol: str) -> ToolManager:
+    server = SimpleNamespace(
+        id="1",
+        name="weather",
+        url="http://weather",
+        logo=None,
+        transport_protocol=transport_protocol,
+        updated_at=datetime(2025, 1, 1),
+        tools=[dict(name="lookup", description="Lookup", input_schema={})],
+    )
+    return ToolManager(ToolCatalog.build([server]))  # type: ignore
+
+
+def create_tool_call(name: str) -> ChatCompletionMessageToolCall:
+    return ChatCompletionMessageToolCall(id="call_1", type="function", function=Function(name=name, arguments="{}"))
+
+
+async def handle(tool_manager: ToolManager, tool_call: ChatCompletionMessageToolCall) -> ToolCallResult:
+    channel = ToolCallChannel()
+    await tool_manager.handle_tool_call(tool_call, channel)
+    result = await asyncio.wait_for(channel.get(), timeout=1)
+    assert isinstance(result, ToolCallResult)
+    return result
+
+
+async def test_unknown_tool_gets_a_failed_result() -> None:
+    result = await handle(create_tool_manager("SSE"), create_tool_call("missing"))
+
+    assert (result.tool_call_id, result.result, result.success) == ("call_1", "Error: Incorrect tool name", False)
+
+
+async def test_unsupported_transport_gets_a_failed_result() -> None:
+    result = await handle(create_tool_manager("WEBSOCKET"), create_tool_call("lookup__weather"))
+
+    assert (result.tool_call_id, result.server_id, result.success) == ("call_1", 1, False)
+    assert result.result == "Error: Tool call failed"
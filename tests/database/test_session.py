@@ -0,0 +1,116 @@
+import asyncio
+from collections.abc import AsyncGenerator
+from typing import Any
+
+import pytest
+
+from src.database.session import manage_stream_session
+from src.database.session import release_connection
+from src.errors import InternalError
+from src.settings import settings
+
+POOL_SIZE = 2
+STREAMS = 8
+
+
+class FakePool:
+    def __init__(self, size: int) -> None:
+        self.connections = asyncio.Semaphore(size)
+        self.checked_out = 0
+
+    async def checkout(self) -> None:
+        # Like pool_timeout, a stream sitting on its connection makes the others fail instead of hang
+        async with asyncio.timeout(1):
+            await self.connections.acquire()
+        self.checked_out += 1
+
+    def checkin(self) -> None:
+        self.connections.release()
+        self.checked_out -= 1
+
+
+class FakeSession:
+    def __init__(self, pool: FakePool) -> None:
+        self.pool = pool
+        self.in_transaction = False
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = False
+
+    async def execute(self) -> None:
+        if not self.in_transaction:
+            await self.pool.checkout()
+            self.in_transaction = True
+
+    async def commit(self) -> None:
+        self.commits += 1
+        self.end_transaction()
+
+    async def rollback(self) -> None:
+        self.rollbacks += 1
+        self.end_transaction()
+
+    async def close(self) -> None:
+        self.end_transaction()
+        self.closed = True
+
+    def end_transaction(self) -> None:
+        if self.in_transaction:
+            self.pool.checkin()
+            self.in_transaction = False
+
+
+@pytest.fixture(autouse=True)
+def short_transactions(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "DB_STREAM_SHORT_TRANSACTIONS", True)
+
+
+async def test_streams_outnumbering_the_pool_do_not_hold_connections() -> None:
+    pool = FakePool(POOL_SIZE)
+    streaming = asyncio.Barrier(STREAMS)
+
+    async def stream(session: FakeSession) -> AsyncGenerator[str, Any]:
+        # The transaction of the request's writes was committed before the first chunk
+        assert not session.in_transaction
+        # Every stream waits on the network at the same time, only possible if none of them keeps a connection
+        await streaming.wait()
+        assert pool.checked_out == 0
+        yield "text"
+        await session.execute()
+        await release_connection(session)
+        assert not session.in_transaction
+        yield "message"
+
+    async def run_request() -> tuple[list[str], FakeSession]:
+        session = FakeSession(pool)
+        # The user message is written before the stream starts
+        await session.execute()
+        chunks = [chunk async for chunk in manage_stream_session(stream(session), session)]
+        return chunks, session
+
+    results = await asyncio.wait_for(asyncio.gather(*(run_request() for _ in range(STREAMS))), timeout=5)
+
+    for chunks, session in results:
+        assert chunks == ["text", "message"]
+        # The early commit, the one after the mid stream write and the final one
+        assert session.commits == 3
+        assert session.closed
+    assert pool.checked_out == 0
+
+
+async def test_failed_stream_is_rolled_back_and_returns_its_connection() -> None:
+    pool = FakePool(POOL_SIZE)
+    session = FakeSession(pool)
+
+    async def stream() -> AsyncGenerator[str, Any]:
+        yield "text"
+        await session.execute()
+        raise ValueError("LLM stream broke")
+
+    with pytest.raises(InternalError):
+        async for _ in manage_stream_session(stream(), session):
+            pass
+
+    assert session.rollbacks == 1
+    assert session.closed
+    assert pool.checked_out == 0
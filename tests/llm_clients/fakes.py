@@ -0,0 +1,83 @@
+import asyncio
+import json
+from collections.abc import AsyncGenerator
+from enum import StrEnum
+from typing import Any
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+from src.llm_clients import LLMUnavailableError
+from src.llm_clients import TextChunkData
+from src.llm_clients.exceptions import LLMRateLimitError
+
+
+class Fault(StrEnum):
+    unavailable = "unavailable"
+    rate_limited = "rate_limited"
+    # The request goes through but the stream breaks or never sends its first item
+    broken = "broken"
+    stalled = "stalled"
+
+
+class FaultyClient:
+    def __init__(self, *faults: Fault | None) -> None:
+        # One fault per request in order, requests past the list succeed
+        self.faults = list(faults)
+        self.requests: list[str] = []
+        self.open_streams = 0
+
+    async def stream(self, model: str, **_) -> AsyncGenerator[TextChunkData, Any]:
+        self.requests.append(model)
+        fault = self.faults.pop(0) if self.faults else None
+        if fault == Fault.unavailable:
+            raise LLMUnavailableError()
+        if fault == Fault.rate_limited:
+            raise LLMRateLimitError()
+        return self.generate(model, fault)
+
+    async def generate(self, model: str, fault: Fault | None) -> AsyncGenerator[TextChunkData, Any]:
+        self.open_streams += 1
+        try:
+            if fault == Fault.stalled:
+                await asyncio.Event().wait()
+            if fault == Fault.broken:
+                raise LLMUnavailableError("LLM request timed out")
+            yield TextChunkData(content=f"{model} ")
+            yield TextChunkData(content="answer")
+        finally:
+            self.open_streams -= 1
+
+
+def create_chunk(delta: dict | None, finish_reason: str | None = None, usage: dict | None = None) -> dict:
+    choices = [dict(index=0, delta=delta, finish_reason=finish_reason)] if delta is not None else []
+    return dict(id="fake", object="chat.completion.chunk", created=0, model="fake", choices=choices, usage=usage)
+
+
+def create_text_stream(tokens: int) -> list[dict]:
+    # An assistant message opening, one chunk per token, the finish reason and a usage only chunk
+    chunks = [create_chunk(dict(role="assistant", content=""))]
+    chunks += [create_chunk(dict(content=f"token{index} ")) for index in range(tokens)]
+    chunks.append(create_chunk(dict(), finish_reason="stop"))
+    chunks.append(create_chunk(None, usage=dict(prompt_tokens=10, completion_tokens=tokens, total_tokens=10 + tokens)))
+    return chunks
+
+
+async def replay(chunks: list[dict], stall: float, stall_at: int) -> AsyncGenerator[str, Any]:
+    for index, chunk in enumerate(chunks):
+        if index == stall_at:
+            # Headers are already sent, so at 0 this is a stall before the first byte of the body
+            await asyncio.sleep(stall)
+        yield f"data: {json.dumps(chunk)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+def create_fake_llm(text_tokens: int, stall: float = 0, stall_at: int = 0) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/chat/completions")
+    async def chat_completions() -> StreamingResponse:
+        chunks = create_text_stream(text_tokens)
+        return StreamingResponse(replay(chunks, stall, stall_at), media_type="text/event-stream")
+
+    return app
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from src.errors import OverloadedError
+from src.llm_clients import AdmissionController
+
+
+async def queue(admission_controller: AdmissionController, user_id: str) -> asyncio.Task:
+    task = asyncio.create_task(admission_controller.acquire(user_id))
+    while not admission_controller.waiters:
+        await asyncio.sleep(0)
+    return task
+
+
+def assert_idle(admission_controller: AdmissionController) -> None:
+    assert admission_controller.active == 0
+    assert not admission_controller.user_counts
+    assert not admission_controller.waiters
+
+
+async def test_release_hands_the_permit_to_the_next_waiter() -> None:
+    admission_controller = AdmissionController(max_concurrency=1)
+    await admission_controller.acquire("first")
+    task = await queue(admission_controller, "second")
+
+    admission_controller.release("first")
+    await task
+
+    assert admission_controller.active == 1
+    admission_controller.release("second")
+    assert_idle(admission_controller)
+
+
+async def test_queue_timeout() -> None:
+    admission_controller = AdmissionController(max_concurrency=1, queue_timeout=0.05)
+    await admission_controller.acquire("first")
+
+    with pytest.raises(OverloadedError):
+        await admission_controller.acquire("second")
+
+    admission_controller.release("first")
+    assert_idle(admission_controller)
+
+
+async def test_full_queue_is_rejected() -> None:
+    admission_controller = AdmissionController(max_concurrency=1, queue_size=1)
+    await admission_controller.acquire("first")
+    task = await queue(admission_controller, "second")
+
+    with pytest.raises(OverloadedError):
+        await admission_controller.acquire("third")
+
+    admission_controller.release("first")
+    await task
+    admission_controller.release("second")
+    assert_idle(admission_controller)
+
+
+async def test_cancelled_waiter_releases_nothing() -> None:
+    admission_controller = AdmissionController(max_concurrency=1)
+    await admission_controller.acquire("first")
+    task = await queue(admission_controller, "second")
+
+    task.cancel()
+    # The waiter is cancelled right away, the release runs before the task gets to clean up
+    admission_controller.release("first")
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert_idle(admission_controller)
+
+
+async def test_latency_wake_up_skips_a_cancelled_waiter() -> None:
+    admission_controller = AdmissionController(min_concurrency=1, max_concurrency=2)
+    admission_controller.limit = 1
+    await admission_controller.acquire("first")
+    cancelled = await queue(admission_controller, "second")
+    waiting = asyncio.create_task(admission_controller.acquire("third"))
+    await asyncio.sleep(0)
+
+    cancelled.cancel()
+    admission_controller.record_latency(0)
+    await waiting
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+
+    assert admission_controller.active == 2
+    assert dict(admission_controller.user_counts) == dict(first=1, third=1)
+
+
+async def test_per_user_limit_counts_queued_requests() -> None:
+    admission_controller = AdmissionController(max_concurrency=1, per_user_concurrency=2)
+    await admission_controller.acquire("user")
+    task = await queue(admission_controller, "user")
+
+    with pytest.raises(OverloadedError):
+        await admission_controller.acquire("user")
+
+    admission_controller.release("user")
+    await task
+    admission_controller.release("user")
+    assert_idle(admission_controller)
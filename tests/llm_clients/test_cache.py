@@ -0,0 +1,24 @@
+from openai.types.chat import ChatCompletionChunk
+
+from .fakes import create_text_stream
+from src.llm_clients import OpenAIClient
+from src.llm_clients import TextChunkData
+from src.llm_clients import UsageData
+from src.llm_clients.cache import ResponseCache
+
+REQUEST = dict(model="fake", conversation=[dict(role="user", content="Hi")])
+
+
+async def test_cache_hit_replays_the_answer_without_its_usage() -> None:
+    cache = ResponseCache(max_entries=10)
+    chunks = [ChatCompletionChunk.model_validate(chunk) for chunk in create_text_stream(3)]
+    key = cache.get_key(system_prompt=None, max_tokens=None, tools=None, tool_choice="auto", **REQUEST)
+    await cache.set(key, chunks, ttl=60)
+    client = OpenAIClient(api_key="test", response_cache=cache)
+
+    items = [item async for item in await client.stream(cache_ttl=60, **REQUEST)]  # type: ignore
+
+    assert "".join(item.content for item in items if isinstance(item, TextChunkData)) == "token0 token1 token2 "
+    assert not any(isinstance(item, UsageData) for item in items)
+    # The stored entry itself keeps the usage
+    assert (await cache.get(key))[-1].usage  # type: ignore
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from .fakes import Fault
+from .fakes import FaultyClient
+from src.llm_clients import AdmissionController
+from src.llm_clients import LLMDispatcher
+from src.llm_clients import LLMUnavailableError
+from src.settings import settings
+from src.types import LLMProvider
+
+PROVIDER = LLMProvider.openrouter
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_DELAY", 0)
+
+
+def create_dispatcher(client: FaultyClient, hedge_delay: float | None = None, **options) -> LLMDispatcher:
+    return LLMDispatcher(
+        clients={PROVIDER: client},  # type: ignore
+        model_to_provider={"fallback": PROVIDER},
+        fallback_models={"primary": ["fallback"]},
+        hedge_delay=hedge_delay,
+        **options,
+    )
+
+
+async def read(dispatcher: LLMDispatcher) -> str:
+    model, stream = await dispatcher.stream(provider=PROVIDER, model="primary", conversation=[])
+    answer = "".join([item.content async for item in stream])  # type: ignore
+    assert answer.startswith(f"{model} ")
+    return answer
+
+
+async def test_retries_then_fails_over_to_the_fallback_model() -> None:
+    client = FaultyClient(Fault.unavailable, Fault.broken)
+    admission_controller = AdmissionController(max_concurrency=10)
+
+    answer = await read(create_dispatcher(client, max_retries=1, admission_controller=admission_controller))
+
+    assert answer == "fallback answer"
+    assert client.requests == ["primary", "primary", "fallback"]
+    assert client.open_streams == 0
+
+
+async def test_rate_limits_lower_the_admission_limit() -> None:
+    client = FaultyClient(Fault.rate_limited)
+    admission_controller = AdmissionController(min_concurrency=1, max_concurrency=10)
+
+    await read(create_dispatcher(client, max_retries=1, admission_controller=admission_controller))
+
+    assert admission_controller.limit < 10
+
+
+async def test_raises_when_every_model_fails() -> None:
+    client = FaultyClient(*[Fault.unavailable] * 4)
+
+    with pytest.raises(LLMUnavailableError):
+        await read(create_dispatcher(client, max_retries=1))
+
+    assert client.requests == ["primary", "primary", "fallback", "fallback"]
+
+
+async def test_open_circuit_skips_the_model() -> None:
+    client = FaultyClient(*[Fault.unavailable] * settings.LLM_CIRCUIT_FAILURE_THRESHOLD)
+    dispatcher = create_dispatcher(client, max_retries=settings.LLM_CIRCUIT_FAILURE_THRESHOLD)
+    await read(dispatcher)
+    client.requests.clear()
+
+    assert await read(dispatcher) == "fallback answer"
+    assert client.requests == ["fallback"]
+
+
+async def test_hedged_request_wins_over_a_stalled_one() -> None:
+    client = FaultyClient(Fault.stalled)
+
+    answer = await asyncio.wait_for(read(create_dispatcher(client, hedge_delay=0.05)), timeout=1)
+
+    assert answer == "primary answer"
+    assert client.requests == ["primary", "primary"]
+    # The stalled request was cancelled, not left waiting on the provider
+    assert client.open_streams == 0
+    assert asyncio.all_tasks() == {asyncio.current_task()}
+
+
+async def test_failed_hedge_waits_for_the_original_request() -> None:
+    client = FaultyClient(None, Fault.broken)
+    dispatcher = create_dispatcher(client, hedge_delay=0)
+
+    assert await read(dispatcher) == "primary answer"
+    assert client.open_streams == 0
+
+
+@pytest.mark.parametrize("faults", [[Fault.stalled], [Fault.stalled, Fault.stalled]])
+async def test_cancelled_caller_stops_every_request(faults: list[Fault]) -> None:
+    client = FaultyClient(*faults)
+    # The first case is cancelled while waiting for the hedge delay, the second while both requests run
+    dispatcher = create_dispatcher(client, hedge_delay=0.5 if len(faults) == 1 else 0.01)
+    caller = asyncio.create_task(read(dispatcher))
+    await asyncio.sleep(0.1)
+    assert len(client.requests) == len(faults)
+
+    caller.cancel()
+    await asyncio.wait({caller})
+
+    assert caller.cancelled()
+    assert client.open_streams == 0
+    assert asyncio.all_tasks() == {asyncio.current_task()}
@@ -0,0 +1,67 @@
+import asyncio
+import socket
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+from typing import Any
+
+import uvicorn
+
+from .fakes import create_fake_llm
+from src.llm_clients import LLMUnavailableError
+from src.llm_clients import OpenAIClient
+from src.llm_clients import TextChunkData
+from src.settings import LLMPoolConfig
+
+TEXT_TOKENS = 5
+STALL = 1
+
+
+@asynccontextmanager
+async def serve_fake_llm(stall_at: int) -> AsyncGenerator[str, Any]:
+    with socket.socket() as free_socket:
+        free_socket.bind(("127.0.0.1", 0))
+        port = free_socket.getsockname()[1]
+    app = create_fake_llm(text_tokens=TEXT_TOKENS, stall=STALL, stall_at=stall_at)
+    server = uvicorn.Server(uvicorn.Config(app, port=port, log_level="warning", timeout_graceful_shutdown=1))
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        await serve_task
+
+
+async def read(stall_at: int, first_byte_timeout: float, chunk_timeout: float) -> list[str]:
+    pool_config = LLMPoolConfig(first_byte_timeout=first_byte_timeout, chunk_timeout=chunk_timeout)
+    texts = []
+    async with serve_fake_llm(stall_at) as url:
+        client = OpenAIClient(api_key="test", base_url=url, pool_config=pool_config, response_cache=None)
+        try:
+            stream = await client.stream(model="fake", conversation=[dict(role="user", content="Hi")])
+            async for item in stream:
+                if isinstance(item, TextChunkData):
+                    texts.append(item.content)
+        except LLMUnavailableError as e:
+            texts.append(e.message)
+        finally:
+            await client.close()
+    return texts
+
+
+async def test_first_byte_timeout() -> None:
+    assert await read(stall_at=0, first_byte_timeout=0.2, chunk_timeout=5) == ["LLM request timed out"]
+
+
+async def test_first_byte_may_take_longer_than_later_chunks() -> None:
+    texts = await read(stall_at=0, first_byte_timeout=5, chunk_timeout=0.2)
+
+    assert texts == [f"token{index} " for index in range(TEXT_TOKENS)]
+
+
+async def test_chunk_timeout() -> None:
+    # The first chunk only opens the assistant message, two tokens arrive before the stall
+    texts = await read(stall_at=3, first_byte_timeout=5, chunk_timeout=0.2)
+
+    assert texts == ["token0 ", "token1 ", "LLM request timed out"]
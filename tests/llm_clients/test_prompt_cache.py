@@ -0,0 +1,112 @@
+import copy
+import json
+
+import pytest
+from openai.types import CompletionUsage
+
+from src.llm_clients.prompt_cache import PromptCachePlanner
+from src.llm_clients.prompt_cache import PromptCacheStats
+
+ANTHROPIC = "anthropic/claude-sonnet-4"
+TOOLS = [
+    dict(type="function", function=dict(name=name, description=name, parameters={})) for name in ["search", "fetch"]
+]
+CONVERSATION = [
+    dict(role="user", content="First question"),
+    dict(role="assistant", content="First answer"),
+    dict(role="user", content="Second question"),
+    dict(role="assistant", content=None, tool_calls=[dict(id="call_1", type="function", function={})]),
+    dict(role="tool", tool_call_id="call_1", content="Result"),
+]
+
+
+def is_marked(message: dict) -> bool:
+    return "cache_control" in json.dumps(message)
+
+
+def plan(max_breakpoints: int = 4, **request) -> tuple[list, list | None]:
+    request = dict(model=ANTHROPIC, conversation=CONVERSATION, system_prompt="System", tools=TOOLS) | request
+    return PromptCachePlanner(max_breakpoints).plan(**request)  # type: ignore
+
+
+def test_other_models_only_get_a_stable_tool_order() -> None:
+    messages, tools = plan(model="openai/gpt-4o")
+
+    assert [tool["function"]["name"] for tool in tools] == ["fetch", "search"]  # type: ignore
+    assert messages == [dict(role="system", content="System"), *CONVERSATION]
+    assert not any(map(is_marked, [*messages, *tools]))  # type: ignore
+
+
+def test_breakpoints_land_on_tools_system_and_the_current_turn() -> None:
+    original = copy.deepcopy(CONVERSATION)
+
+    messages, tools = plan()
+
+    assert [is_marked(tool) for tool in tools] == [False, True]  # type: ignore
+    # The system prompt, the start of the current turn and its latest message, tool calls have no content to mark
+    assert [is_marked(message) for message in messages] == [True, False, False, True, False, True]
+    assert messages[-1]["content"] == [dict(type="text", text="Result", cache_control=dict(type="ephemeral"))]
+    assert CONVERSATION == original
+
+
+@pytest.mark.parametrize(
+    "max_breakpoints, marked_messages",
+    [
+        (4, [True, False, False, True, False, True]),
+        (3, [True, False, False, False, False, True]),
+        (2, [True, False, False, False, False, False]),
+    ],
+)
+def test_breakpoints_never_exceed_the_limit(max_breakpoints: int, marked_messages: list[bool]) -> None:
+    messages, tools = plan(max_breakpoints)
+
+    assert [is_marked(message) for message in messages] == marked_messages
+    assert sum(map(is_marked, [*messages, *tools])) == max_breakpoints  # type: ignore
+
+
+def test_history_gets_the_breakpoints_without_tools_and_system() -> None:
+    messages, tools = plan(system_prompt=None, tools=None)
+
+    assert tools is None
+    assert [is_marked(message) for message in messages] == [False, False, True, False, True]
+
+
+def test_latest_message_without_content_marks_the_previous_one() -> None:
+    messages, _ = plan(conversation=CONVERSATION[:4], system_prompt=None, tools=None)
+
+    assert [is_marked(message) for message in messages] == [True, False, True, False]
+
+
+@pytest.mark.parametrize(
+    "usage, cache_tokens",
+    [
+        (dict(), (0, 0)),
+        (dict(prompt_tokens_details=dict(cached_tokens=800)), (800, 0)),
+        (dict(prompt_tokens_details=dict(cached_tokens=0), cache_creation_input_tokens=300), (0, 300)),
+        (dict(cache_write_tokens=200), (0, 200)),
+    ],
+)
+def test_cache_tokens_are_read_from_the_usage(usage: dict, cache_tokens: tuple[int, int]) -> None:
+    completion_usage = CompletionUsage.model_validate(
+        dict(prompt_tokens=1000, completion_tokens=10, total_tokens=1010) | usage
+    )
+
+    assert PromptCacheStats.get_cache_tokens(completion_usage) == cache_tokens
+
+
+def test_hit_rate_covers_every_recorded_request() -> None:
+    stats = PromptCacheStats()
+    stats.record("model", CompletionUsage(prompt_tokens=1000, completion_tokens=10, total_tokens=1010))
+    stats.record(
+        "model",
+        CompletionUsage.model_validate(
+            dict(
+                prompt_tokens=1000,
+                completion_tokens=10,
+                total_tokens=1010,
+                prompt_tokens_details=dict(cached_tokens=500),
+            )
+        ),
+    )
+
+    assert stats.hit_rate == 0.25
@@ -0,0 +1,27 @@
+from types import SimpleNamespace
+
+from src.llm_clients.token_counter import TokenCounter
+
+MESSAGES = [dict(role="user", content="How is the weather in Amsterdam today?")]
+
+
+def test_estimates_are_recounted_once_the_encoding_loads() -> None:
+    token_counter = TokenCounter()
+    estimated = token_counter.count_messages("message", MESSAGES)  # type: ignore
+
+    # Stands for tiktoken's encoding, one token per word
+    token_counter.encoding = SimpleNamespace(encode=lambda text, **_: text.split())  # type: ignore
+    counted = token_counter.count_messages("message", MESSAGES)  # type: ignore
+
+    assert estimated == [4 + 10]
+    assert counted == [4 + 7]
+    assert list(token_counter.entries) == ["message"]
+
+
+def test_calibration_moves_the_family_ratio_towards_real_usage() -> None:
+    token_counter = TokenCounter(calibration_weight=0.5)
+
+    token_counter.calibrate("openai/gpt-4o", tokens=100, prompt_tokens=150)
+
+    assert token_counter.ratios["openai"] == 1.25
+    assert token_counter.estimate("openai/gpt-4o-mini", 100) == 125
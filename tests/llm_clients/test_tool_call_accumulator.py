@@ -0,0 +1,115 @@
+from openai.types.chat import ChatCompletionChunk
+from openai.types.chat.chat_completion_chunk import ChoiceDeltaToolCall
+
+from src.llm_clients import OpenAIClient
+from src.llm_clients import TruncatedToolCallData
+from src.llm_clients.cache import ResponseCache
+from src.llm_clients.tool_call_accumulator import ToolCallAccumulator
+
+
+def create_piece(
+    index: int, tool_call_id: str | None = None, name: str | None = None, arguments: str | None = None
+) -> ChoiceDeltaToolCall:
+    return ChoiceDeltaToolCall.model_validate(
+        dict(index=index, id=tool_call_id, function=dict(name=name, arguments=arguments))
+    )
+
+
+def summarize(tool_calls: list) -> list[tuple[str, str, str]]:
+    return [(tool_call.id, tool_call.function.name, tool_call.function.arguments) for tool_call in tool_calls]
+
+
+def test_calls_are_handed_out_once_the_next_one_starts() -> None:
+    accumulator = ToolCallAccumulator()
+
+    _, completed = accumulator.add([create_piece(0, "call_1", "lookup", '{"text": "a"}')])
+    assert completed == []
+    _, completed = accumulator.add([create_piece(1, "call_2", "lookup", '{"text": ')])
+    assert summarize(completed) == [("call_1", "lookup", '{"text": "a"}')]
+    accumulator.add([create_piece(1, arguments='"b"}')])
+
+    tool_calls, truncated = accumulator.finish()
+    assert summarize(tool_calls) == [("call_2", "lookup", '{"text": "b"}')]
+    assert truncated == []
+
+
+def test_parallel_calls_keep_their_own_arguments() -> None:
+    accumulator = ToolCallAccumulator()
+    accumulator.add([create_piece(index, f"call_{index}", f"tool_{index}", "") for index in range(3)])
+    for index in range(3):
+        accumulator.add([create_piece(index, arguments=f'{{"value": {index}}}')])
+
+    tool_calls, _ = accumulator.finish()
+
+    assert summarize(tool_calls) == [(f"call_{index}", f"tool_{index}", f'{{"value": {index}}}') for index in range(3)]
+
+
+def test_out_of_order_indices_wait_for_the_stream_to_finish() -> None:
+    accumulator = ToolCallAccumulator()
+    accumulator.add([create_piece(1, "call_2", "second", '{"b": ')])
+    _, completed = accumulator.add([create_piece(0, "call_1", "first", '{"a": 1}')])
+    assert completed == []
+    _, completed = accumulator.add([create_piece(2, "call_3", "third", "{}"), create_piece(1, arguments="2}")])
+    # Once fragments interleave, nothing is handed out before the end
+    assert completed == []
+
+    tool_calls, _ = accumulator.finish()
+
+    assert summarize(tool_calls) == [
+        ("call_1", "first", '{"a": 1}'),
+        ("call_2", "second", '{"b": 2}'),
+        ("call_3", "third", "{}"),
+    ]
+
+
+def test_id_and_name_may_arrive_after_the_arguments() -> None:
+    accumulator = ToolCallAccumulator()
+    chunks, _ = accumulator.add([create_piece(0, arguments='{"text": ')])
+    accumulator.add([create_piece(0, tool_call_id="call_1", arguments='"hi"}')])
+    accumulator.add([create_piece(0, name="lookup")])
+
+    tool_calls, _ = accumulator.finish()
+
+    assert (chunks[0].tool_call_id, chunks[0].name) == (None, None)
+    assert summarize(tool_calls) == [("call_1", "lookup", '{"text": "hi"}')]
+
+
+def test_truncated_arguments_are_handed_out_separately() -> None:
+    accumulator = ToolCallAccumulator()
+    accumulator.add([create_piece(0, "call_1", "noop", ""), create_piece(1, "call_2", "lookup", '{"text": "a"}')])
+    accumulator.add([create_piece(2, "call_3", "lookup", '{"text": "cut o')])
+
+    tool_calls, truncated = accumulator.finish()
+
+    # Calls without arguments are complete, only the ones whose JSON is cut off can't be run
+    assert summarize(tool_calls) == [("call_1", "noop", ""), ("call_2", "lookup", '{"text": "a"}')]
+    assert summarize(truncated) == [("call_3", "lookup", "")]
+    assert accumulator.finish() == ([], [])
+
+
+def create_chunk(delta: dict, finish_reason: str | None = None) -> ChatCompletionChunk:
+    return ChatCompletionChunk.model_validate(
+        dict(
+            id="chunk",
+            object="chat.completion.chunk",
+            created=0,
+            model="model",
+            choices=[dict(index=0, delta=delta, finish_reason=finish_reason)],
+        )
+    )
+
+
+async def test_stream_cut_off_by_the_length_limit_yields_the_truncated_call() -> None:
+    chunks = [
+        create_chunk(dict(tool_calls=[dict(index=0, id="call_1", function=dict(name="lookup", arguments="{}"))])),
+        create_chunk(dict(tool_calls=[dict(index=1, id="call_2", function=dict(name="lookup", arguments='{"te'))])),
+        create_chunk(dict(), finish_reason="length"),
+    ]
+    client = OpenAIClient(api_key="test", response_cache=None)
+
+    items = [item async for item in client.formatted_stream_generator(ResponseCache.replay(chunks))]
+
+    tool_calls = [item for item in items if isinstance(item, list)]
+    truncated = [item.tool_call for item in items if isinstance(item, TruncatedToolCallData)]
+    assert [summarize(batch) for batch in tool_calls] == [[("call_1", "lookup", "{}")]]
+    assert summarize(truncated) == [("call_2", "lookup", "")]
@@ -0,0 +1,195 @@
+import asyncio
+import json
+from collections.abc import AsyncGenerator
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any
+from typing import Self
+
+from openai.types.chat import ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+
+from src.darp_servers.channel import ToolCallChannel
+from src.database import Message
+from src.database.id import generate_shortid
+from src.messages.repository import MessageRepository
+from src.messages.schemas import MessageCreate
+from src.messages.schemas import ToolCallData
+from src.messages.schemas import ToolCallDeltaData
+from src.messages.schemas import ToolCallResult
+from src.messages.service import MessageService
+from src.messages.types import MessageSource
+
+AGENT = SimpleNamespace(id="agent", provider="OpenRouter", model="model", system_prompt="You are a test agent")
+
+
+class FakeResult:
+    def __init__(self, rows: list) -> None:
+        self.rows = rows
+
+    def all(self) -> list:
+        return self.rows
+
+    def one(self) -> Any:
+        [row] = self.rows
+        return row
+
+    def scalar_one_or_none(self) -> Any:
+        return self.rows[0] if self.rows else None
+
+    def scalars(self) -> Self:
+        return self
+
+
+class FakeSession:
+    def __init__(self, *results: list) -> None:
+        # Rows returned by the following execute calls, in order
+        self.results = list(results)
+        self.statements: list = []
+        self.added: list = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = False
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+    def add(self, instance: Any) -> None:
+        self.added.append(instance)
+
+    def add_all(self, instances: list) -> None:
+        self.added += instances
+
+    async def flush(self) -> None:
+        pass
+
+    async def execute(self, statement: Any) -> FakeResult:
+        self.statements.append(statement)
+        return FakeResult(self.results.pop(0) if self.results else [])
+
+    async def commit(self) -> None:
+        self.commits += 1
+
+    async def rollback(self) -> None:
+        self.rollbacks += 1
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+class FakeRepository:
+    def __init__(self) -> None:
+        self.session = FakeSession()
+        self.messages: list[Message] = []
+
+    @staticmethod
+    def create_message(source: MessageSource, content: list[dict], **columns) -> Message:
+        return Message(
+            id=generate_shortid(),
+            chat_id="chat",
+            agent_id=AGENT.id,
+            model=AGENT.model,
+            source=source,
+            content=content,
+            user_id="user",
+            created_at=datetime.now(),
+            **columns,
+        )
+
+    async def create_llm_message(
+        self, model: str, creation_data: MessageCreate, tool_calls: list[ToolCallData], usage=None, **_
+    ) -> Message:
+        content = MessageRepository.format_llm_message(text=creation_data.data.text, tool_calls=tool_calls)
+        message = self.create_message(MessageSource.llm, [content], **(usage.model_dump() if usage else {}))
+        message.model = model
+        self.messages.append(message)
+        return message
+
+    async def create_tool_message(self, tool_call_id: str, tool_call_result: str, tool_call_logs: list, **_) -> Message:
+        content = MessageRepository.format_tool_message(
+            tool_call_id=tool_call_id, tool_call_result=tool_call_result, tool_call_logs=tool_call_logs
+        )
+        message = self.create_message(MessageSource.tool, [content])
+        self.messages.append(message)
+        return message
+
+
+class FakeToolManager:
+    tools = [dict(type="function", function=dict(name="lookup", description="Lookup", parameters={}))]
+    tools_json = json.dumps(tools)
+
+    def __init__(self, block: bool = False) -> None:
+        self.block = block
+        self.cancelled_tool_calls: list[str] = []
+
+    @staticmethod
+    def format_tool_call(tool_call: ChatCompletionMessageToolCall) -> ToolCallData:
+        return ToolCallData(
+            tool_call_id=tool_call.id, server_id=1, server_logo=None, tool_name="lookup", arguments=None
+        )
+
+    @staticmethod
+    def format_tool_call_delta(index: int, tool_call_id: str, name: str, arguments_delta: str) -> ToolCallDeltaData:
+        return ToolCallDeltaData(
+            tool_call_id=tool_call_id,
+            index=index,
+            server_logo=None,
+            server_id=1,
+            tool_name=name,
+            arguments_delta=arguments_delta,
+        )
+
+    @staticmethod
+    def rename_tool_calls(tool_calls: list[ToolCallData]) -> list[ToolCallData]:
+        return tool_calls
+
+    @staticmethod
+    async def reject_tool_call(tool_call: ChatCompletionMessageToolCall, channel: ToolCallChannel, error: str) -> None:
+        await channel.put(
+            ToolCallResult(tool_call_id=tool_call.id, server_id=1, tool_name="lookup", result=error, success=False)
+        )
+
+    async def handle_tool_call(self, tool_call: ChatCompletionMessageToolCall, channel: ToolCallChannel) -> None:
+        try:
+            if self.block:
+                await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            self.cancelled_tool_calls.append(tool_call.id)
+            raise
+        result = ToolCallResult(tool_call_id=tool_call.id, server_id=1, tool_name="lookup", result="ok", success=True)
+        await channel.put(result)
+
+
+class FakeDispatcher:
+    def __init__(self, *streams: list, served_model: str | None = None) -> None:
+        self.streams = list(streams)
+        # Stands for a fallback model answering instead of the requested one
+        self.served_model = served_model
+
+    async def stream(self, model: str, **_) -> tuple[str, AsyncGenerator[Any, Any]]:
+        return self.served_model or model, self.generate(self.streams.pop(0))
+
+    @staticmethod
+    async def generate(items: list) -> AsyncGenerator[Any, Any]:
+        for item in items:
+            if item is None:
+                # Stands for a provider that stopped sending in the middle of the stream
+                await asyncio.Event().wait()
+            yield item
+
+
+def create_tool_call(tool_call_id: str) -> ChatCompletionMessageToolCall:
+    return ChatCompletionMessageToolCall(
+        id=tool_call_id, type="function", function=Function(name="lookup", arguments="{}")
+    )
+
+
+def create_service(repo: FakeRepository) -> MessageService:
+    return MessageService(repo=repo, chat_repo=None, agent_repo=None, server_repo=None, registry_client=None)
+
+
+def create_user_message() -> Message:
+    return FakeRepository.create_message(MessageSource.user, [dict(role="user", content="Hi")])
@@ -0,0 +1,71 @@
+from datetime import datetime
+from datetime import timedelta
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Compiled
+
+import src.messages.compaction as compaction
+from .fakes import FakeDispatcher
+from .fakes import FakeRepository
+from .fakes import FakeSession
+from src.database import ChatSummary
+from src.database import Message
+from src.llm_clients import TextChunkData
+from src.messages.compaction import ContextCompactor
+from src.messages.repository import MessageRepository
+from src.messages.types import MessageSource
+
+STARTED_AT = datetime(2025, 1, 1)
+
+
+def create_history(turns: int) -> list[Message]:
+    # Every turn is a user message, an assistant tool call and its result
+    messages = []
+    for turn in range(turns):
+        for source in [MessageSource.user, MessageSource.llm, MessageSource.tool]:
+            content = [dict(role="user", content=f"Question {turn}")] if source == MessageSource.user else [{}]
+            message = FakeRepository.create_message(source, content)
+            message.created_at = STARTED_AT + timedelta(minutes=len(messages))
+            messages.append(message)
+    return messages
+
+
+@pytest.mark.parametrize("turns, compacted_turns", [(3, 0), (4, 2), (6, 4)])
+def test_compaction_keeps_the_latest_turns_whole(turns: int, compacted_turns: int) -> None:
+    compactor = ContextCompactor(keep_turns=2, batch_turns=2)
+    messages = create_history(turns)
+
+    assert compactor.get_messages_to_compact(messages) == messages[: compacted_turns * 3]
+
+
+def compile_upsert(session: FakeSession) -> Compiled:
+    # The summary upsert is the last statement of a compaction
+    return session.statements[-1].compile(dialect=postgresql.dialect())
+
+
+async def test_summary_upsert_never_moves_covered_until_back() -> None:
+    session = FakeSession()
+
+    await MessageRepository(session).upsert_chat_summary(  # type: ignore
+        chat_id="chat", text="Summary", model="model", covered_until=STARTED_AT
+    )
+
+    assert "WHERE chat_summaries.covered_until < excluded.covered_until" in str(compile_upsert(session))
+
+
+@pytest.mark.parametrize("has_summary", [False, True])
+async def test_compact_summarizes_the_cut_and_stores_where_it_ends(
+    monkeypatch: pytest.MonkeyPatch, has_summary: bool
+) -> None:
+    messages = create_history(5)
+    summary = ChatSummary(chat_id="chat", text="Earlier", model="model", covered_until=STARTED_AT)
+    session = FakeSession([summary] if has_summary else [], messages)
+    monkeypatch.setattr(compaction, "session_maker", lambda: session)
+    monkeypatch.setattr(compaction, "llm_dispatcher", FakeDispatcher([TextChunkData(content="Summary")]))
+
+    await ContextCompactor(keep_turns=2, batch_turns=2).compact("chat")
+
+    params = compile_upsert(session).params
+    assert (params["text"], params["covered_until"]) == ("Summary", messages[8].created_at)
+    assert session.commits == 1
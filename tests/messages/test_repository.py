@@ -0,0 +1,165 @@
+import json
+import zlib
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from .fakes import AGENT
+from .fakes import FakeSession
+from src.database import Message
+from src.database import MessagePayload
+from src.llm_clients import UsageData
+from src.messages.repository import MessageRepository
+from src.messages.schemas import GenericLogData
+from src.messages.schemas import MessageCreate
+from src.messages.schemas import MessageCreateData
+from src.messages.schemas import UsageRollup
+from src.messages.types import MessageSource
+from src.settings import settings
+
+INLINE_LIMIT = 100
+
+
+@pytest.fixture(autouse=True)
+def inline_limit(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "MESSAGE_PAYLOAD_INLINE_LIMIT", INLINE_LIMIT)
+
+
+async def create_tool_message(session: FakeSession, result: str, logs: list[GenericLogData]) -> Message:
+    return await MessageRepository(session).create_tool_message(  # type: ignore
+        chat_id="chat",
+        agent=AGENT,  # type: ignore
+        tool_call_id="call_1",
+        tool_call_result=result,
+        current_user_id="user",
+        tool_call_logs=logs,
+    )
+
+
+async def test_small_tool_messages_stay_inline() -> None:
+    session = FakeSession()
+
+    message = await create_tool_message(session, json.dumps("ok"), [GenericLogData(data="log")])
+
+    assert session.added == [message]
+    assert "content" in message.content[0] and "tool_call_logs" in message.content[0]
+
+
+async def test_large_tool_payloads_are_compressed_out_of_the_message() -> None:
+    session = FakeSession()
+    logs = [GenericLogData(data="log" * INLINE_LIMIT)]
+    result = json.dumps("result" * INLINE_LIMIT)
+
+    message = await create_tool_message(session, result, logs)
+
+    stored_message, *payloads = session.added
+    assert stored_message is message
+    # The caller gets the full content back, the compressed copies are only stored
+    assert message.content[0]["content"] == result
+    assert message.content[0]["tool_call_logs"] == [log.model_dump() for log in logs]
+    content_payload, logs_payload = payloads
+    assert (content_payload.message_id, logs_payload.message_id) == (message.id, message.id)
+    assert json.loads(zlib.decompress(content_payload.data)) == result
+    assert json.loads(zlib.decompress(logs_payload.data)) == [log.model_dump() for log in logs]
+
+
+def compact(content: dict) -> tuple[Message, list[MessagePayload]]:
+    payloads: list[MessagePayload] = []
+    stored_content = MessageRepository.compact_content(content, "message", payloads)
+    message = Message(id="message", source=MessageSource.tool, content=[stored_content])
+    return message, payloads
+
+
+def get_payload_rows(payloads: list[MessagePayload]) -> list[SimpleNamespace]:
+    return [SimpleNamespace(id=payload.id, data=payload.data) for payload in payloads]
+
+
+async def test_expand_messages_restores_the_offloaded_content() -> None:
+    content = MessageRepository.format_tool_message(
+        tool_call_id="call_1",
+        tool_call_result=json.dumps("result" * INLINE_LIMIT),
+        tool_call_logs=[GenericLogData(data="log" * INLINE_LIMIT)],
+    )
+    message, payloads = compact(content)
+    assert set(message.content[0]) == {"tool_call_id", "role", "content_ref", "tool_call_logs_ref"}
+
+    await MessageRepository(FakeSession(get_payload_rows(payloads))).expand_messages([message])  # type: ignore
+
+    assert message.content == [content]
+
+
+async def test_expand_messages_only_loads_the_requested_fields() -> None:
+    content = MessageRepository.format_tool_message(
+        tool_call_id="call_1",
+        tool_call_result=json.dumps("result" * INLINE_LIMIT),
+        tool_call_logs=[GenericLogData(data="log" * INLINE_LIMIT)],
+    )
+    message, payloads = compact(content)
+    session = FakeSession(get_payload_rows(payloads[:1]))
+
+    await MessageRepository(session).expand_messages([message], fields=("content",))  # type: ignore
+
+    assert message.content[0]["content"] == content["content"]
+    assert message.content[0]["tool_call_logs_ref"] == payloads[1].id
+
+
+async def test_expand_messages_skips_the_query_without_offloaded_content() -> None:
+    session = FakeSession()
+    message = Message(id="message", source=MessageSource.user, content=[dict(role="user", content="Hi")])
+
+    await MessageRepository(session).expand_messages([message])  # type: ignore
+
+    assert session.statements == []
+
+
+async def test_llm_messages_store_usage_and_latency() -> None:
+    session = FakeSession()
+    usage = UsageData(prompt_tokens=100, completion_tokens=20, cache_read_tokens=80, cache_write_tokens=0)
+
+    message = await MessageRepository(session).create_llm_message(  # type: ignore
+        chat_id="chat",
+        agent=AGENT,  # type: ignore
+        model="fallback",
+        tool_calls=[],
+        creation_data=MessageCreate(current_user_id="user", data=MessageCreateData(text="Hi")),
+        usage=usage,
+        ttft_ms=300,
+        latency_ms=1200,
+    )
+
+    assert session.added == [message]
+    assert message.model == "fallback"
+    assert (message.prompt_tokens, message.completion_tokens) == (100, 20)
+    assert (message.cache_read_tokens, message.cache_write_tokens) == (80, 0)
+    assert (message.ttft_ms, message.latency_ms) == (300, 1200)
+
+
+@pytest.mark.parametrize(
+    "filters, expected_params",
+    [
+        (dict(), dict(user_id_1="user", source_1=MessageSource.llm)),
+        (dict(chat_id="chat"), dict(user_id_1="user", source_1=MessageSource.llm, chat_id_1="chat")),
+        (dict(agent_id="agent"), dict(user_id_1="user", source_1=MessageSource.llm, agent_id_1="agent")),
+    ],
+)
+async def test_get_usage_rolls_up_the_users_llm_messages(filters: dict, expected_params: dict) -> None:
+    row = dict(
+        llm_messages=2,
+        prompt_tokens=300,
+        completion_tokens=50,
+        cache_read_tokens=200,
+        cache_write_tokens=100,
+        avg_ttft_ms=250.0,
+        avg_latency_ms=None,
+    )
+    session = FakeSession([SimpleNamespace(_mapping=row)])
+
+    rollup = await MessageRepository(session).get_usage(user_id="user", **filters)  # type: ignore
+
+    assert rollup == UsageRollup(**row)
+    compiled = session.statements[0].compile(dialect=postgresql.dialect())
+    filter_params = {name: value for name, value in compiled.params.items() if not name.startswith("coalesce")}
+    assert filter_params == expected_params
+    # Messages without usage count as zero tokens instead of making the sums null
+    assert str(compiled).count("coalesce(sum(") == 4
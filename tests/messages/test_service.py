@@ -0,0 +1,324 @@
+import asyncio
+import json
+from collections.abc import Callable
+from contextlib import aclosing
+
+import pytest
+
+import src.messages.service as message_service
+from .fakes import AGENT
+from .fakes import create_service
+from .fakes import create_tool_call
+from .fakes import create_user_message
+from .fakes import FakeDispatcher
+from .fakes import FakeRepository
+from .fakes import FakeToolManager
+from src.chats.types import RoutingMode
+from src.errors import InvalidData
+from src.errors import RemoteServerError
+from src.llm_clients import TextChunkData
+from src.llm_clients import ToolCallChunkData
+from src.llm_clients import TruncatedToolCallData
+from src.llm_clients import UsageData
+from src.llm_clients.token_counter import token_counter
+from src.messages.schemas import MessageCreate
+from src.messages.schemas import MessageCreateData
+from src.messages.service import AgentLoopState
+from src.messages.service import MessageService
+from src.messages.types import EventType
+from src.messages.types import MessageSource
+from src.settings import settings
+from src.types import LocalRoutingMode
+
+
+@pytest.fixture(autouse=True)
+def early_tool_calls(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "TOOL_CALL_EARLY_START", True)
+
+
+async def cancel_consumer_after(
+    repo: FakeRepository, tool_manager: FakeToolManager, event_type: EventType, source: MessageSource | None = None
+) -> list[dict]:
+    events: list[dict] = []
+    reached = asyncio.Event()
+
+    async def consume() -> None:
+        stream = create_service(repo).run_turn(
+            agent=AGENT,
+            chat_id="chat",
+            current_user_id="user",
+            previous_messages=[create_user_message()],
+            tool_manager=tool_manager,
+        )
+        async with aclosing(stream):
+            async for event in stream:
+                events.append(json.loads(event))
+                if events[-1]["event_type"] == event_type and (
+                    source is None or events[-1]["data"]["source"] == source
+                ):
+                    reached.set()
+
+    consumer = asyncio.create_task(consume())
+    await asyncio.wait_for(reached.wait(), timeout=1)
+    consumer.cancel()
+    await asyncio.wait({consumer})
+    assert consumer.cancelled()
+    # Tool call tasks started by the turn never outlive it
+    assert asyncio.all_tasks() == {asyncio.current_task()}
+    return events
+
+
+async def test_disconnect_while_llm_streams_keeps_the_text(monkeypatch: pytest.MonkeyPatch) -> None:
+    dispatcher = FakeDispatcher([TextChunkData(content="Let me "), [create_tool_call("call_1")], None])
+    monkeypatch.setattr(message_service, "llm_dispatcher", dispatcher)
+    repo = FakeRepository()
+    tool_manager = FakeToolManager(block=True)
+
+    await cancel_consumer_after(repo, tool_manager, EventType.tool_call)
+
+    assert tool_manager.cancelled_tool_calls == ["call_1"]
+    # The tool call is dropped, it would never get a result
+    [message] = repo.messages
+    assert message.source == MessageSource.llm
+    assert message.content == [dict(role="assistant", content="Let me ", tool_calls=None)]
+    assert repo.session.commits
+
+
+async def test_disconnect_while_tools_run_answers_every_tool_call(monkeypatch: pytest.MonkeyPatch) -> None:
+    tool_calls = [create_tool_call("call_1"), create_tool_call("call_2")]
+    monkeypatch.setattr(message_service, "llm_dispatcher", FakeDispatcher([TextChunkData(content="Hi"), tool_calls]))
+    repo = FakeRepository()
+    tool_manager = FakeToolManager(block=True)
+
+    await cancel_consumer_after(repo, tool_manager, EventType.message_creation, source=MessageSource.llm)
+
+    assert sorted(tool_manager.cancelled_tool_calls) == ["call_1", "call_2"]
+    llm_message, *tool_messages = repo.messages
+    assert [tool_call["id"] for tool_call in llm_message.content[0]["tool_calls"]] == ["call_1", "call_2"]
+    assert [message.content[0]["tool_call_id"] for message in tool_messages] == ["call_1", "call_2"]
+    assert all(
+        message.content[0]["content"] == json.dumps("Error: Tool call was cancelled") for message in tool_messages
+    )
+
+
+def create_loop_state(conversation_tokens: list[int]) -> AgentLoopState:
+    conversation = [dict(role="user" if index % 2 == 0 else "assistant") for index in range(len(conversation_tokens))]
+    return AgentLoopState(
+        agent=AGENT,  # type: ignore
+        chat_id="chat",
+        current_user_id="user",
+        tool_manager=FakeToolManager(),  # type: ignore
+        system_prompt="",
+        conversation=conversation,  # type: ignore
+        conversation_tokens=conversation_tokens,
+    )
+
+
+@pytest.mark.parametrize(
+    "conversation_tokens, expected_max_tokens, kept_entries",
+    [
+        # Room for the whole output limit, the provider default is kept
+        ([1000, 1000], None, 2),
+        # Less than the output limit is left, the request is capped to what fits
+        ([4000, 1000], 5000, 2),
+        # Not even the minimum output fits, the oldest turn is dropped
+        ([4000, 4000, 1000, 500], None, 2),
+    ],
+)
+def test_fit_context(
+    monkeypatch: pytest.MonkeyPatch,
+    conversation_tokens: list[int],
+    expected_max_tokens: int | None,
+    kept_entries: int,
+) -> None:
+    monkeypatch.setattr(settings, "LLM_DEFAULT_CONTEXT_LIMIT", 10000)
+    monkeypatch.setattr(settings, "LLM_CONTEXT_SAFETY_MARGIN", 0)
+    monkeypatch.setattr(settings, "LLM_DEFAULT_MAX_OUTPUT_TOKENS", 8000)
+    monkeypatch.setattr(settings, "LLM_MIN_OUTPUT_TOKENS", 1000)
+    state = create_loop_state(conversation_tokens)
+
+    _, max_tokens = MessageService.fit_context(state)
+
+    assert max_tokens == expected_max_tokens
+    assert len(state.conversation) == len(state.conversation_tokens) == kept_entries
+
+
+def test_fit_context_rejects_a_turn_longer_than_the_window(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "LLM_DEFAULT_CONTEXT_LIMIT", 10000)
+
+    with pytest.raises(InvalidData):
+        MessageService.fit_context(create_loop_state([5000, 5000]))
+
+
+async def test_tool_call_deltas_wait_for_the_id_and_name(monkeypatch: pytest.MonkeyPatch) -> None:
+    fragments = [
+        ToolCallChunkData(index=0, tool_call_id="call_1", name=None, arguments=""),
+        ToolCallChunkData(index=0, tool_call_id=None, name=None, arguments='{"te'),
+        ToolCallChunkData(index=0, tool_call_id=None, name="lookup", arguments='xt": '),
+        ToolCallChunkData(index=0, tool_call_id=None, name=None, arguments=""),
+        ToolCallChunkData(index=0, tool_call_id=None, name=None, arguments='"hi"}'),
+        ToolCallChunkData(index=1, tool_call_id="call_2", name="lookup", arguments=""),
+    ]
+    monkeypatch.setattr(message_service, "llm_dispatcher", FakeDispatcher(fragments))
+    service = create_service(FakeRepository())
+
+    events = [
+        json.loads(event)
+        async for event in service.run_turn(
+            agent=AGENT,  # type: ignore
+            chat_id="chat",
+            current_user_id="user",
+            previous_messages=[create_user_message()],
+            tool_manager=FakeToolManager(),  # type: ignore
+        )
+    ]
+
+    deltas = [event["data"] for event in events if event["event_type"] == EventType.tool_call_delta]
+    assert [(delta["tool_call_id"], delta["arguments_delta"]) for delta in deltas] == [
+        ("call_1", '{"text": '),
+        ("call_1", '"hi"}'),
+        ("call_2", ""),
+    ]
+
+
+class FakeRegistryClient:
+    def __init__(self, available: bool) -> None:
+        self.available = available
+        self.routing_modes: list[RoutingMode] = []
+
+    async def get_fitting_servers(self, query: str, routing_mode: RoutingMode) -> list[str]:
+        self.routing_modes.append(routing_mode)
+        if not self.available:
+            raise RemoteServerError()
+        return ["registry"]
+
+
+class FakeLocalRouter:
+    @staticmethod
+    async def get_fitting_servers(query: str) -> list[str]:
+        return ["local"]
+
+
+@pytest.mark.parametrize(
+    "local_routing_mode, routing_mode, registry_available, expected_servers",
+    [
+        (LocalRoutingMode.primary, RoutingMode.auto, True, ["local"]),
+        (LocalRoutingMode.fallback, RoutingMode.auto, False, ["local"]),
+        # The local index has no deep research, those requests always go to the registry
+        (LocalRoutingMode.primary, RoutingMode.deepresearch, True, ["registry"]),
+        (LocalRoutingMode.fallback, RoutingMode.deepresearch, False, None),
+    ],
+)
+async def test_local_routing_only_handles_the_modes_it_supports(
+    monkeypatch: pytest.MonkeyPatch,
+    local_routing_mode: LocalRoutingMode,
+    routing_mode: RoutingMode,
+    registry_available: bool,
+    expected_servers: list[str] | None,
+) -> None:
+    monkeypatch.setattr(settings, "LOCAL_ROUTING_MODE", local_routing_mode)
+    monkeypatch.setattr(message_service, "local_router", FakeLocalRouter())
+    registry_client = FakeRegistryClient(available=registry_available)
+    service = MessageService(
+        repo=None, chat_repo=None, agent_repo=None, server_repo=None, registry_client=registry_client  # type: ignore
+    )
+
+    if expected_servers is None:
+        with pytest.raises(RemoteServerError):
+            await service.get_fitting_servers(query="weather", routing_mode=routing_mode)
+        return
+    assert await service.get_fitting_servers(query="weather", routing_mode=routing_mode) == expected_servers
+
+
+async def test_truncated_tool_call_is_answered_with_an_error(monkeypatch: pytest.MonkeyPatch) -> None:
+    truncated_tool_call = TruncatedToolCallData(tool_call=create_tool_call("call_2"))
+    dispatcher = FakeDispatcher([[create_tool_call("call_1")], truncated_tool_call], [TextChunkData(content="Done")])
+    monkeypatch.setattr(message_service, "llm_dispatcher", dispatcher)
+    repo = FakeRepository()
+
+    async for _ in create_service(repo).run_turn(
+        agent=AGENT,  # type: ignore
+        chat_id="chat",
+        current_user_id="user",
+        previous_messages=[create_user_message()],
+        tool_manager=FakeToolManager(),  # type: ignore
+    ):
+        pass
+
+    llm_message, *tool_messages, answer = repo.messages
+    assert [tool_call["id"] for tool_call in llm_message.content[0]["tool_calls"]] == ["call_1", "call_2"]
+    assert [message.content[0]["content"] for message in tool_messages] == [
+        json.dumps("ok"),
+        json.dumps("Error: Tool call arguments were cut off"),
+    ]
+    assert answer.content[0]["content"] == "Done"
+
+
+async def test_fallback_model_is_stored_and_calibrated(monkeypatch: pytest.MonkeyPatch) -> None:
+    usage = UsageData(prompt_tokens=1000, completion_tokens=10, cache_read_tokens=0, cache_write_tokens=0)
+    dispatcher = FakeDispatcher([TextChunkData(content="Hi"), usage], served_model="fallback/model")
+    monkeypatch.setattr(message_service, "llm_dispatcher", dispatcher)
+    monkeypatch.setattr(token_counter, "ratios", {})
+    repo = FakeRepository()
+
+    async for _ in create_service(repo).run_turn(
+        agent=AGENT,  # type: ignore
+        chat_id="chat",
+        current_user_id="user",
+        previous_messages=[create_user_message()],
+        tool_manager=FakeToolManager(),  # type: ignore
+    ):
+        pass
+
+    [message] = repo.messages
+    assert message.model == "fallback/model"
+    assert list(token_counter.ratios) == ["fallback"]
+
+
+async def start_turn_with_blocked_history(
+    monkeypatch: pytest.MonkeyPatch, get_fitting_servers: Callable
+) -> asyncio.Task:
+    history_started = asyncio.Event()
+    service = create_service(FakeRepository())
+
+    async def get_chat_summary(chat_id: str) -> None:
+        history_started.set()
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(service, "get_chat_summary", get_chat_summary)
+    monkeypatch.setattr(service, "get_fitting_servers", get_fitting_servers)
+    creation_data = MessageCreate(
+        current_user_id="user", data=MessageCreateData(text="Weather"), routing_mode=RoutingMode.auto
+    )
+    turn_start = asyncio.create_task(service.start_turn(chat_id="chat", creation_data=creation_data, agent=AGENT))
+    await asyncio.wait_for(history_started.wait(), timeout=1)
+    return turn_start
+
+
+async def test_failed_routing_stops_the_history_queries(monkeypatch: pytest.MonkeyPatch) -> None:
+    routing_failed = asyncio.Event()
+
+    async def get_fitting_servers(**_) -> None:
+        await routing_failed.wait()
+        raise RemoteServerError()
+
+    turn_start = await start_turn_with_blocked_history(monkeypatch, get_fitting_servers)
+    routing_failed.set()
+
+    with pytest.raises(RemoteServerError):
+        await turn_start
+    assert asyncio.all_tasks() == {asyncio.current_task()}
+
+
+async def test_cancelled_turn_start_stops_the_history_queries(monkeypatch: pytest.MonkeyPatch) -> None:
+    async def get_fitting_servers(**_) -> list:
+        return []
+
+    turn_start = await start_turn_with_blocked_history(monkeypatch, get_fitting_servers)
+    await asyncio.sleep(0)
+
+    turn_start.cancel()
+    await asyncio.wait({turn_start})
+
+    assert turn_start.cancelled()
+    assert asyncio.all_tasks() == {asyncio.current_task()}
@@ -0,0 +1,221 @@
+import asyncio
+import json
+from collections.abc import AsyncGenerator
+from collections.abc import Callable
+from typing import Any
+
+import pytest
+
+import src.messages.turns as turns
+from .fakes import FakeSession
+from src.errors import OverloadedError
+from src.llm_clients import AdmissionController
+from src.messages.service import MessageService
+from src.messages.turns import Turn
+from src.messages.turns import TurnRunner
+from src.messages.types import EventType
+from src.messages.types import TurnStatus
+from src.settings import settings
+
+
+async def publish(turn: Turn, count: int) -> None:
+    for index in range(count):
+        await turn.publish(f"event {index}")
+
+
+async def read(turn: Turn, last_event_id: int | None = None) -> list[tuple[str | None, str]]:
+    return [(event.id, event.data) async for event in turn.subscribe(last_event_id=last_event_id)]
+
+
+async def test_replays_the_events_after_the_last_event_id() -> None:
+    turn = Turn(chat_id="chat", user_id="user")
+    await publish(turn, 4)
+    await turn.finish()
+
+    assert await read(turn, last_event_id=1) == [("2", "event 2"), ("3", "event 3")]
+    assert await read(turn) == [(str(index), f"event {index}") for index in range(4)]
+
+
+async def test_live_events_fan_out_to_every_subscriber() -> None:
+    turn = Turn(chat_id="chat", user_id="user")
+    subscribers = [asyncio.create_task(read(turn)) for _ in range(3)]
+    await asyncio.sleep(0)
+
+    await publish(turn, 3)
+    await turn.finish()
+
+    expected = [(str(index), f"event {index}") for index in range(3)]
+    assert [await subscriber for subscriber in subscribers] == [expected] * 3
+
+
+async def test_subscriber_behind_the_buffer_gets_an_error() -> None:
+    turn = Turn(chat_id="chat", user_id="user", buffer_size=2)
+    await publish(turn, 5)
+    await turn.finish()
+
+    [(event_id, data)] = await read(turn, last_event_id=0)
+
+    # No id, a reconnect resumes from the last event the client actually got
+    assert event_id is None
+    assert json.loads(data)["event_type"] == EventType.error
+    assert json.loads(data)["data"]["status_code"] == 410
+
+
+async def wait_forever() -> None:
+    await asyncio.Event().wait()
+
+
+@pytest.fixture
+def short_abandon_timeout(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "TURN_ABANDON_TIMEOUT", 0.05)
+
+
+async def disconnect(turn: Turn) -> None:
+    subscription = turn.subscribe()
+    await publish(turn, 1)
+    await anext(subscription)
+    await subscription.aclose()
+
+
+async def test_turn_without_subscribers_is_cancelled_after_the_timeout(short_abandon_timeout: None) -> None:
+    turn = Turn(chat_id="chat", user_id="user")
+    turn.task = asyncio.create_task(wait_forever())
+
+    await disconnect(turn)
+    await asyncio.wait({turn.task}, timeout=1)
+
+    assert turn.task.cancelled()
+
+
+async def test_reconnecting_keeps_the_turn_running(short_abandon_timeout: None) -> None:
+    turn = Turn(chat_id="chat", user_id="user")
+    turn.task = asyncio.create_task(wait_forever())
+
+    await disconnect(turn)
+    subscription = turn.subscribe(last_event_id=0)
+    await publish(turn, 1)
+    await anext(subscription)
+    await asyncio.sleep(0.1)
+
+    assert not turn.task.done()
+    turn.task.cancel()
+    await subscription.aclose()
+
+
+class FakeJobRepository:
+    jobs: list[tuple[str, TurnStatus]] = []
+
+    def __init__(self, session: FakeSession) -> None:
+        self.session = session
+
+    async def upsert_turn_job(self, turn_id: str, status: TurnStatus, **_) -> None:
+        self.jobs.append((turn_id, status))
+
+
+@pytest.fixture
+def admission_controller(monkeypatch: pytest.MonkeyPatch) -> AdmissionController:
+    admission_controller = AdmissionController(max_concurrency=10)
+    monkeypatch.setattr(turns, "admission_controller", admission_controller)
+    monkeypatch.setattr(turns, "session_maker", FakeSession)
+    monkeypatch.setattr(turns, "MessageRepository", FakeJobRepository)
+    monkeypatch.setattr(FakeJobRepository, "jobs", [])
+    monkeypatch.setattr(TurnRunner, "create_service", staticmethod(lambda session: None))
+    return admission_controller
+
+
+async def stream_events(_: MessageService) -> AsyncGenerator[str, Any]:
+    yield "event"
+
+
+async def stream_forever(_: MessageService) -> AsyncGenerator[str, Any]:
+    yield "event"
+    await asyncio.Event().wait()
+
+
+def fail_to_start(_: MessageService) -> AsyncGenerator[str, Any]:
+    raise RuntimeError("Agent is gone")
+
+
+async def run(runner: TurnRunner, admission_controller: AdmissionController, create_stream: Callable) -> Turn:
+    runner.reserve()
+    await admission_controller.acquire("user")
+    turn = Turn(chat_id="chat", user_id="user")
+    turn.task = runner.submit(turn, create_stream)
+    await asyncio.wait({turn.task})
+    return turn
+
+
+def test_reservations_count_towards_the_turn_limit() -> None:
+    runner = TurnRunner(max_concurrent_turns=2)
+    runner.reserve()
+    runner.reserve()
+
+    with pytest.raises(OverloadedError):
+        runner.reserve()
+    runner.release_reservation()
+    runner.reserve()
+
+
+@pytest.mark.parametrize(
+    "create_stream, expected_status",
+    [(stream_events, TurnStatus.finished), (fail_to_start, TurnStatus.failed)],
+)
+async def test_execute_records_the_job_and_releases_the_permit(
+    admission_controller: AdmissionController, create_stream: Callable, expected_status: TurnStatus
+) -> None:
+    runner = TurnRunner(record_jobs=True)
+
+    turn = await run(runner, admission_controller, create_stream)
+
+    assert FakeJobRepository.jobs == [(turn.id, TurnStatus.running), (turn.id, expected_status)]
+    assert turn.finished
+    assert admission_controller.active == 0
+    assert runner.reserved == 0
+    assert not runner.tasks
+
+
+async def test_turn_cancelled_right_after_submit_releases_the_permit(
+    admission_controller: AdmissionController,
+) -> None:
+    runner = TurnRunner(record_jobs=True)
+    runner.reserve()
+    await admission_controller.acquire("user")
+    turn = Turn(chat_id="chat", user_id="user")
+    turn.task = runner.submit(turn, stream_forever)
+
+    turn.task.cancel()
+    await asyncio.wait({turn.task})
+
+    assert turn.finished
+    assert admission_controller.active == 0
+    assert FakeJobRepository.jobs == [(turn.id, TurnStatus.running), (turn.id, TurnStatus.cancelled)]
+
+
+async def test_drain_interrupts_turns_that_outlive_the_timeout(admission_controller: AdmissionController) -> None:
+    runner = TurnRunner(drain_timeout=0.05, record_jobs=True)
+    runner.reserve()
+    await admission_controller.acquire("user")
+    turn = Turn(chat_id="chat", user_id="user")
+    turn.task = runner.submit(turn, stream_forever)
+    await asyncio.sleep(0)
+
+    await runner.drain()
+
+    assert turn.task.cancelled()
+    assert FakeJobRepository.jobs == [(turn.id, TurnStatus.running), (turn.id, TurnStatus.interrupted)]
+    assert admission_controller.active == 0
+    with pytest.raises(OverloadedError):
+        runner.reserve()
+
+
+async def test_drain_lets_running_turns_finish(admission_controller: AdmissionController) -> None:
+    runner = TurnRunner(drain_timeout=1)
+    runner.reserve()
+    await admission_controller.acquire("user")
+    turn = Turn(chat_id="chat", user_id="user")
+    turn.task = runner.submit(turn, stream_events)
+
+    await runner.drain()
+
+    assert turn.task.done() and not turn.task.cancelled()
+    assert [data async for data in turn.subscribe(last_event_id=0)] and turn.finished